@@ -0,0 +1,111 @@
+"""
+Content-addressed cache for dream analyses.
+
+Analyses are keyed on a hash of the normalized dream text together with the
+analyzer version, which covers the lexicons, so editing `dream_themes` or
+`emotion_keywords` can never serve a stale result. Entries live in an
+in-memory LRU tier and, optionally, in a persistent SQLite tier that survives
+restarts and is shared between processes. The persistent tier stores
+compressed JSON, keeps at most `max_rows` rows (the oldest are dropped first)
+and can be purged of rows from other analyzer versions.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import repository
+
+# Rows kept in the persistent tier by default
+PERSISTENT_MAX_ROWS = 100000
+
+class AnalysisCache:
+    def __init__(self, maxsize=1024, path=None, max_rows=PERSISTENT_MAX_ROWS):
+        """Create a cache holding up to `maxsize` analyses in memory
+
+        If `path` is given it must be a Dream Journal database; up to
+        `max_rows` analyses are also stored in its analysis_cache table.
+        """
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self._pool = repository.get_pool(path) if path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(version, text):
+        """Cache key for a dream text analyzed by a given analyzer version"""
+        normalized = re.sub(r'\s+', ' ', text).strip()
+        return hashlib.sha256(f'{version}\0{normalized}'.encode()).hexdigest()
+
+    def get(self, key):
+        """Return a cached analysis, or None"""
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(encoded)
+
+        if self._pool is not None:
+            with self._pool.connection() as db:
+                compressed = repository.get_cached_analysis(db, key)
+            if compressed is not None:
+                encoded = zlib.decompress(compressed).decode()
+                with self._lock:
+                    self.persistent_hits += 1
+                    self._remember(key, encoded)
+                return json.loads(encoded)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, analysis, version=''):
+        """Store an analysis made by analyzer `version` in every tier"""
+        encoded = json.dumps(analysis)
+        with self._lock:
+            self._remember(key, encoded)
+
+        if self._pool is not None:
+            with self._pool.connection() as db:
+                repository.put_cached_analysis(db, key, zlib.compress(encoded.encode()), version, self.max_rows)
+
+    def purge(self, version):
+        """Delete persistent entries made by any other analyzer version, returning how many"""
+        if self._pool is None:
+            return 0
+        with self._pool.connection() as db:
+            return repository.purge_cached_analyses(db, version)
+
+    def _remember(self, key, encoded):
+        self._entries[key] = encoded
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop the in-memory tier"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'persistent_hits': self.persistent_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
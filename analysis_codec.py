@@ -0,0 +1,119 @@
+"""
+Compact binary encoding of stored dream analyses.
+
+An analysis is packed into a fixed little-endian header followed by the
+emotion and theme counts, with labels replaced by integer ids from the
+analysis_labels table:
+
+    B    format version (1)
+    h    compound sentiment x 10000
+    3H   neg, neu, pos sentiment x 1000
+    3I   word_count, unique_words, sentence_count
+    d    avg_sentence_length
+    q    analyzed_at, microseconds since 1970-01-01 (as recorded, no time zone)
+    2H   number of emotions, number of themes
+    2I   (label id, count) per emotion, then per theme, most frequent first
+
+Any other keys follow as a JSON object. The interpretation and narrative
+flow are not stored: they only depend on the fields above and are
+regenerated when decoding. VADER rounds its scores to 3 and 4 decimals, so
+the scaled integers are exact.
+"""
+
+import json
+import struct
+from datetime import datetime, timedelta
+
+from dream_analyzer import generate_interpretation, narrative_flow
+
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<Bh3H3Idq2H')
+LABEL = struct.Struct('<2I')
+
+# Keys encoded in the header or regenerated; 'features' is stored separately
+KNOWN_KEYS = {'sentiment', 'emotions', 'themes', 'interpretation', 'structure',
+              'word_count', 'unique_words', 'analyzed_at', 'features'}
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+def labels(analysis):
+    """The (kind, name) pairs an analysis needs label ids for"""
+    return ([('emotion', name) for name in analysis['emotions']] +
+            [('theme', name) for name in analysis['themes']])
+
+def encode(analysis, label_ids):
+    """Pack an analysis dict, using `label_ids` to map (kind, name) to an id
+    
+    Raises KeyError or ValueError if the analysis lacks a field of the fixed
+    layout; callers keep such analyses as JSON.
+    """
+    sentiment = analysis['sentiment']
+    structure = analysis['structure']
+    emotions = analysis['emotions']
+    themes = analysis['themes']
+    analyzed_at = datetime.fromisoformat(analysis['analyzed_at'])
+    if analyzed_at.tzinfo is not None:
+        raise ValueError('analyzed_at must not have a time zone')
+    
+    parts = [HEADER.pack(
+        FORMAT_VERSION,
+        round(sentiment['compound'] * 10000),
+        round(sentiment['neg'] * 1000), round(sentiment['neu'] * 1000), round(sentiment['pos'] * 1000),
+        analysis['word_count'], analysis['unique_words'], structure['sentence_count'],
+        structure['avg_sentence_length'],
+        (analyzed_at - EPOCH) // MICROSECOND,
+        len(emotions), len(themes))]
+    parts.extend(LABEL.pack(label_ids[('emotion', name)], count) for name, count in emotions.items())
+    parts.extend(LABEL.pack(label_ids[('theme', name)], count) for name, count in themes.items())
+    
+    extra = {key: value for key, value in analysis.items() if key not in KNOWN_KEYS}
+    if extra:
+        parts.append(json.dumps(extra).encode())
+    return b''.join(parts)
+
+def _labels(blob, emotion_count, theme_count, label_names):
+    pairs = LABEL.iter_unpack(blob[HEADER.size:HEADER.size + (emotion_count + theme_count) * LABEL.size])
+    emotions = {}
+    themes = {}
+    for i, (label_id, count) in enumerate(pairs):
+        if i < emotion_count:
+            emotions[label_names[label_id]] = count
+        else:
+            themes[label_names[label_id]] = count
+    return emotions, themes
+
+def decode_labels(blob, label_names):
+    """Only the (emotions, themes) dicts of a packed analysis"""
+    emotion_count, theme_count = HEADER.unpack_from(blob)[-2:]
+    return _labels(blob, emotion_count, theme_count, label_names)
+
+def decode(blob, label_names):
+    """Unpack an analysis dict, using `label_names` to map ids back to names"""
+    (version, compound, neg, neu, pos, word_count, unique_words, sentence_count,
+     avg_sentence_length, analyzed_at, emotion_count, theme_count) = HEADER.unpack_from(blob)
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Unknown analysis format: {version}')
+    
+    emotions, themes = _labels(blob, emotion_count, theme_count, label_names)
+    sentiment = {'neg': neg / 1000, 'neu': neu / 1000, 'pos': pos / 1000, 'compound': compound / 10000}
+    analysis = {
+        'sentiment': sentiment,
+        'emotions': emotions,
+        'themes': themes,
+        'interpretation': generate_interpretation(emotions, themes, sentiment),
+        'structure': {
+            'sentence_count': sentence_count,
+            'avg_sentence_length': avg_sentence_length,
+            'narrative_flow': narrative_flow(sentence_count)
+        },
+        'word_count': word_count,
+        'unique_words': unique_words,
+        'analyzed_at': (EPOCH + analyzed_at * MICROSECOND).isoformat()
+    }
+    
+    end = HEADER.size + (emotion_count + theme_count) * LABEL.size
+    if len(blob) > end:
+        analysis.update(json.loads(blob[end:]))
+    return analysis
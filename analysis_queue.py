@@ -0,0 +1,172 @@
+"""
+Background analysis queue.
+
+Dreams are saved as 'pending' together with a row in the analysis_jobs
+table, and a small pool of worker threads analyzes them and stores the
+results. Because the queue lives in SQLite, jobs survive restarts and can be
+shared by several processes. A worker claims a job under a lease token;
+jobs still running after `lease_seconds` (their process died or hung) are
+queued again, and only the current lease holder can complete a job.
+"""
+
+import logging
+import secrets
+import threading
+import time
+
+import repository
+
+logger = logging.getLogger(__name__)
+
+class QueueFull(Exception):
+    """Raised when too many analyses are already waiting"""
+
+class AnalysisQueue:
+    def __init__(self, analyzer, path, workers=2, max_pending=1000, max_attempts=3, poll_interval=1.0,
+                 lease_seconds=600):
+        self.analyzer = analyzer
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._next_requeue = 0.0
+        self._pool = repository.get_pool(path)
+        self._threads = []
+        self._stopping = threading.Event()
+        
+        # Signalled when jobs are queued (wake workers) and when they finish
+        # (wake anyone waiting on a dream)
+        self._work_available = threading.Condition()
+        self._job_finished = threading.Condition()
+        
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.processed = 0
+        self.failures = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.stage_seconds = {}
+    
+    def start(self):
+        """Requeue stale jobs and start the worker threads"""
+        self._requeue_stale()
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'analysis-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self, timeout=None):
+        """Stop the workers after their current job"""
+        self._stopping.set()
+        with self._work_available:
+            self._work_available.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+    
+    def enqueue(self, db, user_id, title, content):
+        """Save a pending dream and queue its analysis, returning the dream id
+        
+        Raises QueueFull when max_pending jobs are already queued.
+        """
+        dream_id = repository.add_pending_dream(db, user_id, title, content, max_queued=self.max_pending)
+        if dream_id is None:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFull(f'{self.max_pending} analyses are already queued')
+        
+        with self._work_available:
+            self._work_available.notify()
+        return dream_id
+    
+    def wait(self, timeout):
+        """Block until some job finishes or the timeout expires"""
+        with self._job_finished:
+            self._job_finished.wait(timeout)
+    
+    def _requeue_stale(self):
+        with self._pool.connection() as db:
+            requeued = repository.requeue_stale_jobs(db, self.lease_seconds)
+        if requeued:
+            logger.info("Requeued %d stale analysis jobs", requeued)
+    
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                self._work_once()
+            except Exception:
+                # Such as the database staying locked past busy_timeout; a
+                # job whose failure could not be recorded is requeued once
+                # its lease runs out
+                logger.exception("Analysis worker error, retrying in %.1fs", self.poll_interval)
+                self._stopping.wait(self.poll_interval)
+    
+    def _work_once(self):
+        lease = secrets.token_hex(8)
+        with self._pool.connection() as db:
+            job = repository.claim_job(db, lease)
+        if job is None:
+            # Idle workers also pick up the jobs of processes that died
+            with self._lock:
+                due = time.monotonic() >= self._next_requeue
+                if due:
+                    self._next_requeue = time.monotonic() + self.lease_seconds / 2
+            if due:
+                self._requeue_stale()
+            with self._work_available:
+                self._work_available.wait(self.poll_interval)
+            return
+        self._run(lease, *job)
+    
+    def _run(self, lease, job_id, dream_id, attempts, user_id, content):
+        with self._lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        timings = {}
+        succeeded = False
+        try:
+            try:
+                analysis = self.analyzer.analyze_in_executor(content, timings=timings)
+                saving = time.perf_counter()
+                with self._pool.connection() as db:
+                    if not repository.complete_job(db, job_id, dream_id, user_id, analysis, lease):
+                        logger.warning("Analysis of dream %d was requeued after its lease ran out; discarding it", dream_id)
+                timings['save'] = time.perf_counter() - saving
+                succeeded = True
+            except Exception as e:
+                logger.exception("Analysis of dream %d failed (attempt %d)", dream_id, attempts)
+                with self._pool.connection() as db:
+                    repository.fail_job(db, job_id, dream_id, str(e), retry=attempts < self.max_attempts, lease=lease)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.total_seconds += time.perf_counter() - start
+                if succeeded:
+                    self.processed += 1
+                    for stage, seconds in timings.items():
+                        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+                else:
+                    self.failures += 1
+            with self._job_finished:
+                self._job_finished.notify_all()
+    
+    def stats(self):
+        """Return queue depth and throughput counters"""
+        with self._pool.connection() as db:
+            depth = repository.count_jobs(db)
+        with self._lock:
+            return {
+                'queued': depth['queued'],
+                'running': depth['running'],
+                'failed': depth['failed'],
+                'in_flight': self.in_flight,
+                'processed': self.processed,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'avg_seconds': self.total_seconds / (self.processed + self.failures) if self.processed + self.failures else 0,
+                'avg_stage_seconds': {stage: seconds / self.processed for stage, seconds in self.stage_seconds.items()},
+                'workers': self.workers,
+                'max_pending': self.max_pending
+            }
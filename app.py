@@ -1,50 +1,210 @@
-from flask import Flask, render_template, request, jsonify, session, redirect
+from flask import Flask, render_template, request, jsonify, session, redirect, Response, stream_with_context
 import os
-from datetime import datetime
+import functools
 import json
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
 import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
-from dream_analyzer import DreamAnalyzer
+from dream_analyzer import DreamAnalyzer, AnalysisBusy
+from analysis_cache import AnalysisCache
+from analysis_queue import AnalysisQueue, QueueFull
+from metrics import AppMetrics
+from response_cache import ResponseCache, source_digest
+import journal_io
+import repository
+from repository import get_db
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)
+app.config['DATABASE'] = os.environ.get('DREAM_JOURNAL_DB', 'dream_journal.db')
+repository.init_app(app)
+
+# Dream listing page size
+app.config['DREAMS_PER_PAGE'] = 20
+
+# Longest dream text accepted, in characters; longer ones are analyzed in chunks
+app.config['MAX_DREAM_LENGTH'] = int(os.environ.get('MAX_DREAM_LENGTH', 200000))
+
+# Bulk import settings
+app.config['BULK_IMPORT_LIMIT'] = int(os.environ.get('BULK_IMPORT_LIMIT', 10000))
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+
+# Analysis cache: in-memory LRU, optionally backed by a capped database table
+app.config['ANALYSIS_CACHE_SIZE'] = int(os.environ.get('ANALYSIS_CACHE_SIZE', 1024))
+app.config['ANALYSIS_CACHE_PERSISTENT'] = os.environ.get('ANALYSIS_CACHE_PERSISTENT', '0') == '1'
+app.config['ANALYSIS_CACHE_PERSISTENT_ROWS'] = int(os.environ.get('ANALYSIS_CACHE_PERSISTENT_ROWS', 100000))
+
+# NLTK warm-up, from the first request: 'background' (default), 'eager' (the
+# first requests wait for it) or 'lazy' (first analysis)
+app.config['ANALYZER_WARMUP'] = os.environ.get('ANALYZER_WARMUP', 'background')
 
 # Initialize the dream analyzer
-analyzer = DreamAnalyzer()
+analyzer = DreamAnalyzer(cache=AnalysisCache(
+    maxsize=app.config['ANALYSIS_CACHE_SIZE'],
+    path=app.config['DATABASE'] if app.config['ANALYSIS_CACHE_PERSISTENT'] else None,
+    max_rows=app.config['ANALYSIS_CACHE_PERSISTENT_ROWS']))
+
+# Executor for analyses made while serving requests and by the queue: 'process'
+# (default) keeps the CPU-bound NLP off the GIL the request threads need,
+# 'thread' avoids the worker processes' memory. At most
+# ANALYSIS_MAX_CONCURRENT batches run at once (default: twice the workers).
+app.config['ANALYSIS_EXECUTOR'] = os.environ.get('ANALYSIS_EXECUTOR', 'process')
+app.config['ANALYSIS_MAX_CONCURRENT'] = int(os.environ.get('ANALYSIS_MAX_CONCURRENT', 0)) or None
+analyzer.configure_executor(app.config['ANALYSIS_EXECUTOR'], workers=app.config['ANALYSIS_WORKERS'],
+                            max_concurrent=app.config['ANALYSIS_MAX_CONCURRENT'])
+
+# Background analysis queue for /add_dream
+app.config['ANALYSIS_QUEUE_WORKERS'] = int(os.environ.get('ANALYSIS_QUEUE_WORKERS', 2))
+app.config['ANALYSIS_QUEUE_MAX_PENDING'] = int(os.environ.get('ANALYSIS_QUEUE_MAX_PENDING', 1000))
+app.config['ANALYSIS_QUEUE_LEASE_SECONDS'] = int(os.environ.get('ANALYSIS_QUEUE_LEASE_SECONDS', 600))
+analysis_queue = AnalysisQueue(analyzer, app.config['DATABASE'],
+                               workers=app.config['ANALYSIS_QUEUE_WORKERS'],
+                               max_pending=app.config['ANALYSIS_QUEUE_MAX_PENDING'],
+                               lease_seconds=app.config['ANALYSIS_QUEUE_LEASE_SECONDS'])
+_queue_started = False
+_queue_lock = threading.Lock()
+
+# In-memory feature vectors for related and recurring dreams, created on
+# first use: dream_similarity and sentiment_timeseries import NumPy, which
+# would otherwise add to every startup
+_similarity_index = None
+_similarity_lock = threading.Lock()
+
+def get_similarity_index():
+    global _similarity_index
+    with _similarity_lock:
+        if _similarity_index is None:
+            from dream_similarity import SimilarityIndex
+            _similarity_index = SimilarityIndex()
+        return _similarity_index
+
+# Rendered dreams, insights and dream responses, reused until the user's next write
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 512))
+response_cache = ResponseCache(maxsize=app.config['RESPONSE_CACHE_SIZE'],
+                               version=source_digest(app.root_path, app.template_folder))
+
+# Prometheus metrics at /metrics, off unless enabled
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '0') == '1'
+
+# Comma-separated usernames allowed to read the cross-user /api/admin endpoints
+# and /api/queue/stats
+app.config['ADMIN_USERS'] = {name.strip() for name in os.environ.get('ADMIN_USERS', '').split(',') if name.strip()}
+
+# Days covered by /api/admin/analytics when no range is given
+app.config['ANALYTICS_DEFAULT_DAYS'] = 30
+metrics = None
+if app.config['METRICS_ENABLED']:
+    metrics = AppMetrics()
+    metrics.init_app(app, analyzer)
+    
+    @metrics.registry.collector
+    def queue_and_cache_metrics():
+        stats = analysis_queue.stats()
+        cache = analyzer.cache
+        return [
+            ('dream_journal_analysis_queue_depth', 'gauge', 'Analyses waiting to run', stats['queued']),
+            ('dream_journal_analysis_queue_processed_total', 'counter', 'Queued analyses completed', stats['processed']),
+            ('dream_journal_analysis_queue_failures_total', 'counter', 'Queued analyses that failed', stats['failures']),
+            ('dream_journal_analysis_queue_rejected_total', 'counter', 'Dreams rejected by a full queue', stats['rejected']),
+            ('dream_journal_analysis_cache_hits_total', 'counter', 'Analyses served from the cache', cache.hits + cache.persistent_hits),
+            ('dream_journal_analysis_cache_misses_total', 'counter', 'Analyses missing from the cache', cache.misses)
+        ] + [
+            (f'dream_journal_response_cache_{name}_total', 'counter', documentation, response_cache.stats()[name])
+            for name, documentation in (('hits', 'Responses served from the rendered-response cache'),
+                                        ('misses', 'Responses rendered because they were not cached'),
+                                        ('not_modified', 'Conditional requests answered with 304'))
+        ]
 
 # Database setup
 def init_db():
-    conn = sqlite3.connect('dream_journal.db')
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Dreams table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS dreams (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            date_recorded TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            emotions TEXT,
-            themes TEXT,
-            analysis TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with repository.get_pool(app.config['DATABASE']).connection() as db:
+        repository.init_db(db)
+    # Entries of other analyzer versions can never be hit again
+    analyzer.cache.purge(analyzer.version)
+
+@app.before_request
+def start_background_work():
+    # Started from the serving process on its first request, so neither the
+    # debug reloader's watcher process nor executor workers, which import
+    # this module again when it is run as a script, warm up an executor or
+    # run queue workers of their own
+    global _queue_started
+    if not _queue_started:
+        with _queue_lock:
+            if not _queue_started:
+                # Warms the executor's workers, which do the analyses, rather than this process
+                if app.config['ANALYZER_WARMUP'] == 'eager':
+                    analyzer.warm_up_executor(background=False)
+                elif app.config['ANALYZER_WARMUP'] == 'background':
+                    analyzer.warm_up_executor()
+                analysis_queue.start()
+                _queue_started = True
+
+# Query string filters accepted by the dream listings and insights
+DREAM_FILTER_ARGS = ('theme', 'emotion', 'since', 'until')
+
+def dream_filters():
+    """Read dream filters from the query string
+    
+    `since` (inclusive) and `until` (exclusive) take an ISO date or timestamp;
+    raises ValueError for anything else.
+    """
+    filters = {}
+    for name in ('theme', 'emotion'):
+        if request.args.get(name):
+            filters[name] = request.args[name].strip().lower()
+    for name in ('since', 'until'):
+        if request.args.get(name):
+            try:
+                value = datetime.fromisoformat(request.args[name])
+            except ValueError:
+                raise ValueError(f'{name} must be an ISO date such as 2024-03-01')
+            if value.tzinfo:
+                value = value.astimezone(timezone.utc)
+            # Same format as the stored date_recorded
+            filters[name] = value.strftime('%Y-%m-%d %H:%M:%S')
+    return filters
+
+def revision_cached(view):
+    """Serve a per-user view with a strong ETag, from the rendered-response cache
+    
+    For views whose response only depends on the user's dreams and the URL.
+    A current If-None-Match gets `304 Not Modified`; otherwise a body
+    rendered at the user's current revision is reused. Only 200 responses
+    are cached.
+    """
+    @functools.wraps(view)
+    def cached_view(*args, **kwargs):
+        if 'user_id' not in session:
+            return view(*args, **kwargs)
+        
+        user_id = session['user_id']
+        url = request.full_path
+        # Read before rendering, so a write during the view can only make a
+        # body newer than its revision, and the next load renders it again
+        revision = repository.get_revision(get_db(), user_id)
+        etag = response_cache.etag(user_id, revision, url)
+        
+        if request.if_none_match.contains_weak(etag):
+            response_cache.record_not_modified()
+            response = Response(status=304)
+        else:
+            cached = response_cache.get(user_id, revision, url)
+            if cached is not None:
+                response = Response(cached[0], content_type=cached[1])
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response_cache.put(user_id, revision, url, response.get_data(), response.content_type)
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return cached_view
 
 @app.route('/')
 def index():
@@ -52,6 +212,16 @@ def index():
         return render_template('dashboard.html')
     return render_template('index.html')
 
+@app.route('/api/ready')
+def ready():
+    # Readiness probe: the app serves pages right away, but analysis waits
+    # for the executor's workers to finish loading the NLTK components
+    status = analyzer.executor_status()
+    if status['state'] == 'failed':
+        # Start a new pool after a worker died, so the probe recovers without traffic
+        analyzer.warm_up_executor()
+    return jsonify(status), 200 if status['state'] == 'ready' else 503
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -64,12 +234,7 @@ def register():
         password_hash = generate_password_hash(password)
         
         try:
-            conn = sqlite3.connect('dream_journal.db')
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', 
-                         (username, password_hash))
-            conn.commit()
-            conn.close()
+            repository.create_user(get_db(), username, password_hash)
             return jsonify({'success': True, 'message': 'Registration successful'})
         except sqlite3.IntegrityError:
             return jsonify({'error': 'Username already exists'}), 400
@@ -82,11 +247,7 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        conn = sqlite3.connect('dream_journal.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, password_hash FROM users WHERE username = ?', (username,))
-        user = cursor.fetchone()
-        conn.close()
+        user = repository.get_credentials(get_db(), username)
         
         if user and check_password_hash(user[1], password):
             session['user_id'] = user[0]
@@ -113,100 +274,354 @@ def add_dream():
         
         if not title or not content:
             return jsonify({'error': 'Title and content required'}), 400
+        if len(content) > app.config['MAX_DREAM_LENGTH']:
+            return jsonify({'error': f"Dreams are limited to {app.config['MAX_DREAM_LENGTH']} characters"}), 413
         
-        # Analyze the dream
-        analysis_result = analyzer.analyze_dream(content)
-        
-        # Save to database
-        conn = sqlite3.connect('dream_journal.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO dreams (user_id, title, content, emotions, themes, analysis)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (session['user_id'], title, content, 
-              json.dumps(analysis_result['emotions']),
-              json.dumps(analysis_result['themes']),
-              json.dumps(analysis_result)))
-        conn.commit()
-        conn.close()
+        # Save the dream and queue it for analysis
+        try:
+            dream_id = analysis_queue.enqueue(get_db(), session['user_id'], title, content)
+        except QueueFull:
+            response = jsonify({'error': 'Too many dreams are being analyzed right now, please try again shortly'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
         
-        return jsonify({'success': True, 'analysis': analysis_result})
+        return jsonify({'success': True, 'id': dream_id, 'status': 'pending'}), 202
     
     return render_template('add_dream.html')
 
+@app.route('/api/dreams/bulk', methods=['POST'])
+def bulk_add_dreams():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    payload = request.get_json(silent=True) or {}
+    dreams = payload.get('dreams')
+    
+    if not isinstance(dreams, list) or not dreams:
+        return jsonify({'error': 'A non-empty list of dreams is required'}), 400
+    if len(dreams) > app.config['BULK_IMPORT_LIMIT']:
+        return jsonify({'error': f"At most {app.config['BULK_IMPORT_LIMIT']} dreams per request"}), 413
+    records = []
+    for dream in dreams:
+        if not isinstance(dream, dict) or not dream.get('title') or not dream.get('content'):
+            return jsonify({'error': 'Each dream needs a title and content'}), 400
+        if not isinstance(dream['title'], str) or not isinstance(dream['content'], str):
+            return jsonify({'error': 'Dream titles and contents must be strings'}), 400
+        if len(dream['content']) > app.config['MAX_DREAM_LENGTH']:
+            return jsonify({'error': f"Dreams are limited to {app.config['MAX_DREAM_LENGTH']} characters"}), 413
+        # Stored in the same format as /api/import, so listings, filters and counters can order it
+        try:
+            date_recorded = journal_io.parse_timestamp(dream['date_recorded']) if dream.get('date_recorded') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        records.append((dream['title'], dream['content'], date_recorded))
+    
+    # Analyze on the shared executor, holding this request thread meanwhile;
+    # the slots bound the analysis work, and a long wait for one ends in a 503
+    try:
+        results = list(analyzer.analyze_many(content for _, content, _ in records))
+    except AnalysisBusy:
+        response = jsonify({'error': 'Too many dreams are being analyzed right now, please try again shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    # Save everything in a single transaction
+    repository.add_dreams(get_db(), session['user_id'],
+                          ((title, content, date_recorded, analysis_result)
+                           for (title, content, date_recorded), analysis_result in zip(records, results)))
+    
+    return jsonify({'success': True, 'imported': len(dreams)})
+
+@app.route('/api/export')
+def export_dreams():
+    """Stream all of the user's dreams as NDJSON (default) or CSV"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    format = request.args.get('format', 'ndjson')
+    if format not in journal_io.FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(journal_io.FORMATS)}"}), 400
+    
+    user_id = session['user_id']
+    
+    def chunks():
+        db = get_db()
+        if format == 'csv':
+            yield from journal_io.export_csv(db, user_id)
+        else:
+            yield from journal_io.export_ndjson(db, user_id)
+    
+    return Response(stream_with_context(chunks()), mimetype=journal_io.FORMATS[format],
+                    headers={'Content-Disposition': f'attachment; filename=dreams.{format}'})
+
+@app.route('/api/import', methods=['POST'])
+def import_dreams():
+    """Import dreams from an NDJSON or CSV body (or `file` upload), parsed as it streams in"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if format not in journal_io.FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(journal_io.FORMATS)}"}), 400
+    
+    if request.mimetype == 'multipart/form-data':
+        if 'file' not in request.files:
+            return jsonify({'error': 'Upload the journal as the file field'}), 400
+        stream = request.files['file'].stream
+    else:
+        stream = request.stream
+    
+    try:
+        imported = journal_io.import_dreams(get_db(), analyzer, session['user_id'],
+                                            journal_io.read_dreams(stream, format,
+                                                                   max_length=app.config['MAX_DREAM_LENGTH']))
+    except journal_io.InvalidImport as e:
+        return jsonify({'error': str(e), 'imported': e.imported}), 400
+    except AnalysisBusy as e:
+        response = jsonify({'error': 'Too many dreams are being analyzed right now, please try again shortly',
+                            'imported': e.imported})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    return jsonify({'success': True, 'imported': imported})
+
 @app.route('/dreams')
+@revision_cached
 def view_dreams():
     if 'user_id' not in session:
         return redirect('/login')
     
-    conn = sqlite3.connect('dream_journal.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, title, content, date_recorded, emotions, themes, analysis
-        FROM dreams WHERE user_id = ? ORDER BY date_recorded DESC
-    ''', (session['user_id'],))
-    dreams = cursor.fetchall()
-    conn.close()
-    
-    # Parse JSON fields
-    dreams_data = []
-    for dream in dreams:
-        dreams_data.append({
-            'id': dream[0],
-            'title': dream[1],
-            'content': dream[2],
-            'date_recorded': dream[3],
-            'emotions': json.loads(dream[4]) if dream[4] else [],
-            'themes': json.loads(dream[5]) if dream[5] else [],
-            'analysis': json.loads(dream[6]) if dream[6] else {}
-        })
-    
-    return render_template('dreams.html', dreams=dreams_data)
+    try:
+        dreams_data, next_cursor = repository.list_dream_summaries(
+            get_db(), session['user_id'], after=request.args.get('after'),
+            limit=app.config['DREAMS_PER_PAGE'], **dream_filters())
+    except ValueError:
+        return redirect('/dreams')
+    
+    # Carried over into the pagination links
+    filter_args = {name: request.args[name] for name in DREAM_FILTER_ARGS if request.args.get(name)}
+    return render_template('dreams.html', dreams=dreams_data, next_cursor=next_cursor,
+                           first_page='after' not in request.args, filters=filter_args)
+
+@app.route('/api/dreams')
+def list_dreams():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    limit = min(request.args.get('limit', app.config['DREAMS_PER_PAGE'], type=int), 100)
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    
+    try:
+        dreams, next_cursor = repository.list_dream_summaries(
+            get_db(), session['user_id'], after=request.args.get('after'), limit=limit,
+            **dream_filters())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'dreams': dreams, 'next': next_cursor})
+
+@app.route('/api/search')
+def search_dreams():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    limit = min(request.args.get('limit', app.config['DREAMS_PER_PAGE'], type=int), 100)
+    offset = request.args.get('offset', 0, type=int)
+    if limit < 1 or offset < 0:
+        return jsonify({'error': 'limit must be positive and offset not negative'}), 400
+    
+    try:
+        results, next_offset = repository.search_dreams(
+            get_db(), session['user_id'], request.args.get('q', ''), offset=offset, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'results': results, 'next': next_offset})
 
 @app.route('/insights')
+@revision_cached
 def insights():
     if 'user_id' not in session:
         return redirect('/login')
     
-    conn = sqlite3.connect('dream_journal.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT emotions, themes, analysis, date_recorded
-        FROM dreams WHERE user_id = ? ORDER BY date_recorded DESC
-    ''', (session['user_id'],))
-    dreams = cursor.fetchall()
-    conn.close()
+    try:
+        filters = dream_filters()
+    except ValueError:
+        return redirect('/insights')
     
-    # Generate insights
-    insights_data = analyzer.generate_insights(dreams)
+    # Generate insights from the precomputed aggregates, or with SQL
+    # aggregation over the filtered dreams
+    aggregates = repository.get_insights(get_db(), session['user_id'], **filters)
+    insights_data = analyzer.summarize_insights(**aggregates)
     
-    return render_template('insights.html', insights=insights_data)
+    filter_args = {name: request.args[name] for name in DREAM_FILTER_ARGS if request.args.get(name)}
+    return render_template('insights.html', insights=insights_data, filters=filter_args)
+
+@app.route('/api/stats')
+def stats():
+    """Dashboard quick stats, read from the user's precomputed counters"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify(repository.get_stats(get_db(), session['user_id']))
+
+@app.route('/api/insights/timeseries')
+def insights_timeseries():
+    """Sentiment history with rolling mean, EWMA, weekly/monthly buckets and trend"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    import sentiment_timeseries
+    
+    window = request.args.get('window', 7, type=int)
+    span = request.args.get('span', 10, type=int)
+    points = min(request.args.get('points', sentiment_timeseries.RECENT_POINTS, type=int), 5000)
+    if window < 1 or span < 1 or points < 0:
+        return jsonify({'error': 'window and span must be positive and points not negative'}), 400
+    
+    try:
+        rows = repository.get_sentiment_series(get_db(), session['user_id'], **dream_filters())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(sentiment_timeseries.summarize(rows, window_days=window, span=span, points=points))
 
 @app.route('/api/dream/<int:dream_id>')
+@revision_cached
 def get_dream(dream_id):
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = sqlite3.connect('dream_journal.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT title, content, emotions, themes, analysis, date_recorded
-        FROM dreams WHERE id = ? AND user_id = ?
-    ''', (dream_id, session['user_id']))
-    dream = cursor.fetchone()
-    conn.close()
+    dream = repository.get_dream(get_db(), dream_id, session['user_id'])
     
     if not dream:
         return jsonify({'error': 'Dream not found'}), 404
     
-    return jsonify({
-        'title': dream[0],
-        'content': dream[1],
-        'emotions': json.loads(dream[2]) if dream[2] else [],
-        'themes': json.loads(dream[3]) if dream[3] else [],
-        'analysis': json.loads(dream[4]) if dream[4] else {},
-        'date_recorded': dream[5]
-    })
+    return jsonify(dream)
+
+@app.route('/api/dream/<int:dream_id>/similar')
+def similar_dreams(dream_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    k = request.args.get('k', 5, type=int)
+    if not 1 <= k <= 50:
+        return jsonify({'error': 'k must be between 1 and 50'}), 400
+    
+    db = get_db()
+    user_id = session['user_id']
+    if not repository.get_dream_status(db, dream_id, user_id):
+        return jsonify({'error': 'Dream not found'}), 404
+    
+    matches = get_similarity_index().similar(db, user_id, dream_id, k)
+    if matches is None:
+        return jsonify({'error': 'Dream has not been analyzed yet'}), 409
+    
+    summaries = repository.get_dream_summaries(db, user_id, [match_id for match_id, _ in matches])
+    similar = [dict(summaries[match_id], similarity=score) for match_id, score in matches if match_id in summaries]
+    return jsonify({'id': dream_id, 'similar': similar})
+
+@app.route('/api/insights/recurring')
+def recurring_dreams():
+    """Groups of closely related dreams among the user's recent ones"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    db = get_db()
+    user_id = session['user_id']
+    clusters = get_similarity_index().recurring(db, user_id)
+    summaries = repository.get_dream_summaries(
+        db, user_id, [dream_id for cluster in clusters for dream_id in cluster['dream_ids']])
+    
+    return jsonify({'clusters': [{
+        'similarity': cluster['similarity'],
+        'dreams': [summaries[dream_id] for dream_id in cluster['dream_ids'] if dream_id in summaries]
+    } for cluster in clusters]})
+
+@app.route('/api/dream/<int:dream_id>/status')
+def get_dream_status(dream_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    status = repository.get_dream_status(get_db(), dream_id, session['user_id'])
+    
+    if not status:
+        return jsonify({'error': 'Dream not found'}), 404
+    
+    return jsonify({'id': dream_id, 'status': status})
+
+@app.route('/api/dream/<int:dream_id>/events')
+def dream_events(dream_id):
+    """Server-sent events reporting a dream's analysis status until it is done"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    if not repository.get_dream_status(get_db(), dream_id, user_id):
+        return jsonify({'error': 'Dream not found'}), 404
+    
+    def events():
+        deadline = time.monotonic() + 300
+        last_status = None
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            status = repository.get_dream_status(get_db(), dream_id, user_id)
+            if status != last_status:
+                yield f"event: status\ndata: {json.dumps({'id': dream_id, 'status': status})}\n\n"
+                last_status = status
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > 15:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            if status != 'pending':
+                return
+            # Woken early whenever a job finishes
+            analysis_queue.wait(timeout=1)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Scraped by Prometheus, so no session is required
+    if metrics is None:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/queue/stats')
+def queue_stats():
+    """Queue depth and throughput across all users"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if session.get('username') not in app.config['ADMIN_USERS']:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    return jsonify(analysis_queue.stats())
+
+@app.route('/api/admin/analytics')
+def admin_analytics():
+    """Cross-user daily totals and top emotions and themes, from the rollup tables only"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if session.get('username') not in app.config['ADMIN_USERS']:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    # `since` is inclusive and `until` exclusive, like the dream filters;
+    # by default the last ANALYTICS_DEFAULT_DAYS days, today included (UTC)
+    until = datetime.now(timezone.utc).date() + timedelta(days=1)
+    try:
+        if request.args.get('until'):
+            until = date.fromisoformat(request.args['until'])
+        since = until - timedelta(days=app.config['ANALYTICS_DEFAULT_DAYS'])
+        if request.args.get('since'):
+            since = date.fromisoformat(request.args['since'])
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO dates such as 2024-03-01'}), 400
+    if since >= until:
+        return jsonify({'error': 'since must be before until'}), 400
+    
+    return jsonify(repository.get_rollups(get_db(), since, until))
 
 if __name__ == '__main__':
     init_db()
@@ -0,0 +1,105 @@
+"""
+Request latency while the analyzer is saturated, per executor kind.
+
+Serves the app on a local port and, for the thread and the process executor
+in turn, keeps --loaders clients posting batches of new dreams to
+/api/dreams/bulk while --concurrency clients read /api/dream/<id>. Reports
+the read latency next to an idle baseline, and the bulk throughput, showing
+how much the analyses running in the server process slow down its other
+requests.
+
+Run from the repository root:
+    python -m benchmarks.analysis_executor [--seconds 10] [--batch 64] [--loaders 2]
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.request
+
+from benchmarks.suite import drive, load_app, login, seed_users
+from benchmarks.synthetic import generate_corpus
+
+def load(base_url, username, batches, stop, counts, lock):
+    """Post bulk batches until `stop` is set, counting the dreams imported"""
+    opener = login(base_url, username)
+    while not stop.is_set():
+        with lock:
+            batch = next(batches)
+        body = json.dumps({'dreams': [{'title': 'Bulk dream', 'content': text} for text in batch]}).encode()
+        request = urllib.request.Request(base_url + '/api/dreams/bulk', body, {'Content-Type': 'application/json'})
+        with opener.open(request) as response:
+            imported = json.load(response)['imported']
+        with lock:
+            counts['dreams'] += imported
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10, help='load duration per executor kind')
+    parser.add_argument('--batch', type=int, default=64, help='dreams per bulk request')
+    parser.add_argument('--loaders', type=int, default=2, help='clients posting bulk requests')
+    parser.add_argument('--concurrency', type=int, default=4, help='clients reading dreams')
+    args = parser.parse_args()
+    
+    from werkzeug.serving import make_server
+    
+    corpus = generate_corpus(200)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = load_app(os.path.join(tmp, 'executor.db'))
+        analyses = [app.analyzer.analyze_dream(text) for text in corpus]
+        seeded = seed_users(app, 2, corpus, analyses)
+        
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        
+        username, dream_ids = seeded[0]
+        sessions = [(login(base_url, username), dream_ids, random.Random(n)) for n in range(args.concurrency)]
+        read = lambda dream_ids, rng: (f'/api/dream/{rng.choice(dream_ids)}', None)
+        
+        def measure(label, stop):
+            # Read for as long as the load runs
+            results = []
+            while not stop.is_set():
+                results.append(drive(base_url, sessions, read, args.concurrency * 25, args.concurrency))
+            ordered = sorted((r['p50_ms'], r['p95_ms'], r['p99_ms']) for r in results)
+            p50, p95, p99 = ordered[len(ordered) // 2]
+            print(f"  {label:32s} p50 {p50:7.2f} ms   p95 {p95:7.2f} ms   p99 {p99:7.2f} ms")
+        
+        drive(base_url, sessions, read, len(dream_ids), args.concurrency)
+        print(f"GET /api/dream/<id> from {args.concurrency} clients, median of rounds")
+        idle = threading.Event()
+        threading.Timer(args.seconds / 2, idle.set).start()
+        measure('idle', idle)
+        
+        for kind in ('thread', 'process'):
+            app.analyzer.configure_executor(kind, workers=app.app.config['ANALYSIS_WORKERS'])
+            # Fresh dreams for every batch, so the analysis cache never answers
+            batches = (generate_corpus(args.batch, seed=f'{kind} {n}') for n in itertools.count())
+            stop = threading.Event()
+            counts = {'dreams': 0}
+            lock = threading.Lock()
+            loaders = [threading.Thread(target=load, args=(base_url, seeded[1][0], batches, stop, counts, lock))
+                       for _ in range(args.loaders)]
+            start = time.perf_counter()
+            for loader in loaders:
+                loader.start()
+            threading.Timer(args.seconds, stop.set).start()
+            measure(f'{kind} executor, bulk load', stop)
+            for loader in loaders:
+                loader.join()
+            print(f"  {'':32s} bulk {counts['dreams'] / (time.perf_counter() - start):8.1f} dreams/s")
+        
+        server.shutdown()
+        app.analysis_queue.stop(timeout=30)
+        app.analyzer.shutdown_executor()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark stored analysis size and decode speed: JSON versus analysis_codec.
+
+Builds two databases of generated analyses, one in the previous layout
+(emotions, themes and the analysis as separate JSON texts) and one packed
+by analysis_codec, then compares their size and how fast full analyses and
+summary labels decode.
+
+Run from the repository root:
+    python -m benchmarks.analysis_storage [--rows 1000000] [--unique 5000]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import analysis_codec
+from dream_analyzer import DreamAnalyzer
+from benchmarks.synthetic import generate_corpus
+
+def generate_analyses(unique):
+    analyzer = DreamAnalyzer()
+    analyses = []
+    for text in generate_corpus(unique):
+        analysis = analyzer.analyze_dream(text)
+        del analysis['features']
+        analyses.append(analysis)
+    return analyses
+
+def rows(analyses, count):
+    # Cycle through the analyses with distinct timestamps
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        analysis = dict(analyses[i % len(analyses)], analyzed_at=(start + timedelta(seconds=i * 37.5)).isoformat())
+        yield analysis
+
+def build(path, columns, encoded_rows, batch_size=10000):
+    db = sqlite3.connect(path)
+    db.execute(f'CREATE TABLE dreams (id INTEGER PRIMARY KEY, {columns})')
+    placeholders = ', '.join('?' * len(columns.split(',')))
+    batch = []
+    for row in encoded_rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.executemany(f'INSERT INTO dreams ({columns}) VALUES ({placeholders})', batch)
+            batch = []
+    db.executemany(f'INSERT INTO dreams ({columns}) VALUES ({placeholders})', batch)
+    db.commit()
+    db.execute('VACUUM')
+    return db
+
+def timed(db, sql, decode):
+    start = time.perf_counter()
+    count = 0
+    for row in db.execute(sql):
+        decode(row)
+        count += 1
+    return count / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--unique', type=int, default=5000, help='distinct dreams analyzed to fill the rows')
+    args = parser.parse_args()
+    
+    analyses = generate_analyses(args.unique)
+    label_ids = {}
+    for analysis in analyses:
+        for label in analysis_codec.labels(analysis):
+            label_ids.setdefault(label, len(label_ids) + 1)
+    label_names = {label_id: name for (_, name), label_id in label_ids.items()}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        json_db = build(os.path.join(tmp, 'json.db'), 'emotions, themes, analysis',
+                        ((json.dumps(a['emotions']), json.dumps(a['themes']), json.dumps(a))
+                         for a in rows(analyses, args.rows)))
+        packed_db = build(os.path.join(tmp, 'packed.db'), 'analysis',
+                          ((analysis_codec.encode(a, label_ids),) for a in rows(analyses, args.rows)))
+        print(f"{args.rows} analyses ({time.perf_counter() - start:.0f}s to build)")
+        
+        json_size = os.path.getsize(os.path.join(tmp, 'json.db'))
+        packed_size = os.path.getsize(os.path.join(tmp, 'packed.db'))
+        json_bytes = json_db.execute(
+            'SELECT AVG(length(emotions) + length(themes) + length(analysis)) FROM dreams').fetchone()[0]
+        packed_bytes = packed_db.execute('SELECT AVG(length(analysis)) FROM dreams').fetchone()[0]
+        print(f"  {'':22s} {'json':>12s} {'packed':>12s} {'gain':>8s}")
+        print(f"  {'bytes per analysis':22s} {json_bytes:12.0f} {packed_bytes:12.0f} {json_bytes / packed_bytes:7.1f}x")
+        print(f"  {'database size (MB)':22s} {json_size / 1e6:12.0f} {packed_size / 1e6:12.0f} "
+              f"{json_size / packed_size:7.1f}x")
+        
+        for name, json_decode, packed_decode in (
+                ('full analyses/s', lambda row: (json.loads(row[0]), json.loads(row[1]), json.loads(row[2])),
+                 lambda row: analysis_codec.decode(row[0], label_names)),
+                ('summary labels/s', lambda row: (json.loads(row[0]), json.loads(row[1])),
+                 lambda row: analysis_codec.decode_labels(row[0], label_names))):
+            json_rate = timed(json_db, 'SELECT emotions, themes, analysis FROM dreams', json_decode)
+            packed_rate = timed(packed_db, 'SELECT analysis FROM dreams', packed_decode)
+            print(f"  {name:22s} {json_rate:12.0f} {packed_rate:12.0f} {packed_rate / json_rate:7.1f}x")
+        json_db.close()
+        packed_db.close()
+
+if __name__ == '__main__':
+    main()
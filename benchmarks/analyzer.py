@@ -0,0 +1,67 @@
+"""
+Benchmark the analyzer's tokenization and lemmatization hot path.
+
+Analyzes a synthetic corpus with the previous pipeline (word_tokenize on the
+whole text, an uncached lemmatize call per token and a second sent_tokenize
+and split for the structure) and with the current one (one tokenization pass
+and the lemma cache), then prints where the current pipeline spends its time.
+
+Run from the repository root:
+    python -m benchmarks.analyzer [--dreams 10000]
+"""
+
+import argparse
+import time
+
+from dream_analyzer import DreamAnalyzer
+from benchmarks.synthetic import generate_corpus
+
+def legacy_tokens(analyzer, text):
+    """Tokenization and lemmatization as implemented before the single pass"""
+    clean_text = analyzer._clean_text(text)
+    tokens = analyzer._word_tokenize(clean_text.lower())
+    filtered_tokens = [analyzer.lemmatizer.lemmatize(token) for token in tokens
+                       if token not in analyzer.stop_words and token.isalpha()]
+    sentences = analyzer._sent_tokenize(text)
+    return tokens, filtered_tokens, sentences, len(text.split())
+
+def current_tokens(analyzer, text):
+    sentences, tokens, word_count = analyzer._tokenize(analyzer._clean_text(text))
+    filtered_tokens = [lemma for lemma in map(analyzer._lemma, tokens) if lemma is not None]
+    return tokens, filtered_tokens, sentences, word_count
+
+def timed(func, analyzer, corpus):
+    start = time.perf_counter()
+    for text in corpus:
+        func(analyzer, text)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dreams', type=int, default=10000)
+    args = parser.parse_args()
+    
+    corpus = generate_corpus(args.dreams)
+    analyzer = DreamAnalyzer()
+    analyzer.warm_up(background=False)
+    
+    print(f"Tokenize + lemmatize {len(corpus)} synthetic dreams")
+    legacy = timed(legacy_tokens, analyzer, corpus)
+    current = timed(current_tokens, analyzer, corpus)
+    info = analyzer.lemma_cache_info()
+    print(f"  previous pipeline: {legacy * 1000:9.1f} ms ({legacy / len(corpus) * 1e6:8.1f} us/dream)")
+    print(f"  single pass+cache: {current * 1000:9.1f} ms ({current / len(corpus) * 1e6:8.1f} us/dream)")
+    print(f"  speedup:           {legacy / current:9.1f}x")
+    print(f"  lemma cache:       {info.hits / (info.hits + info.misses):9.1%} hits, {info.currsize} entries")
+    
+    timings = {}
+    start = time.perf_counter()
+    for text in corpus:
+        analyzer.analyze_dream(text, timings=timings)
+    total = time.perf_counter() - start
+    print(f"Full analysis: {total / len(corpus) * 1e6:.1f} us/dream")
+    for stage, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+        print(f"  {stage:14s} {seconds / len(corpus) * 1e6:8.1f} us/dream  {seconds / total:6.1%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Mixed read/write load benchmark for the data access layer.
+
+Serves two equivalent Flask apps from a threaded WSGI server: one opening a
+fresh sqlite3 connection per request with default journaling (how app.py
+used to work), and one using the pooled WAL connections from repository.py.
+Both are driven by the same concurrent client.
+
+Run from the repository root:
+    python -m benchmarks.db_load [--threads 16] [--requests 4000] [--write-ratio 0.2]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, jsonify
+from werkzeug.serving import make_server
+
+import repository
+from repository import get_db
+from benchmarks.synthetic import generate_corpus
+
+ANALYSIS = {'emotions': {'fear': 1}, 'themes': {'water': 2}, 'sentiment': {'compound': -0.3}}
+
+def legacy_app(path):
+    app = Flask('legacy')
+    
+    @app.route('/read/<int:dream_id>')
+    def read(dream_id):
+        conn = sqlite3.connect(path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT title, content, emotions, themes, analysis, date_recorded FROM dreams WHERE id = ? AND user_id = ?',
+                       (dream_id, 1))
+        dream = cursor.fetchone()
+        conn.close()
+        return jsonify({'title': dream[0], 'analysis': json.loads(dream[4])})
+    
+    @app.route('/write', methods=['POST'])
+    def write():
+        conn = sqlite3.connect(path)
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO dreams (user_id, title, content, emotions, themes, analysis) VALUES (?, ?, ?, ?, ?, ?)',
+                       (1, 'bench', 'bench dream', json.dumps(ANALYSIS['emotions']),
+                        json.dumps(ANALYSIS['themes']), json.dumps(ANALYSIS)))
+        conn.commit()
+        conn.close()
+        return jsonify({'success': True})
+    
+    return app
+
+def pooled_app(path):
+    app = Flask('pooled')
+    app.config['DATABASE'] = path
+    repository.init_app(app)
+    
+    @app.route('/read/<int:dream_id>')
+    def read(dream_id):
+        dream = repository.get_dream(get_db(), dream_id, 1)
+        return jsonify({'title': dream['title'], 'analysis': dream['analysis']})
+    
+    @app.route('/write', methods=['POST'])
+    def write():
+        repository.add_dream(get_db(), 1, 'bench', 'bench dream', ANALYSIS)
+        return jsonify({'success': True})
+    
+    return app
+
+def seed(path, dreams):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = DELETE')
+    repository.init_db(conn)
+    repository.create_user(conn, 'bench', 'x')
+    repository.add_dreams(conn, 1, ((f'dream {i}', text, None, ANALYSIS) for i, text in enumerate(dreams)))
+    conn.close()
+
+def drive(app, requests, threads, write_ratio, max_id):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    rng = random.Random(0)
+    plan = [rng.random() < write_ratio for _ in range(requests)]
+    
+    def one(is_write):
+        start = time.perf_counter()
+        if is_write:
+            urllib.request.urlopen(urllib.request.Request(f'{base}/write', data=b'', method='POST')).read()
+        else:
+            urllib.request.urlopen(f'{base}/read/{rng.randint(1, max_id)}').read()
+        return time.perf_counter() - start
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = list(pool.map(one, plan))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    
+    latencies.sort()
+    return {
+        'requests_per_sec': requests / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--dreams', type=int, default=5000)
+    args = parser.parse_args()
+    
+    corpus = generate_corpus(args.dreams)
+    print(f"{args.requests} requests, {args.threads} client threads, {args.write_ratio:.0%} writes")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in (('per-request connect', legacy_app), ('pooled WAL', pooled_app)):
+            path = os.path.join(tmp, f'{name.split()[0]}.db')
+            seed(path, corpus)
+            result = drive(factory(path), args.requests, args.threads, args.write_ratio, args.dreams)
+            print(f"  {name:20s} {result['requests_per_sec']:8.0f} req/s   "
+                  f"p50 {result['p50_ms']:6.2f} ms   p95 {result['p95_ms']:6.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark streaming journal export and import.
+
+Exports a large single-user journal as NDJSON and CSV and reports throughput
+and how much the process' peak memory grew, then imports an NDJSON journal
+through the same parsing, analysis and batched commits as /api/import.
+Building the default 1M-dream journal takes a few minutes; pass --db to keep
+it between runs.
+
+Run from the repository root:
+    python -m benchmarks.export_import [--dreams 1000000] [--imports 20000] [--db export.db]
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import sqlite3
+import tempfile
+import time
+
+import journal_io
+import repository
+from dream_analyzer import DreamAnalyzer
+from benchmarks.synthetic import generate_corpus, generate_dream
+
+def build(path, dreams, batch_size=10000):
+    db = sqlite3.connect(path)
+    repository.init_db(db)
+    existing = db.execute('SELECT COUNT(*) FROM dreams').fetchone()[0]
+    if existing >= dreams:
+        print(f"Reusing {existing} dreams in {path}")
+        return db
+    
+    db.execute("INSERT OR IGNORE INTO users (id, username, password_hash) VALUES (1, 'bench', 'x')")
+    analysis = json.dumps({'sentiment': {'compound': 0.0}, 'emotions': {'fear': 1}, 'themes': {'water': 2},
+                           'interpretation': 'A synthetic dream.', 'word_count': 60})
+    rng = random.Random(existing)
+    start = time.perf_counter()
+    for first in range(existing, dreams, batch_size):
+        rows = [(f'dream {i}', generate_dream(rng), '2020-01-01 00:00:00', analysis)
+                for i in range(first, min(first + batch_size, dreams))]
+        with db:
+            db.executemany('''
+                INSERT INTO dreams (user_id, title, content, date_recorded, emotions, themes, analysis, sentiment)
+                VALUES (1, ?, ?, datetime(?, '+' || abs(random() % 157680000) || ' seconds'),
+                        '{"fear": 1}', '{"water": 2}', ?, 0.0)
+            ''', rows)
+        done = first + len(rows)
+        if done % (batch_size * 10) == 0 or done == dreams:
+            print(f"  {done:>9} dreams  {time.perf_counter() - start:6.0f}s")
+    return db
+
+def peak_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure_export(db, export):
+    before = peak_mb()
+    start = time.perf_counter()
+    size = sum(len(chunk.encode()) for chunk in export(db, 1))
+    elapsed = time.perf_counter() - start
+    return elapsed, size, peak_mb() - before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dreams', type=int, default=1000000)
+    parser.add_argument('--imports', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--db', help='database to build or reuse (default: a temporary file)')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db = build(args.db or os.path.join(tmp, 'export.db'), args.dreams)
+        total = db.execute('SELECT COUNT(*) FROM dreams WHERE user_id = 1').fetchone()[0]
+        print(f"Export of {total} dreams (peak memory starts at {peak_mb():.0f} MB)")
+        for name, export in (('ndjson', journal_io.export_ndjson), ('csv', journal_io.export_csv)):
+            elapsed, size, growth = measure_export(db, export)
+            print(f"  {name:7s} {elapsed:7.1f} s  {total / elapsed:9.0f} dreams/s  {size / 1e6:8.0f} MB  "
+                  f"peak memory +{growth:.0f} MB")
+        db.close()
+        
+        body = ''.join(json.dumps({'title': f'import {i}', 'content': text}) + '\n'
+                       for i, text in enumerate(generate_corpus(args.imports, seed=1))).encode()
+        db = sqlite3.connect(os.path.join(tmp, 'import.db'))
+        repository.init_db(db)
+        db.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'bench', 'x')")
+        analyzer = DreamAnalyzer()
+        analyzer.configure_executor('process', workers=args.workers)
+        start = time.perf_counter()
+        imported = journal_io.import_dreams(db, analyzer, 1, journal_io.read_dreams(io.BytesIO(body)))
+        elapsed = time.perf_counter() - start
+        analyzer.shutdown_executor()
+        print(f"Import of {imported} dreams with {args.workers} workers")
+        print(f"  ndjson  {elapsed:7.1f} s  {imported / elapsed:9.0f} dreams/s")
+        db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark the single-pass keyword matcher against the previous per-keyword scan.
+
+Run from the repository root:
+    python -m benchmarks.keyword_matcher [--dreams 2000] [--labels 500] [--words 10]
+"""
+
+import argparse
+import time
+
+from dream_analyzer import DreamAnalyzer, DREAM_THEMES, EMOTION_KEYWORDS
+from benchmarks.synthetic import generate_corpus, generate_lexicon
+
+def legacy_identify_emotions(emotion_keywords, text, tokens):
+    """Emotion detection as implemented before the inverted index"""
+    emotions = {}
+    text_lower = text.lower()
+    for emotion, keywords in emotion_keywords.items():
+        count = sum(1 for keyword in keywords if keyword in text_lower)
+        if count > 0:
+            emotions[emotion] = count
+    return dict(sorted(emotions.items(), key=lambda x: x[1], reverse=True))
+
+def legacy_identify_themes(dream_themes, tokens):
+    """Theme detection as implemented before the inverted index"""
+    themes = {}
+    for theme, keywords in dream_themes.items():
+        count = sum(1 for token in tokens if token in keywords)
+        if count > 0:
+            themes[theme] = count
+    return dict(sorted(themes.items(), key=lambda x: x[1], reverse=True))
+
+def tokenize_corpus(analyzer, corpus):
+    """Pre-tokenize so only the matching step is measured"""
+    tokenized = []
+    for text in corpus:
+        tokens = analyzer._word_tokenize(analyzer._clean_text(text).lower())
+        tokenized.append([analyzer.lemmatizer.lemmatize(token) for token in tokens
+                          if token not in analyzer.stop_words and token.isalpha()])
+    return tokenized
+
+def run(analyzer, corpus, tokenized):
+    start = time.perf_counter()
+    for text, tokens in zip(corpus, tokenized):
+        legacy_identify_emotions(analyzer.emotion_keywords, text, tokens)
+        legacy_identify_themes(analyzer.dream_themes, tokens)
+    legacy = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for tokens in tokenized:
+        analyzer._identify_keywords(tokens)
+    indexed = time.perf_counter() - start
+    
+    return legacy, indexed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dreams', type=int, default=2000)
+    parser.add_argument('--labels', type=int, default=500, help='labels in the large user lexicon')
+    parser.add_argument('--words', type=int, default=10, help='keywords per label in the large user lexicon')
+    args = parser.parse_args()
+    
+    corpus = generate_corpus(args.dreams)
+    
+    large_themes = dict(DREAM_THEMES, **generate_lexicon(args.labels, args.words, seed=1))
+    large_emotions = dict(EMOTION_KEYWORDS, **generate_lexicon(args.labels, args.words, seed=2))
+    
+    cases = [
+        ('default lexicons', DreamAnalyzer()),
+        (f'user lexicons ({args.labels * args.words * 2} extra keywords)',
+         DreamAnalyzer(dream_themes=large_themes, emotion_keywords=large_emotions)),
+    ]
+    
+    for _, analyzer in cases:
+        analyzer.warm_up(background=False)
+    tokenized = tokenize_corpus(cases[0][1], corpus)
+    
+    print(f"Keyword matching over {len(corpus)} synthetic dreams")
+    for name, analyzer in cases:
+        legacy, indexed = run(analyzer, corpus, tokenized)
+        print(f"  {name}:")
+        print(f"    per-keyword scan: {legacy * 1000:9.1f} ms ({legacy / len(corpus) * 1e6:8.1f} us/dream)")
+        print(f"    inverted index:   {indexed * 1000:9.1f} ms ({indexed / len(corpus) * 1e6:8.1f} us/dream)")
+        print(f"    speedup:          {legacy / indexed:9.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark analyzing very long dream texts whole and in chunks.
+
+Analyzes texts of growing length with the whole-text pipeline and with the
+chunked one used above CHUNK_CHARS, printing the time and the peak memory
+allocated during each analysis (measured in a separate run, as tracemalloc
+slows the analysis down).
+
+Run from the repository root:
+    python -m benchmarks.long_dreams [--max-chars 1000000]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from dream_analyzer import DreamAnalyzer
+from benchmarks.synthetic import generate_corpus
+
+def measure(analyzer, text):
+    start = time.perf_counter()
+    analyzer.analyze_dream(text)
+    seconds = time.perf_counter() - start
+    
+    tracemalloc.start()
+    analyzer.analyze_dream(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--max-chars', type=int, default=1000000)
+    args = parser.parse_args()
+    
+    corpus = '\n\n'.join(generate_corpus(2000))
+    chunked = DreamAnalyzer()
+    whole = DreamAnalyzer(chunk_chars=float('inf'))
+    for analyzer in (chunked, whole):
+        analyzer.warm_up(background=False)
+        analyzer.analyze_dream(corpus[:100000])
+    
+    print(f"  {'characters':>10s}  {'whole ms':>9s} {'peak MB':>8s}  {'chunked ms':>10s} {'peak MB':>8s}")
+    length = 10000
+    while length <= args.max_chars:
+        text = (corpus * (length // len(corpus) + 1))[:length]
+        whole_seconds, whole_peak = measure(whole, text)
+        chunked_seconds, chunked_peak = measure(chunked, text)
+        print(f"  {length:10d}  {whole_seconds * 1000:9.1f} {whole_peak / 1e6:8.1f}  "
+              f"{chunked_seconds * 1000:10.1f} {chunked_peak / 1e6:8.1f}")
+        length *= 10
+
+if __name__ == '__main__':
+    main()
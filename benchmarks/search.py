@@ -0,0 +1,100 @@
+"""
+Full-text search benchmark on a large synthetic database.
+
+Builds (or reuses) a database of synthetic dreams spread over many users and
+times /api/search's query for random users: a word with no matches, a common
+word, a prefix, a phrase and two words. Building the default 1M-dream corpus
+takes a few minutes and roughly 1 GB of disk; pass --db to keep it between
+runs.
+
+Run from the repository root:
+    python -m benchmarks.search [--dreams 1000000] [--users 1000] [--db search.db]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import repository
+from benchmarks.synthetic import generate_dream
+
+QUERIES = {
+    'no match': 'tsunami',
+    'common word': 'felt',
+    'prefix': 'swim*',
+    'phrase': '"long corridor"',
+    'two words': 'ocean scared',
+}
+
+def build(path, dreams, users, batch_size=10000):
+    db = sqlite3.connect(path)
+    repository.init_db(db)
+    existing = db.execute('SELECT COUNT(*) FROM dreams').fetchone()[0]
+    if existing >= dreams:
+        print(f"Reusing {existing} dreams in {path}")
+        return db
+
+    with db:
+        db.executemany('INSERT OR IGNORE INTO users (id, username, password_hash) VALUES (?, ?, ?)',
+                       ((user_id, f'user{user_id}', 'x') for user_id in range(1, users + 1)))
+
+    rng = random.Random(existing)
+    start = time.perf_counter()
+    for first in range(existing, dreams, batch_size):
+        rows = [(rng.randint(1, users), f'dream {i}', generate_dream(rng))
+                for i in range(first, min(first + batch_size, dreams))]
+        with db:
+            db.executemany('INSERT INTO dreams (user_id, title, content) VALUES (?, ?, ?)', rows)
+        done = first + len(rows)
+        if done % (batch_size * 10) == 0 or done == dreams:
+            print(f"  {done:>9} dreams  {time.perf_counter() - start:6.0f}s")
+
+    for shard in range(repository.SEARCH_SHARDS):
+        db.execute(f"INSERT INTO dreams_fts_{shard} (dreams_fts_{shard}) VALUES ('optimize')")
+    db.execute('ANALYZE')
+    db.commit()
+    return db
+
+def measure(db, query, users, runs):
+    rng = random.Random(0)
+    latencies = []
+    hits = 0
+    for _ in range(runs):
+        user_id = rng.randint(1, users)
+        start = time.perf_counter()
+        results, _ = repository.search_dreams(db, user_id, query)
+        latencies.append(time.perf_counter() - start)
+        hits += len(results)
+    latencies.sort()
+    return {
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'avg_hits': hits / runs,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dreams', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--db', help='database to build or reuse (default: a temporary file)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, 'search.db')
+        db = build(path, args.dreams, args.users)
+        total = db.execute('SELECT COUNT(*) FROM dreams').fetchone()[0]
+        print(f"{total} dreams, {args.users} users, {args.runs} searches per query (first page of 20)")
+        for name, query in QUERIES.items():
+            result = measure(db, query, args.users, args.runs)
+            print(f"  {name:12s} {query:18s} p50 {result['p50_ms']:6.2f} ms   p95 {result['p95_ms']:6.2f} ms   "
+                  f"max {result['max_ms']:6.2f} ms   {result['avg_hits']:5.1f} hits")
+        db.close()
+
+if __name__ == '__main__':
+    main()
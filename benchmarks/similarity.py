@@ -0,0 +1,83 @@
+"""
+Benchmark the dream similarity index for one user with a large journal.
+
+Measures loading the index from the database, top-k queries, catching up
+after a new dream is analyzed, and the recurring-dream report.
+
+Run from the repository root:
+    python -m benchmarks.similarity [--dreams 50000] [--queries 200]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from array import array
+
+import repository
+from dream_analyzer import DreamAnalyzer
+from dream_similarity import SimilarityIndex
+from benchmarks.synthetic import generate_corpus
+
+def features(dream_id, text):
+    # Hashed the way the analyzer does, skipping NLTK to keep seeding fast
+    hashed = DreamAnalyzer._hash_features(None, [word.strip('.!?').lower() for word in text.split()])
+    return dream_id, array('i', hashed['columns']).tobytes(), array('i', hashed['counts']).tobytes()
+
+def seed(path, corpus):
+    db = sqlite3.connect(path)
+    repository.init_db(db)
+    repository.create_user(db, 'bench', 'x')
+    with db:
+        db.executemany('INSERT INTO dreams (user_id, title, content) VALUES (1, ?, ?)',
+                       ((f'dream {i}', text) for i, text in enumerate(corpus)))
+        db.executemany('INSERT INTO dream_features (dream_id, user_id, columns, counts) VALUES (?, 1, ?, ?)',
+                       (features(i + 1, text) for i, text in enumerate(corpus)))
+    return db
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dreams', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+    
+    corpus = generate_corpus(args.dreams + 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = seed(os.path.join(tmp, 'similarity.db'), corpus[:-1])
+        index = SimilarityIndex()
+        print(f"{args.dreams} dreams for one user")
+        
+        start = time.perf_counter()
+        index.similar(db, 1, 1, args.k)
+        print(f"  load index + first query   {(time.perf_counter() - start) * 1000:8.1f} ms")
+        
+        rng = random.Random(0)
+        latencies = []
+        for _ in range(args.queries):
+            start = time.perf_counter()
+            index.similar(db, 1, rng.randint(1, args.dreams), args.k)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"  top-{args.k} query                p50 {statistics.median(latencies) * 1000:6.2f} ms   "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.2f} ms")
+        
+        with db:
+            dream_id = db.execute("INSERT INTO dreams (user_id, title, content) VALUES (1, 'new', ?)",
+                                  (corpus[-1],)).lastrowid
+            db.execute('INSERT INTO dream_features (dream_id, user_id, columns, counts) VALUES (?, 1, ?, ?)',
+                       features(dream_id, corpus[-1]))
+        start = time.perf_counter()
+        index.similar(db, 1, dream_id, args.k)
+        print(f"  catch up one dream + query {(time.perf_counter() - start) * 1000:8.1f} ms")
+        
+        start = time.perf_counter()
+        index.recurring(db, 1)
+        print(f"  recurring dreams report    {(time.perf_counter() - start) * 1000:8.1f} ms")
+        db.close()
+
+if __name__ == '__main__':
+    main()
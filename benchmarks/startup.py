@@ -0,0 +1,59 @@
+"""
+Startup benchmark: import time, first page and first analysis latency.
+
+Each measurement runs in a fresh interpreter for every ANALYZER_WARMUP mode.
+'eager' loads NLTK while the app is imported, which is how the app used to
+start; 'background' and 'lazy' defer it.
+
+Run from the repository root:
+    python -m benchmarks.startup [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+app.init_db()
+client = app.app.test_client()
+client.get('/login')
+first_page = time.perf_counter() - start
+app.analyzer.analyze_dream("I was flying over the ocean and felt happy, then scared when I started falling.")
+first_analysis = time.perf_counter() - start
+print(json.dumps({'import': imported, 'first_page': first_page, 'first_analysis': first_analysis}))
+'''
+
+def measure(mode, runs):
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ,
+                       ANALYZER_WARMUP=mode,
+                       ANALYSIS_CACHE_PERSISTENT='0',
+                       DREAM_JOURNAL_DB=os.path.join(tmp, 'startup.db'))
+            output = subprocess.run([sys.executable, '-c', PROBE], env=env, check=True,
+                                    capture_output=True, text=True).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    
+    print(f"Median of {args.runs} cold starts, in seconds from the start of `import app`")
+    print(f"  {'mode':12s} {'import':>8s} {'1st page':>9s} {'1st analysis':>13s}")
+    for mode in ('eager', 'background', 'lazy'):
+        result = measure(mode, args.runs)
+        print(f"  {mode:12s} {result['import']:8.3f} {result['first_page']:9.3f} {result['first_analysis']:13.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Reproducible benchmark suite for the analyzer and the web app.
+
+Generates synthetic users and dreams from the analyzer's lexicons, measures
+DreamAnalyzer.analyze_dream and insight throughput, then serves the app on a
+local port and drives /dreams, /insights, /api/dream/<id> and /add_dream from
+concurrent clients, reporting requests/sec and p50/p95/p99 latency per route.
+Results are written as JSON tagged with the git commit; pass an earlier
+result to --compare to list regressions (the exit status is 1 if any metric
+got worse by more than --threshold).
+
+Run from the repository root:
+    python -m benchmarks.suite [--users 8] [--dreams 250] [--requests 1000] [--concurrency 8]
+                               [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.cookiejar import CookieJar
+
+from dream_analyzer import DreamAnalyzer
+from benchmarks.synthetic import generate_corpus
+
+# Bump when the results format or the workload changes
+SUITE_VERSION = 1
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__))
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def latency_summary(latencies, seconds, errors):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'requests_per_second': round(len(ordered) / seconds, 1),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3)
+    }
+
+def bench_analyzer(corpus, users):
+    """Analysis and insight throughput; returns the results and the analyses"""
+    analyzer = DreamAnalyzer()
+    analyzer.warm_up(background=False)
+    
+    start = time.perf_counter()
+    analyses = [analyzer.analyze_dream(text) for text in corpus]
+    analyze_seconds = time.perf_counter() - start
+    
+    # generate_insights reads (id, title, analysis JSON) rows, one user's at a time
+    per_user = len(analyses) // users
+    journals = [[(i, f'dream {i}', json.dumps(analysis)) for i, analysis in enumerate(analyses[n::users])]
+                for n in range(users)]
+    rounds = max(1, 20000 // len(analyses))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for journal in journals:
+            analyzer.generate_insights(journal)
+    insights_seconds = time.perf_counter() - start
+    
+    return {
+        'analyze_dream': {
+            'dreams': len(analyses),
+            'dreams_per_second': round(len(analyses) / analyze_seconds, 1)
+        },
+        'generate_insights': {
+            'dreams_per_journal': per_user,
+            'journals_per_second': round(rounds * users / insights_seconds, 1)
+        }
+    }, analyses
+
+def load_app(path):
+    """Import the app against a fresh database at `path`"""
+    os.environ['DREAM_JOURNAL_DB'] = path
+    os.environ['ANALYZER_WARMUP'] = 'eager'
+    os.environ.setdefault('ANALYSIS_QUEUE_MAX_PENDING', '1000000')
+    app = importlib.import_module('app')
+    app.init_db()
+    return app
+
+def seed_users(app, users, corpus, analyses):
+    """Create the users and their dreams; returns [(username, dream_ids)]"""
+    from werkzeug.security import generate_password_hash
+    import repository
+    
+    password_hash = generate_password_hash('bench')
+    seeded = []
+    with repository.get_pool(app.app.config['DATABASE']).connection() as db:
+        for n in range(users):
+            username = f'bench{n}'
+            user_id = repository.create_user(db, username, password_hash)
+            repository.add_dreams(db, user_id, ((f'Dream {i}', corpus[i], None, analyses[i])
+                                                for i in range(n, len(corpus), users)))
+            dream_ids = [row[0] for row in db.execute('SELECT id FROM dreams WHERE user_id = ?', (user_id,))]
+            seeded.append((username, dream_ids))
+    return seeded
+
+def login(base_url, username):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    data = urllib.parse.urlencode({'username': username, 'password': 'bench'}).encode()
+    opener.open(base_url + '/login', data).read()
+    return opener
+
+def drive(base_url, sessions, make_request, requests, concurrency):
+    """Send `requests` requests from `concurrency` threads, spread over the sessions"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    
+    def send(number):
+        nonlocal errors
+        opener, dream_ids, rng = sessions[number % len(sessions)]
+        path, data = make_request(dream_ids, rng)
+        start = time.perf_counter()
+        try:
+            opener.open(base_url + path, data).read()
+            failed = False
+        except (urllib.error.URLError, OSError):
+            failed = True
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            errors += failed
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(requests)))
+    return latency_summary(latencies, time.perf_counter() - start, errors)
+
+def bench_routes(app, seeded, args):
+    from werkzeug.serving import make_server
+    
+    # The development server logs every request
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    
+    new_dreams = generate_corpus(args.requests, seed=1)
+    routes = [
+        ('GET /dreams', lambda dream_ids, rng: ('/dreams', None)),
+        ('GET /insights', lambda dream_ids, rng: ('/insights', None)),
+        ('GET /api/dream/<id>', lambda dream_ids, rng: (f'/api/dream/{rng.choice(dream_ids)}', None)),
+        # Last, as every new dream invalidates the user's cached pages
+        ('POST /add_dream', lambda dream_ids, rng: (
+            '/add_dream', urllib.parse.urlencode({'title': 'New dream', 'content': rng.choice(new_dreams)}).encode()))
+    ]
+    
+    try:
+        sessions = [(login(base_url, username), dream_ids, random.Random(n))
+                    for n, (username, dream_ids) in enumerate(seeded)]
+        results = {}
+        for name, make_request in routes:
+            if name.startswith('GET'):
+                # Prime each user's cached pages, so the first requests do not skew the tail
+                drive(base_url, sessions, make_request, len(sessions) * 2, args.concurrency)
+            results[name] = drive(base_url, sessions, make_request, args.requests, args.concurrency)
+            print(f"  {name:22s} {results[name]['requests_per_second']:8.1f} req/s   "
+                  f"p50 {results[name]['p50_ms']:7.2f} ms   p95 {results[name]['p95_ms']:7.2f} ms   "
+                  f"p99 {results[name]['p99_ms']:7.2f} ms   errors {results[name]['errors']}")
+    finally:
+        server.shutdown()
+        app.analysis_queue.stop(timeout=30)
+    return results
+
+def metrics(results):
+    """Flatten results into {name: (value, higher_is_better)}"""
+    flat = {}
+    for section in ('analyzer', 'routes'):
+        for name, values in results.get(section, {}).items():
+            for key, value in values.items():
+                if key.endswith('_per_second'):
+                    flat[f'{name} {key}'] = (value, True)
+                elif key.endswith('_ms'):
+                    flat[f'{name} {key}'] = (value, False)
+    return flat
+
+def compare(baseline, results, threshold):
+    """Print every metric against the baseline; returns the number of regressions"""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created_at')})")
+    old, new = metrics(baseline), metrics(results)
+    regressions = 0
+    for name, (value, higher_is_better) in new.items():
+        if name not in old or not old[name][0]:
+            continue
+        change = value / old[name][0] - 1
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"  {name:48s} {old[name][0]:10.2f} -> {value:10.2f}  {change:+7.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--dreams', type=int, default=250, help='dreams per user')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.20,
+                        help='relative change counted as a regression (default 0.20)')
+    args = parser.parse_args()
+    
+    commit = git_commit()
+    results = {
+        'suite_version': SUITE_VERSION,
+        'commit': commit,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parameters': {'users': args.users, 'dreams': args.dreams, 'requests': args.requests,
+                       'concurrency': args.concurrency}
+    }
+    
+    corpus = generate_corpus(args.users * args.dreams)
+    print(f"Analyzer: {len(corpus)} synthetic dreams")
+    results['analyzer'], analyses = bench_analyzer(corpus, args.users)
+    print(f"  analyze_dream          {results['analyzer']['analyze_dream']['dreams_per_second']:8.1f} dreams/s")
+    print(f"  generate_insights      {results['analyzer']['generate_insights']['journals_per_second']:8.1f} "
+          f"journals/s ({args.dreams} dreams each)")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        app = load_app(os.path.join(tmp, 'suite.db'))
+        seeded = seed_users(app, args.users, corpus, analyses)
+        print(f"Routes: {args.users} users with {args.dreams} dreams, {args.requests} requests per route, "
+              f"{args.concurrency} concurrent clients")
+        results['routes'] = bench_routes(app, seeded, args)
+    
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Synthetic dream generator shared by the benchmark scripts.
+Dreams are built from the analyzer's own lexicons mixed with filler text, so
+every stage of the pipeline has realistic work to do.
+"""
+
+import random
+import string
+
+from dream_analyzer import DREAM_THEMES, EMOTION_KEYWORDS
+
+FILLER_WORDS = [
+    'i', 'was', 'walking', 'through', 'a', 'long', 'corridor', 'and', 'then',
+    'suddenly', 'the', 'light', 'changed', 'someone', 'called', 'my', 'name',
+    'it', 'felt', 'very', 'strange', 'old', 'door', 'opened', 'into', 'room',
+    'we', 'were', 'looking', 'for', 'something', 'that', 'had', 'been', 'there',
+    'before', 'after', 'while', 'outside', 'inside', 'again', 'slowly', 'quickly'
+]
+
+def _lexicon_words():
+    words = set()
+    for keywords in list(DREAM_THEMES.values()) + list(EMOTION_KEYWORDS.values()):
+        words.update(keywords)
+    return sorted(words)
+
+LEXICON_WORDS = _lexicon_words()
+
+def generate_dream(rng, min_sentences=3, max_sentences=8, keyword_ratio=0.15):
+    """Generate one dream made of several sentences"""
+    sentences = []
+    for _ in range(rng.randint(min_sentences, max_sentences)):
+        words = [rng.choice(LEXICON_WORDS) if rng.random() < keyword_ratio else rng.choice(FILLER_WORDS)
+                 for _ in range(rng.randint(6, 18))]
+        sentences.append(' '.join(words).capitalize() + rng.choice('..!?'))
+    return ' '.join(sentences)
+
+def generate_corpus(count, seed=0, **kwargs):
+    """Generate a reproducible list of dreams"""
+    rng = random.Random(seed)
+    return [generate_dream(rng, **kwargs) for _ in range(count)]
+
+def generate_lexicon(labels, words_per_label, seed=0):
+    """Generate a large user-style lexicon of made-up labels and keywords"""
+    rng = random.Random(seed)
+    lexicon = {}
+    for i in range(labels):
+        lexicon[f'label{i}'] = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+                                for _ in range(words_per_label)]
+    return lexicon
@@ -0,0 +1,80 @@
+"""
+Benchmark the sentiment time-series computations on one large user history.
+
+Times each vectorized stage and the whole summarize() call against
+straightforward pure-Python loops computing the same series.
+
+Run from the repository root:
+    python -m benchmarks.timeseries [--points 100000] [--years 5]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import sentiment_timeseries as ts
+
+def python_rolling_mean(timestamps, scores, window_days=7):
+    result = []
+    first = 0
+    total = 0.0
+    for i, (timestamp, score) in enumerate(zip(timestamps, scores)):
+        total += score
+        while timestamps[first] <= timestamp - window_days * ts.DAY:
+            total -= scores[first]
+            first += 1
+        result.append(total / (i - first + 1))
+    return result
+
+def python_ewma(scores, span=10):
+    alpha = 2 / (span + 1)
+    result = []
+    previous = scores[0]
+    for score in scores:
+        previous = alpha * score + (1 - alpha) * previous
+        result.append(previous)
+    return result
+
+def python_weekly(timestamps, scores):
+    weeks = {}
+    for timestamp, score in zip(timestamps, scores):
+        day = datetime.fromtimestamp(timestamp, timezone.utc).date()
+        weeks.setdefault(day - timedelta(days=day.weekday()), []).append(score)
+    return {week: sum(values) / len(values) for week, values in weeks.items()}
+
+def timed(func, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--years', type=float, default=5)
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+    rows = [(int(start + rng.uniform(0, args.years * 365 * ts.DAY)), rng.uniform(-1, 1))
+            for _ in range(args.points)]
+    timestamps, scores = ts.load(rows)
+    sorted_timestamps, sorted_scores = timestamps.tolist(), scores.tolist()
+    
+    print(f"{args.points} dreams over {args.years:g} years (best of 5, ms)")
+    print(f"  {'stage':16s} {'python':>9s} {'numpy':>9s}")
+    for name, python, vectorized in (
+            ('rolling mean', lambda: python_rolling_mean(sorted_timestamps, sorted_scores),
+             lambda: ts.rolling_mean(timestamps, scores)),
+            ('ewma', lambda: python_ewma(sorted_scores), lambda: ts.ewma(scores)),
+            ('weekly buckets', lambda: python_weekly(sorted_timestamps, sorted_scores),
+             lambda: ts.buckets(timestamps, scores, 'week'))):
+        print(f"  {name:16s} {timed(python):9.2f} {timed(vectorized):9.2f}")
+    print(f"  {'load (sort)':16s} {'':9s} {timed(ts.load, rows):9.2f}")
+    print(f"  {'summarize':16s} {'':9s} {timed(ts.summarize, rows):9.2f}")
+
+if __name__ == '__main__':
+    main()
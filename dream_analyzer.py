@@ -1,21 +1,360 @@
 import re
+import os
 import json
-from collections import Counter
+import asyncio
+import math
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import islice
 from datetime import datetime
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize, sent_tokenize
-from nltk.stem import WordNetLemmatizer
-import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a change to the analysis code alters its results, so cached
+# analyses from older versions are not reused
+ANALYZER_VERSION = 5
+
+# Size of the hashed feature space dreams are compared in
+FEATURE_DIM = 2 ** 16
+
+# Distinct tokens whose lemma is remembered; dream vocabularies are small, so
+# nearly every token after the first few hundred dreams is a hit
+LEMMA_CACHE_SIZE = 50000
+
+# Longer texts are analyzed in chunks of about this many characters, cut at
+# sentence ends, so time stays linear and memory bounded for any length
+CHUNK_CHARS = 5000
+
+# Where chunks are preferably cut: after a sentence end followed by whitespace
+SENTENCE_ENDS = ('. ', '! ', '? ', '.\n', '!\n', '?\n')
+
+# Most points in the sentiment arc of a chunked analysis
+ARC_SEGMENTS = 20
+
+# Analyses in flight per executor worker, unless max_concurrent is given
+SLOTS_PER_WORKER = 2
+
+# Seconds an analysis waits for a free slot before raising AnalysisBusy
+SLOT_TIMEOUT = 30
+
+# VADER's compound score normalizes the summed word valences x as
+# x / sqrt(x * x + alpha)
+VADER_ALPHA = 15
+
+# Common dream themes and symbols (default lexicon)
+DREAM_THEMES = {
+    'water': ['water', 'ocean', 'sea', 'lake', 'river', 'swimming', 'drowning', 'flood', 'rain'],
+    'flying': ['flying', 'flight', 'wings', 'soaring', 'floating', 'levitating'],
+    'falling': ['falling', 'drop', 'cliff', 'abyss', 'plummet'],
+    'death': ['death', 'dying', 'dead', 'funeral', 'grave', 'cemetery'],
+    'animals': ['dog', 'cat', 'bird', 'snake', 'spider', 'lion', 'wolf', 'bear', 'horse'],
+    'people': ['family', 'friend', 'stranger', 'crowd', 'mother', 'father', 'child'],
+    'places': ['house', 'home', 'school', 'work', 'forest', 'mountain', 'city', 'beach'],
+    'transportation': ['car', 'plane', 'train', 'bus', 'bike', 'driving', 'traveling'],
+    'nature': ['tree', 'flower', 'garden', 'forest', 'mountain', 'sun', 'moon', 'stars'],
+    'fear': ['scared', 'afraid', 'terror', 'nightmare', 'panic', 'anxiety', 'worried'],
+    'love': ['love', 'romantic', 'kiss', 'relationship', 'wedding', 'romance'],
+    'success': ['winning', 'achievement', 'success', 'victory', 'celebration', 'prize'],
+    'failure': ['failing', 'lose', 'mistake', 'embarrassment', 'shame', 'defeat']
+}
+
+# Emotion keywords (default lexicon)
+EMOTION_KEYWORDS = {
+    'joy': ['happy', 'joy', 'excited', 'elated', 'cheerful', 'delighted', 'blissful'],
+    'fear': ['scared', 'afraid', 'terrified', 'anxious', 'worried', 'nervous', 'panic'],
+    'anger': ['angry', 'mad', 'furious', 'rage', 'irritated', 'annoyed', 'frustrated'],
+    'sadness': ['sad', 'depressed', 'melancholy', 'gloomy', 'sorrowful', 'grief'],
+    'surprise': ['surprised', 'shocked', 'amazed', 'astonished', 'startled'],
+    'disgust': ['disgusted', 'revolted', 'repulsed', 'nauseated'],
+    'love': ['love', 'affection', 'caring', 'tender', 'romantic', 'passionate'],
+    'confusion': ['confused', 'puzzled', 'bewildered', 'perplexed', 'lost']
+}
+
+# What the primary theme of a dream may mean
+THEME_MEANINGS = {
+    'water': "Water in dreams often represents emotions, the unconscious mind, or life changes.",
+    'flying': "Flying dreams typically symbolize freedom, ambition, or a desire to escape limitations.",
+    'falling': "Falling dreams may indicate feelings of losing control or anxiety about failure.",
+    'death': "Death in dreams often represents transformation, endings, or new beginnings rather than literal death.",
+    'animals': "Animals in dreams can represent instincts, desires, or aspects of your personality.",
+    'people': "People in dreams often represent different aspects of yourself or your relationships.",
+    'places': "Familiar places in dreams may represent comfort zones or past experiences.",
+    'transportation': "Transportation dreams often relate to your life's journey and direction.",
+    'nature': "Nature elements in dreams typically represent growth, renewal, or connection to your natural self.",
+    'fear': "Fear-based dreams may indicate anxiety, stress, or confronting difficult emotions.",
+    'love': "Love themes in dreams often reflect your need for connection, intimacy, or self-acceptance.",
+    'success': "Success dreams may represent confidence, achievement, or aspirations.",
+    'failure': "Failure themes might indicate self-doubt, fear of disappointment, or perfectionism."
+}
+
+def generate_interpretation(emotions, themes, sentiment):
+    """Generate dream interpretation based on analysis
+    
+    Depends only on its arguments, so stored analyses can leave it out and
+    regenerate it (see analysis_codec).
+    """
+    interpretation = []
+    
+    # Sentiment interpretation
+    if sentiment['compound'] >= 0.05:
+        interpretation.append("This dream appears to have a positive overall tone, suggesting feelings of hope, joy, or satisfaction.")
+    elif sentiment['compound'] <= -0.05:
+        interpretation.append("This dream has a negative emotional tone, which may indicate stress, anxiety, or unresolved concerns.")
+    else:
+        interpretation.append("This dream has a neutral emotional tone, suggesting a balanced state of mind.")
+    
+    # Emotion interpretation
+    if emotions:
+        primary_emotion = list(emotions.keys())[0]
+        interpretation.append(f"The primary emotion in this dream is {primary_emotion}, which may reflect your current emotional state or inner conflicts.")
+    
+    # Theme interpretation
+    if themes:
+        primary_theme = list(themes.keys())[0]
+        if primary_theme in THEME_MEANINGS:
+            interpretation.append(THEME_MEANINGS[primary_theme])
+    
+    return " ".join(interpretation)
+
+def narrative_flow(sentence_count):
+    """Describe the narrative flow of a dream from its number of sentences"""
+    if sentence_count < 2:
+        return "Brief narrative"
+    elif sentence_count < 5:
+        return "Simple narrative structure"
+    else:
+        return "Complex narrative with multiple scenes"
+
+def _valence(compound):
+    # Invert VADER's normalization, recovering the summed valence behind a
+    # compound score (clamped, as +-1 would need an infinite sum)
+    compound = max(-0.9999, min(0.9999, compound))
+    return compound * math.sqrt(VADER_ALPHA / (1 - compound * compound))
+
+def merge_sentiment(scores):
+    """Combine the VADER scores of consecutive parts of a text
+    
+    `scores` holds (polarity_scores, word_count) pairs. The compound score is
+    renormalized from the summed valences of the parts, and neg, neu and pos
+    are averaged weighted by word count, which is what VADER computes for
+    the whole text up to its punctuation emphasis.
+    """
+    if len(scores) == 1:
+        return dict(scores[0][0])
+    words = sum(count for _, count in scores) or 1
+    valence = sum(_valence(score['compound']) for score, _ in scores)
+    merged = {key: round(sum(score[key] * count for score, count in scores) / words, 3)
+              for key in ('neg', 'neu', 'pos')}
+    merged['compound'] = round(valence / math.sqrt(valence * valence + VADER_ALPHA), 4)
+    return merged
+
+# Per-process analyzer used by the process executor's workers
+_worker_analyzer = None
+
+def _init_worker(dream_themes, emotion_keywords, chunk_chars):
+    """Load the NLTK components once per worker process"""
+    global _worker_analyzer
+    _worker_analyzer = DreamAnalyzer(dream_themes, emotion_keywords, chunk_chars=chunk_chars)
+    _worker_analyzer.warm_up(background=False)
+
+def _analyze_timed(texts):
+    return _worker_analyzer._analyze_timed(texts)
+
+def _worker_pid(delay):
+    # Holds the worker briefly, so the other probes reach other workers
+    time.sleep(delay)
+    return os.getpid()
+
+class AnalysisBusy(Exception):
+    """Raised when no analysis slot frees up within the timeout"""
 
 class DreamAnalyzer:
-    def __init__(self):
-        # Download required NLTK data
-        self._ensure_nltk_data()
+    def __init__(self, dream_themes=None, emotion_keywords=None, cache=None, chunk_chars=CHUNK_CHARS):
+        # Lexicons can be replaced with user-supplied ones of any size; treat
+        # them as read-only afterwards and change them with set_lexicons
+        self.dream_themes = dict(dream_themes or DREAM_THEMES)
+        self.emotion_keywords = dict(emotion_keywords or EMOTION_KEYWORDS)
+        
+        # Texts longer than this are analyzed a chunk at a time
+        self.chunk_chars = chunk_chars
+        
+        # Optional AnalysisCache, keyed on the text and this version
+        self.cache = cache
+        
+        # Optional callable receiving the {stage: seconds} of every analysis
+        self.stage_hook = None
+        self.version = self._version()
+        
+        # NLTK components are loaded on first analysis or by warm_up()
+        self.state = 'cold'
+        self.load_seconds = None
+        self.load_error = None
+        self._loaded = threading.Event()
+        self._load_lock = threading.Lock()
+        
+        # Executor behind analyze_async and analyze_in_executor, started on
+        # first use; see configure_executor
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.configure_executor()
+    
+    def _version(self):
+        # Cache version: the analyzer code and everything that shapes its output
+        lexicons = json.dumps([self.dream_themes, self.emotion_keywords, self.chunk_chars], sort_keys=True)
+        return f"{ANALYZER_VERSION}-{hashlib.sha256(lexicons.encode()).hexdigest()[:16]}"
+    
+    def set_lexicons(self, dream_themes=None, emotion_keywords=None):
+        """Replace either lexicon, so that new analyses and cache keys use it
+        
+        Restarts the executor, whose process workers hold the old lexicons.
+        Cached analyses of the old version are no longer returned; purge
+        them with AnalysisCache.purge.
+        """
+        with self._load_lock:
+            if dream_themes is not None:
+                self.dream_themes = dict(dream_themes)
+            if emotion_keywords is not None:
+                self.emotion_keywords = dict(emotion_keywords)
+            self.version = self._version()
+            if self._loaded.is_set():
+                self._keyword_index, self._phrase_index = self._build_keyword_index()
+        warmed = self.executor_state != 'cold'
+        self.shutdown_executor()
+        if warmed:
+            self.warm_up_executor()
+    
+    def warm_up(self, background=True):
+        """Load the NLTK components now instead of on the first analysis
+        
+        With background=True loading happens in a daemon thread, which is
+        returned; the analyzer can be used meanwhile and waits for it if needed.
+        """
+        if not background:
+            self._ensure_loaded()
+            return None
+        
+        def load():
+            try:
+                self._ensure_loaded()
+            except Exception:
+                logger.exception("Loading the NLTK components failed")
+        
+        thread = threading.Thread(target=load, name='analyzer-warm-up', daemon=True)
+        thread.start()
+        return thread
+    
+    def status(self):
+        """Report the warm-up state: cold, warming, ready or failed"""
+        return {
+            'state': self.state,
+            'load_seconds': self.load_seconds,
+            'error': self.load_error
+        }
+    
+    def warm_up_executor(self, background=True):
+        """Start the executor and load the NLTK components in all of its workers
+        
+        Thread workers share this analyzer, so this is warm_up. Process
+        workers load their own copy before taking any task, and are ready
+        once each of them has answered a probe. With background=True this
+        happens in a daemon thread, which is returned.
+        """
+        if self.executor_kind == 'thread':
+            return self.warm_up(background)
+        if self.executor_state == 'warming':
+            return None
+        if not background:
+            self._warm_workers()
+            return None
+        
+        def load():
+            try:
+                self._warm_workers()
+            except Exception:
+                logger.exception("Warming up the analysis executor failed")
+        
+        thread = threading.Thread(target=load, name='executor-warm-up', daemon=True)
+        thread.start()
+        return thread
+    
+    def _warm_workers(self):
+        executor = self._get_executor()
+        self.executor_state = 'warming'
+        start = time.perf_counter()
+        try:
+            pids = set()
+            while len(pids) < self.executor_workers:
+                probes = [executor.submit(_worker_pid, 0.05) for _ in range(self.executor_workers)]
+                pids.update(probe.result() for probe in probes)
+        except BrokenProcessPool as e:
+            self._executor_broken(executor, e)
+            raise
+        except Exception as e:
+            if self._executor is executor:
+                self.executor_state = 'failed'
+                self.executor_error = str(e)
+            raise
+        
+        # Unless the executor was replaced meanwhile
+        if self._executor is executor:
+            self.executor_load_seconds = time.perf_counter() - start
+            self.executor_state = 'ready'
+    
+    def executor_status(self):
+        """Report the warm-up state of the executor's workers, like status()
+        
+        Process workers are also reported ready once any of them has
+        analyzed a dream, as happens with lazy warm-up, and failed after one
+        died, until a new pool has analyzed a dream or been warmed up.
+        """
+        if self.executor_kind == 'thread':
+            return dict(self.status(), executor='thread')
+        return {
+            'state': self.executor_state,
+            'load_seconds': self.executor_load_seconds,
+            'error': self.executor_error,
+            'executor': 'process'
+        }
+    
+    def _ensure_loaded(self):
+        if self._loaded.is_set():
+            return
         
+        with self._load_lock:
+            if self._loaded.is_set():
+                return
+            
+            self.state = 'warming'
+            start = time.perf_counter()
+            try:
+                self._ensure_nltk_data()
+            except Exception as e:
+                self.state = 'failed'
+                self.load_error = str(e)
+                raise
+            
+            self.load_seconds = time.perf_counter() - start
+            self.load_error = None
+            self.state = 'ready'
+            self._loaded.set()
+    
     def _ensure_nltk_data(self):
         """Ensure all required NLTK data is downloaded"""
+        # Imported here so that importing this module stays cheap
+        import nltk
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        from nltk.corpus import stopwords
+        from nltk.tokenize import word_tokenize, sent_tokenize
+        from nltk.stem import WordNetLemmatizer
+        
         required_data = {
             'tokenizers/punkt': 'punkt',
             'corpora/stopwords': 'stopwords', 
@@ -35,59 +374,102 @@ class DreamAnalyzer:
         self.sia = SentimentIntensityAnalyzer()
         self.stop_words = set(stopwords.words('english'))
         self.lemmatizer = WordNetLemmatizer()
+        self._word_tokenize = word_tokenize
+        self._sent_tokenize = sent_tokenize
+        self._lemma = lru_cache(maxsize=LEMMA_CACHE_SIZE)(self._lemmatize_token)
         
-        # Common dream themes and symbols
-        self.dream_themes = {
-            'water': ['water', 'ocean', 'sea', 'lake', 'river', 'swimming', 'drowning', 'flood', 'rain'],
-            'flying': ['flying', 'flight', 'wings', 'soaring', 'floating', 'levitating'],
-            'falling': ['falling', 'drop', 'cliff', 'abyss', 'plummet'],
-            'death': ['death', 'dying', 'dead', 'funeral', 'grave', 'cemetery'],
-            'animals': ['dog', 'cat', 'bird', 'snake', 'spider', 'lion', 'wolf', 'bear', 'horse'],
-            'people': ['family', 'friend', 'stranger', 'crowd', 'mother', 'father', 'child'],
-            'places': ['house', 'home', 'school', 'work', 'forest', 'mountain', 'city', 'beach'],
-            'transportation': ['car', 'plane', 'train', 'bus', 'bike', 'driving', 'traveling'],
-            'nature': ['tree', 'flower', 'garden', 'forest', 'mountain', 'sun', 'moon', 'stars'],
-            'fear': ['scared', 'afraid', 'terror', 'nightmare', 'panic', 'anxiety', 'worried'],
-            'love': ['love', 'romantic', 'kiss', 'relationship', 'wedding', 'romance'],
-            'success': ['winning', 'achievement', 'success', 'victory', 'celebration', 'prize'],
-            'failure': ['failing', 'lose', 'mistake', 'embarrassment', 'shame', 'defeat']
-        }
-        
-        self.emotion_keywords = {
-            'joy': ['happy', 'joy', 'excited', 'elated', 'cheerful', 'delighted', 'blissful'],
-            'fear': ['scared', 'afraid', 'terrified', 'anxious', 'worried', 'nervous', 'panic'],
-            'anger': ['angry', 'mad', 'furious', 'rage', 'irritated', 'annoyed', 'frustrated'],
-            'sadness': ['sad', 'depressed', 'melancholy', 'gloomy', 'sorrowful', 'grief'],
-            'surprise': ['surprised', 'shocked', 'amazed', 'astonished', 'startled'],
-            'disgust': ['disgusted', 'revolted', 'repulsed', 'nauseated'],
-            'love': ['love', 'affection', 'caring', 'tender', 'romantic', 'passionate'],
-            'confusion': ['confused', 'puzzled', 'bewildered', 'perplexed', 'lost']
-        }
+        # Compile the lexicons into lookup tables
+        self._keyword_index, self._phrase_index = self._build_keyword_index()
+    
+    def _build_keyword_index(self):
+        """Build inverted indexes of lemma -> matching emotions and themes
+        
+        Returns (index, phrase_index). Single words are indexed both as
+        written and in lemmatized form, since they are matched against
+        lemmatized tokens. Keywords of several words are lemmatized like a
+        dream, dropping stopwords, and go in phrase_index under their first
+        lemma with the lemmas that must follow it. Each label carries its
+        lexicon position so ties keep the lexicon order when sorting.
+        """
+        index = {}
+        phrase_index = {}
+        
+        for kind, lexicon in (('emotion', self.emotion_keywords), ('theme', self.dream_themes)):
+            for rank, (label, keywords) in enumerate(lexicon.items()):
+                for keyword in keywords:
+                    keyword = keyword.lower()
+                    keys = {keyword, self.lemmatizer.lemmatize(keyword)}
+                    if len(keyword.split()) > 1:
+                        lemmas = [lemma for lemma in map(self._lemma, self._word_tokenize(keyword, preserve_line=True))
+                                  if lemma is not None]
+                        if len(lemmas) > 1:
+                            entries = phrase_index.setdefault(lemmas[0], [])
+                            if (tuple(lemmas[1:]), (kind, rank, label)) not in entries:
+                                entries.append((tuple(lemmas[1:]), (kind, rank, label)))
+                            continue
+                        keys = set(lemmas)
+                    for key in keys:
+                        entries = index.setdefault(key, [])
+                        if (kind, rank, label) not in entries:
+                            entries.append((kind, rank, label))
+        
+        return ({key: tuple(entries) for key, entries in index.items()},
+                {key: tuple(entries) for key, entries in phrase_index.items()})
+    
+    def analyze_dream(self, dream_text, timings=None):
+        """Comprehensive dream analysis
+        
+        If `timings` is a dict, the seconds spent in each stage are added to
+        it. Analyses served from the cache record no stages.
+        """
+        if self.cache is None:
+            return self._analyze_dream(dream_text, timings)
+        
+        key = self.cache.key(self.version, dream_text)
+        result = self.cache.get(key)
+        if result is None:
+            result = self._analyze_dream(dream_text, timings)
+            self.cache.put(key, result, self.version)
+        return result
     
-    def analyze_dream(self, dream_text):
-        """Comprehensive dream analysis"""
+    def _analyze_dream(self, dream_text, timings=None):
+        self._ensure_loaded()
+        if len(dream_text) > self.chunk_chars:
+            return self._analyze_chunked(dream_text, timings)
+        checkpoints = [('start', time.perf_counter())]
+        
         # Clean and tokenize text
         clean_text = self._clean_text(dream_text)
-        tokens = word_tokenize(clean_text.lower())
+        checkpoints.append(('clean', time.perf_counter()))
+        sentences, tokens, word_count = self._tokenize(clean_text)
+        checkpoints.append(('tokenize', time.perf_counter()))
         
         # Remove stopwords and lemmatize
-        filtered_tokens = [self.lemmatizer.lemmatize(token) for token in tokens 
-                          if token not in self.stop_words and token.isalpha()]
+        filtered_tokens = [lemma for lemma in map(self._lemma, tokens) if lemma is not None]
+        checkpoints.append(('lemmatize', time.perf_counter()))
         
         # Analyze sentiment
         sentiment = self.sia.polarity_scores(dream_text)
+        checkpoints.append(('sentiment', time.perf_counter()))
         
-        # Identify emotions
-        emotions = self._identify_emotions(dream_text, filtered_tokens)
-        
-        # Identify themes
-        themes = self._identify_themes(filtered_tokens)
+        # Identify emotions and themes in a single pass
+        emotions, themes = self._identify_keywords(filtered_tokens, self._match_phrases(filtered_tokens))
+        checkpoints.append(('keywords', time.perf_counter()))
         
         # Generate interpretation
         interpretation = self._generate_interpretation(emotions, themes, sentiment)
+        checkpoints.append(('interpretation', time.perf_counter()))
         
         # Analyze dream structure
-        structure = self._analyze_dream_structure(dream_text)
+        structure = self._analyze_dream_structure(len(sentences), word_count)
+        checkpoints.append(('structure', time.perf_counter()))
+        
+        features = self._hash_features(filtered_tokens)
+        checkpoints.append(('features', time.perf_counter()))
+        
+        if timings is not None or self.stage_hook is not None:
+            self._record_stages({stage: finished - started for (_, started), (stage, finished)
+                                 in zip(checkpoints, checkpoints[1:])}, timings)
         
         return {
             'sentiment': sentiment,
@@ -97,98 +479,409 @@ class DreamAnalyzer:
             'structure': structure,
             'word_count': len(tokens),
             'unique_words': len(set(filtered_tokens)),
+            'features': features,
+            'analyzed_at': datetime.now().isoformat()
+        }
+    
+    def _analyze_chunked(self, dream_text, timings=None):
+        """Analyze a long text one chunk of sentences at a time
+        
+        Each chunk is cleaned, tokenized and scored on its own and only lemma
+        counts and per-chunk sentiment scores are kept, so memory is bounded by
+        the chunk size and the vocabulary, and VADER never sees more than one
+        chunk. The result has the shape of a
+        whole-text analysis plus a `sentiment_arc`: compound scores of up to
+        ARC_SEGMENTS consecutive segments, from the start of the text to its
+        end.
+        """
+        stages = dict.fromkeys(('clean', 'tokenize', 'lemmatize', 'sentiment'), 0.0)
+        lemma_counts = Counter()
+        phrase_matches = Counter()
+        scores = []
+        sentence_count = word_count = token_count = 0
+        
+        for chunk in self._chunks(dream_text):
+            started = time.perf_counter()
+            chunk = self._clean_text(chunk)
+            cleaned = time.perf_counter()
+            sentences, tokens, chunk_words = self._tokenize(chunk)
+            tokenized = time.perf_counter()
+            lemmas = [lemma for lemma in map(self._lemma, tokens) if lemma is not None]
+            lemma_counts.update(lemmas)
+            # Phrases need the lemmas in order, so they are matched chunk by chunk
+            phrase_matches.update(self._match_phrases(lemmas))
+            lemmatized = time.perf_counter()
+            scores.append((self.sia.polarity_scores(chunk), chunk_words))
+            stages['clean'] += cleaned - started
+            stages['tokenize'] += tokenized - cleaned
+            stages['lemmatize'] += lemmatized - tokenized
+            stages['sentiment'] += time.perf_counter() - lemmatized
+            sentence_count += len(sentences)
+            word_count += chunk_words
+            token_count += len(tokens)
+        
+        checkpoints = [('start', time.perf_counter())]
+        sentiment = merge_sentiment(scores)
+        segments = min(len(scores), ARC_SEGMENTS)
+        arc = [merge_sentiment(scores[i * len(scores) // segments:(i + 1) * len(scores) // segments])['compound']
+               for i in range(segments)]
+        checkpoints.append(('sentiment', time.perf_counter()))
+        
+        # Single-word matches and features only depend on how often each lemma occurs
+        emotions, themes = self._identify_keywords(lemma_counts.elements(), phrase_matches)
+        checkpoints.append(('keywords', time.perf_counter()))
+        interpretation = self._generate_interpretation(emotions, themes, sentiment)
+        checkpoints.append(('interpretation', time.perf_counter()))
+        structure = self._analyze_dream_structure(sentence_count, word_count)
+        checkpoints.append(('structure', time.perf_counter()))
+        features = self._hash_features(lemma_counts.elements())
+        checkpoints.append(('features', time.perf_counter()))
+        
+        if timings is not None or self.stage_hook is not None:
+            for (_, started), (stage, finished) in zip(checkpoints, checkpoints[1:]):
+                stages[stage] = stages.get(stage, 0.0) + finished - started
+            self._record_stages(stages, timings)
+        
+        return {
+            'sentiment': sentiment,
+            'sentiment_arc': arc,
+            'emotions': emotions,
+            'themes': themes,
+            'interpretation': interpretation,
+            'structure': structure,
+            'word_count': token_count,
+            'unique_words': len(lemma_counts),
+            'features': features,
             'analyzed_at': datetime.now().isoformat()
         }
     
+    def _chunks(self, text):
+        """Split text into pieces of at most chunk_chars, at the last sentence end (or space) that fits"""
+        start = 0
+        while len(text) - start > self.chunk_chars:
+            end = start + self.chunk_chars
+            cut = max(text.rfind(mark, start, end) for mark in SENTENCE_ENDS) + 1
+            if cut <= start:
+                cut = max(text.rfind(' ', start, end), text.rfind('\n', start, end))
+            if cut <= start:
+                cut = end
+            yield text[start:cut]
+            start = cut
+        yield text[start:]
+    
+    def _record_stages(self, stages, timings):
+        """Report the {stage: seconds} of one analysis to the stage hook and `timings`"""
+        if self.stage_hook is not None:
+            self.stage_hook(stages)
+        if timings is not None:
+            for stage, seconds in stages.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+    
+    def lemma_cache_info(self):
+        """Hits, misses and size of the lemma cache"""
+        self._ensure_loaded()
+        return self._lemma.cache_info()
+    
+    def analyze_many(self, texts, chunksize=64, timeout=SLOT_TIMEOUT):
+        """Analyze many dreams on the executor, yielding results in input order
+        
+        Dreams are sent in batches of `chunksize`, each holding a slot of the
+        shared executor like any other analysis, so large imports count
+        against max_concurrent too and wait for a slot when it is busy. At
+        most one batch per worker is in flight, so `texts` can be an
+        arbitrarily long iterator. Cached analyses are served from this
+        process and only misses are sent to the executor. Raises
+        AnalysisBusy if a slot does not free up within `timeout` seconds
+        while none of these batches is in flight.
+        """
+        texts = iter(texts)
+        pending = deque()
+        batch = self._next_batch(texts, chunksize)
+        while batch is not None or pending:
+            if batch is not None and len(pending) < self.executor_workers:
+                keys, results, misses = batch
+                if not misses:
+                    pending.append((batch, None))
+                    batch = self._next_batch(texts, chunksize)
+                    continue
+                # Wait for a slot only when none of our batches is in flight
+                slots = self._slots
+                if slots.acquire(blocking=not pending, timeout=None if pending else timeout):
+                    pending.append((batch, self._dispatch([text for _, text in misses], slots)))
+                    batch = self._next_batch(texts, chunksize)
+                    continue
+                if not pending:
+                    raise AnalysisBusy(f'No analysis slot freed up within {timeout} seconds')
+            
+            (keys, results, misses), future = pending.popleft()
+            if future is not None:
+                for (i, _), (analysis, stages) in zip(misses, future.result()):
+                    self._finish(keys[i], analysis, stages)
+                    results[i] = analysis
+            yield from results
+    
+    def _next_batch(self, texts, chunksize):
+        """Read a batch and look it up in the cache
+        
+        Returns (keys, results, misses), where misses holds the (index, text)
+        of every dream results has None for, or None once `texts` is done.
+        """
+        batch = list(islice(texts, chunksize))
+        if not batch:
+            return None
+        keys, results = self._lookup(batch)
+        return keys, results, [(i, text) for i, (text, result) in enumerate(zip(batch, results)) if result is None]
+    
+    def configure_executor(self, kind='thread', workers=None, max_concurrent=None):
+        """Choose the executor behind analyze_async, analyze_many_async and analyze_in_executor
+        
+        'thread' analyzes in this process, where analyses hold the GIL while
+        they run; 'process' uses worker processes that load the NLTK
+        components once each, leaving this process' threads free to serve
+        requests. At most `max_concurrent` batches (by default SLOTS_PER_WORKER
+        per worker) are submitted at a time and further callers wait for a
+        slot. Call before the first analysis that uses it.
+        """
+        if kind not in ('thread', 'process'):
+            raise ValueError(f'Unknown executor kind: {kind!r}')
+        self.shutdown_executor()
+        self.executor_kind = kind
+        self.executor_workers = workers or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or self.executor_workers * SLOTS_PER_WORKER
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+    
+    def shutdown_executor(self, wait=True):
+        """Stop the executor; it is started again by the next analysis that needs it"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+            # Process workers load the NLTK components anew
+            self.executor_state = 'cold'
+            self.executor_load_seconds = None
+            self.executor_error = None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+    
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                if self.executor_kind == 'process':
+                    # Workers start from a fresh interpreter rather than a
+                    # fork of this process, whose threads may hold locks
+                    methods = multiprocessing.get_all_start_methods()
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.executor_workers, initializer=_init_worker,
+                        initargs=(self.dream_themes, self.emotion_keywords, self.chunk_chars),
+                        mp_context=multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn'))
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.executor_workers,
+                                                        thread_name_prefix='analysis')
+            return self._executor
+    
+    def _analyze_timed(self, texts):
+        """(analysis, {stage: seconds}) pairs, as computed by an executor worker"""
+        results = []
+        for text in texts:
+            stages = {}
+            results.append((self._analyze_dream(text, stages), stages))
+        return results
+    
+    def _lookup(self, texts):
+        """Cache keys (or None) and cached analyses, None for every miss"""
+        if self.cache is None:
+            return [None] * len(texts), [None] * len(texts)
+        keys = [self.cache.key(self.version, text) for text in texts]
+        return keys, [self.cache.get(key) for key in keys]
+    
+    def _dispatch(self, texts, slots):
+        """Submit a batch holding a slot of `slots`, which is released when it finishes"""
+        task = _analyze_timed if self.executor_kind == 'process' else self._analyze_timed
+        try:
+            executor = self._get_executor()
+            future = executor.submit(task, texts)
+        except BrokenProcessPool as e:
+            slots.release()
+            self._executor_broken(executor, e)
+            raise
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        future.add_done_callback(lambda done: self._worker_done(executor, done))
+        return future
+    
+    def _worker_done(self, executor, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._executor_broken(executor, error)
+        # A worker that analyzed a batch has loaded the NLTK components
+        elif error is None and self.executor_state in ('cold', 'failed') and self._executor is executor:
+            self.executor_state = 'ready'
+    
+    def _executor_broken(self, executor, error):
+        """Drop a process pool that lost a worker, so the next analysis starts a new one"""
+        with self._executor_lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.executor_state = 'failed'
+            self.executor_error = str(error)
+        logger.error("An analysis worker died, restarting the executor on next use: %s", error)
+        executor.shutdown(wait=False)
+    
+    def _finish(self, key, analysis, stages, timings=None):
+        """Cache an analysis made on the executor and report its stages"""
+        if key is not None:
+            self.cache.put(key, analysis, self.version)
+        # Thread workers already called the hook from _analyze_dream
+        if self.executor_kind == 'process' and self.stage_hook is not None:
+            self.stage_hook(stages)
+        if timings is not None:
+            for stage, seconds in stages.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+    
+    def analyze_in_executor(self, dream_text, timings=None, timeout=SLOT_TIMEOUT):
+        """Like analyze_dream, but on the executor
+        
+        Raises AnalysisBusy if no slot frees up within `timeout` seconds.
+        """
+        keys, results = self._lookup([dream_text])
+        if results[0] is not None:
+            return results[0]
+        
+        slots = self._slots
+        if not slots.acquire(timeout=timeout):
+            raise AnalysisBusy(f'No analysis slot freed up within {timeout} seconds')
+        [(analysis, stages)] = self._dispatch([dream_text], slots).result()
+        self._finish(keys[0], analysis, stages, timings)
+        return analysis
+    
+    async def analyze_async(self, dream_text, timeout=SLOT_TIMEOUT):
+        """Analyze a dream on the executor without blocking the event loop
+        
+        Raises AnalysisBusy if no slot frees up within `timeout` seconds.
+        """
+        return (await self.analyze_many_async([dream_text], timeout=timeout))[0]
+    
+    async def analyze_many_async(self, texts, chunksize=64, timeout=SLOT_TIMEOUT):
+        """Analyze dreams on the executor in batches of `chunksize`, returning analyses in input order
+        
+        Every batch takes a slot, so a large request waits its turn instead
+        of flooding the executor. Cached analyses need none. Raises
+        AnalysisBusy if a slot does not free up within `timeout` seconds.
+        """
+        texts = list(texts)
+        keys, results = self._lookup(texts)
+        misses = [i for i, result in enumerate(results) if result is None]
+        
+        batches = []
+        for start in range(0, len(misses), chunksize):
+            indexes = misses[start:start + chunksize]
+            slots = self._slots
+            await self._acquire_async(slots, timeout)
+            batches.append((indexes, asyncio.wrap_future(self._dispatch([texts[i] for i in indexes], slots))))
+        
+        for indexes, future in batches:
+            for i, (analysis, stages) in zip(indexes, await future):
+                self._finish(keys[i], analysis, stages)
+                results[i] = analysis
+        return results
+    
+    async def _acquire_async(self, slots, timeout):
+        if slots.acquire(blocking=False):
+            return
+        # Wait on a helper thread, so the event loop keeps running
+        waiter = asyncio.ensure_future(asyncio.to_thread(slots.acquire, timeout=timeout))
+        try:
+            acquired = await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # Give back the slot if the helper thread still gets one
+            waiter.add_done_callback(lambda done: not done.cancelled() and done.result() and slots.release())
+            raise
+        if not acquired:
+            raise AnalysisBusy(f'No analysis slot freed up within {timeout} seconds')
+    
     def _clean_text(self, text):
         """Clean and normalize text"""
         # Remove extra whitespace and normalize
         text = re.sub(r'\s+', ' ', text).strip()
         return text
     
-    def _identify_emotions(self, text, tokens):
-        """Identify emotions in the dream"""
-        emotions = {}
-        text_lower = text.lower()
-        
-        for emotion, keywords in self.emotion_keywords.items():
-            count = sum(1 for keyword in keywords if keyword in text_lower)
-            if count > 0:
-                emotions[emotion] = count
-        
-        # Sort by frequency
-        return dict(sorted(emotions.items(), key=lambda x: x[1], reverse=True))
+    def _tokenize(self, text):
+        """Split text into sentences, lowercase word tokens and a word count in one pass
+        
+        Sentences are split once and each is word-tokenized on its own, which
+        is what word_tokenize does internally for a whole text.
+        """
+        sentences = self._sent_tokenize(text)
+        tokens = [token for sentence in sentences
+                  for token in self._word_tokenize(sentence.lower(), preserve_line=True)]
+        return sentences, tokens, len(text.split())
     
-    def _identify_themes(self, tokens):
-        """Identify themes and symbols in the dream"""
-        themes = {}
-        
-        for theme, keywords in self.dream_themes.items():
-            count = sum(1 for token in tokens if token in keywords)
-            if count > 0:
-                themes[theme] = count
-        
-        return dict(sorted(themes.items(), key=lambda x: x[1], reverse=True))
+    def _lemmatize_token(self, token):
+        """Lemma of a lowercase token, or None for stopwords and non-words"""
+        if token in self.stop_words or not token.isalpha():
+            return None
+        return self.lemmatizer.lemmatize(token)
+    
+    def _hash_features(self, tokens):
+        """Hash lemma counts into a sparse vector, used to find similar dreams"""
+        counts = {}
+        for token in tokens:
+            column = zlib.crc32(token.encode()) & (FEATURE_DIM - 1)
+            counts[column] = counts.get(column, 0) + 1
+        return {'columns': list(counts), 'counts': list(counts.values())}
+    
+    def _match_phrases(self, lemmas):
+        """Count the multi-word keywords found in a list of lemmas, in text order"""
+        matches = Counter()
+        if not self._phrase_index:
+            return matches
+        for i, lemma in enumerate(lemmas):
+            for rest, entry in self._phrase_index.get(lemma, ()):
+                if tuple(lemmas[i + 1:i + 1 + len(rest)]) == rest:
+                    matches[entry] += 1
+        return matches
+    
+    def _identify_keywords(self, tokens, phrase_matches=None):
+        """Identify emotions and themes in the dream with one pass over the tokens
+        
+        `phrase_matches` holds the multi-word keyword counts from _match_phrases.
+        """
+        emotion_counts = {}
+        theme_counts = {}
+        
+        for token in tokens:
+            for kind, rank, label in self._keyword_index.get(token, ()):
+                counts = emotion_counts if kind == 'emotion' else theme_counts
+                counts[(rank, label)] = counts.get((rank, label), 0) + 1
+        for (kind, rank, label), count in (phrase_matches or {}).items():
+            counts = emotion_counts if kind == 'emotion' else theme_counts
+            counts[(rank, label)] = counts.get((rank, label), 0) + count
+        
+        # Sort by frequency, keeping lexicon order for ties
+        def by_frequency(counts):
+            ordered = sorted(counts.items(), key=lambda x: (-x[1], x[0][0]))
+            return {label: count for (rank, label), count in ordered}
+        
+        return by_frequency(emotion_counts), by_frequency(theme_counts)
     
     def _generate_interpretation(self, emotions, themes, sentiment):
         """Generate dream interpretation based on analysis"""
-        interpretation = []
-        
-        # Sentiment interpretation
-        if sentiment['compound'] >= 0.05:
-            interpretation.append("This dream appears to have a positive overall tone, suggesting feelings of hope, joy, or satisfaction.")
-        elif sentiment['compound'] <= -0.05:
-            interpretation.append("This dream has a negative emotional tone, which may indicate stress, anxiety, or unresolved concerns.")
-        else:
-            interpretation.append("This dream has a neutral emotional tone, suggesting a balanced state of mind.")
-        
-        # Emotion interpretation
-        if emotions:
-            primary_emotion = list(emotions.keys())[0]
-            interpretation.append(f"The primary emotion in this dream is {primary_emotion}, which may reflect your current emotional state or inner conflicts.")
-        
-        # Theme interpretation
-        if themes:
-            primary_theme = list(themes.keys())[0]
-            theme_meanings = {
-                'water': "Water in dreams often represents emotions, the unconscious mind, or life changes.",
-                'flying': "Flying dreams typically symbolize freedom, ambition, or a desire to escape limitations.",
-                'falling': "Falling dreams may indicate feelings of losing control or anxiety about failure.",
-                'death': "Death in dreams often represents transformation, endings, or new beginnings rather than literal death.",
-                'animals': "Animals in dreams can represent instincts, desires, or aspects of your personality.",
-                'people': "People in dreams often represent different aspects of yourself or your relationships.",
-                'places': "Familiar places in dreams may represent comfort zones or past experiences.",
-                'transportation': "Transportation dreams often relate to your life's journey and direction.",
-                'nature': "Nature elements in dreams typically represent growth, renewal, or connection to your natural self.",
-                'fear': "Fear-based dreams may indicate anxiety, stress, or confronting difficult emotions.",
-                'love': "Love themes in dreams often reflect your need for connection, intimacy, or self-acceptance.",
-                'success': "Success dreams may represent confidence, achievement, or aspirations.",
-                'failure': "Failure themes might indicate self-doubt, fear of disappointment, or perfectionism."
-            }
-            
-            if primary_theme in theme_meanings:
-                interpretation.append(theme_meanings[primary_theme])
-        
-        return " ".join(interpretation)
+        return generate_interpretation(emotions, themes, sentiment)
     
-    def _analyze_dream_structure(self, text):
+    def _analyze_dream_structure(self, sentence_count, word_count):
         """Analyze the structure and narrative of the dream"""
-        sentences = sent_tokenize(text)
-        
         return {
-            'sentence_count': len(sentences),
-            'avg_sentence_length': len(text.split()) / len(sentences) if sentences else 0,
-            'narrative_flow': self._analyze_narrative_flow(sentences)
+            'sentence_count': sentence_count,
+            'avg_sentence_length': word_count / sentence_count if sentence_count else 0,
+            'narrative_flow': self._analyze_narrative_flow(sentence_count)
         }
     
-    def _analyze_narrative_flow(self, sentences):
+    def _analyze_narrative_flow(self, sentence_count):
         """Analyze the narrative flow of the dream"""
-        if len(sentences) < 2:
-            return "Brief narrative"
-        elif len(sentences) < 5:
-            return "Simple narrative structure"
-        else:
-            return "Complex narrative with multiple scenes"
+        return narrative_flow(sentence_count)
     
     def generate_insights(self, dreams_data):
         """Generate insights from multiple dreams"""
@@ -212,28 +905,53 @@ class DreamAnalyzer:
                 except (json.JSONDecodeError, KeyError):
                     continue
         
+        return self.summarize_insights(
+            total_dreams=len(dreams_data),
+            emotion_counts=Counter(all_emotions),
+            theme_counts=Counter(all_themes),
+            sentiment_sum=sum(sentiment_scores),
+            sentiment_count=len(sentiment_scores),
+            newest_sentiments=sentiment_scores[:5],
+            oldest_sentiments=sentiment_scores[-5:]
+        )
+    
+    def summarize_insights(self, total_dreams, emotion_counts, theme_counts, sentiment_sum,
+                           sentiment_count, newest_sentiments, oldest_sentiments):
+        """Generate insights from per-user aggregates
+        
+        Counts are the number of dreams each emotion/theme appears in. The
+        sentiment windows hold the compound scores of the five newest and five
+        oldest dreams, either as plain scores or [date_recorded, score] pairs.
+        """
+        if not total_dreams:
+            return {'message': 'No dreams to analyze yet. Start by adding some dreams!'}
+        
+        newest = [entry[-1] if isinstance(entry, (list, tuple)) else entry for entry in newest_sentiments]
+        oldest = [entry[-1] if isinstance(entry, (list, tuple)) else entry for entry in oldest_sentiments]
+        
         # Calculate insights
-        emotion_frequency = Counter(all_emotions)
-        theme_frequency = Counter(all_themes)
+        emotion_frequency = Counter(emotion_counts)
+        theme_frequency = Counter(theme_counts)
         
         insights = {
-            'total_dreams': len(dreams_data),
+            'total_dreams': total_dreams,
             'most_common_emotions': dict(emotion_frequency.most_common(5)),
             'most_common_themes': dict(theme_frequency.most_common(5)),
-            'average_sentiment': np.mean(sentiment_scores) if sentiment_scores else 0,
-            'emotional_trend': self._analyze_emotional_trend(sentiment_scores),
+            'average_sentiment': sentiment_sum / sentiment_count if sentiment_count else 0,
+            'emotional_trend': self._analyze_emotional_trend(sentiment_sum, sentiment_count, newest, oldest),
             'recommendations': self._generate_recommendations(emotion_frequency, theme_frequency)
         }
         
         return insights
     
-    def _analyze_emotional_trend(self, sentiment_scores):
+    def _analyze_emotional_trend(self, sentiment_sum, sentiment_count, newest, oldest):
         """Analyze emotional trend over time"""
-        if len(sentiment_scores) < 2:
+        if sentiment_count < 2:
             return "Insufficient data for trend analysis"
         
-        recent_avg = np.mean(sentiment_scores[:5]) if len(sentiment_scores) >= 5 else np.mean(sentiment_scores)
-        older_avg = np.mean(sentiment_scores[-5:]) if len(sentiment_scores) >= 10 else np.mean(sentiment_scores)
+        overall_avg = sentiment_sum / sentiment_count
+        recent_avg = sum(newest) / len(newest) if sentiment_count >= 5 else overall_avg
+        older_avg = sum(oldest) / len(oldest) if sentiment_count >= 10 else overall_avg
         
         if recent_avg > older_avg + 0.1:
             return "Emotional tone improving over time"
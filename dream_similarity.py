@@ -0,0 +1,182 @@
+"""
+Dream similarity index.
+
+Each user's dreams are kept in memory as a sparse matrix of the hashed lemma
+counts computed by the analyzer (CSR: `indptr`, `indices` and `values` NumPy
+arrays), weighted by TF-IDF at query time so the weights follow the user's
+growing journal. The index is loaded from the dream_features table on first
+use and then catches up with newly analyzed dreams before every query, so
+inserts only ever append.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import repository
+from dream_analyzer import FEATURE_DIM
+
+# Users whose index is kept in memory
+MAX_USERS = 32
+
+class UserVectors:
+    """The hashed term vectors of one user's dreams"""
+    
+    def __init__(self):
+        self.sequence = 0
+        self.dream_ids = np.empty(0, dtype=np.int64)
+        self.live = np.empty(0, dtype=bool)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.values = np.empty(0, dtype=np.float32)
+        self.document_frequency = np.zeros(FEATURE_DIM, dtype=np.int32)
+        self.rows = {}
+        self._weights = None
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def append(self, entries):
+        """Add (sequence, dream_id, columns, counts) entries; a repeated dream replaces its old row"""
+        # Blobs are joined and decoded once
+        dream_ids, columns, counts, lengths = [], [], [], []
+        for sequence, dream_id, column_blob, count_blob in entries:
+            self.sequence = max(self.sequence, sequence)
+            if not column_blob:
+                continue
+            dream_ids.append(dream_id)
+            columns.append(column_blob)
+            counts.append(count_blob)
+            lengths.append(len(column_blob) // 4)
+        if not dream_ids:
+            return
+        
+        # Retire rows of dreams that were analyzed again
+        for dream_id in dream_ids:
+            row = self.rows.get(dream_id)
+            if row is not None and self.live[row]:
+                self.live[row] = False
+                start, end = self.indptr[row], self.indptr[row + 1]
+                np.subtract.at(self.document_frequency, self.indices[start:end], 1)
+        
+        first_row = len(self.dream_ids)
+        new_indices = np.frombuffer(b''.join(columns), dtype=np.int32)
+        self.dream_ids = np.append(self.dream_ids, dream_ids)
+        self.live = np.append(self.live, np.ones(len(dream_ids), dtype=bool))
+        self.indptr = np.append(self.indptr, self.indptr[-1] + np.cumsum(lengths))
+        self.indices = np.append(self.indices, new_indices)
+        # Sublinear term frequency
+        new_counts = np.frombuffer(b''.join(counts), dtype=np.int32).astype(np.float32)
+        self.values = np.append(self.values, 1 + np.log(new_counts))
+        np.add.at(self.document_frequency, new_indices, 1)
+        for offset, dream_id in enumerate(dream_ids):
+            self.rows[dream_id] = first_row + offset
+        self._weights = None
+    
+    def weights(self):
+        """TF-IDF weights of every stored value and the norm of every row"""
+        if self._weights is None:
+            idf = np.log((1 + len(self)) / (1 + self.document_frequency)).astype(np.float32) + 1
+            weighted = self.values * idf[self.indices]
+            norms = np.sqrt(np.add.reduceat(weighted * weighted, self.indptr[:-1]))
+            self._weights = weighted, norms
+        return self._weights
+    
+    def scores(self, row):
+        """Cosine similarity of one row against every row, in one vectorized pass"""
+        weighted, norms = self.weights()
+        start, end = self.indptr[row], self.indptr[row + 1]
+        query = np.zeros(FEATURE_DIM, dtype=np.float32)
+        query[self.indices[start:end]] = weighted[start:end]
+        dots = np.add.reduceat(weighted * query[self.indices], self.indptr[:-1])
+        scores = dots / (norms * norms[row])
+        scores[~self.live] = -1
+        return scores
+    
+    def similarity_matrix(self, rows):
+        """Exact pairwise cosine similarities between a few rows"""
+        weighted, norms = self.weights()
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        positions = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        row_numbers = np.repeat(np.arange(len(rows)), ends - starts)
+        
+        # Densify over just the columns these rows use
+        columns, compact = np.unique(self.indices[positions], return_inverse=True)
+        matrix = np.zeros((len(rows), len(columns)), dtype=np.float32)
+        matrix[row_numbers, compact] = weighted[positions] / norms[rows][row_numbers]
+        return matrix @ matrix.T
+
+class SimilarityIndex:
+    def __init__(self, max_users=MAX_USERS):
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _vectors(self, db, user_id):
+        # Must hold self._lock
+        vectors = self._users.get(user_id)
+        if vectors is None:
+            vectors = self._users[user_id] = UserVectors()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        vectors.append(repository.iter_dream_features(db, user_id, after=vectors.sequence))
+        return vectors
+    
+    def similar(self, db, user_id, dream_id, k=5):
+        """Return up to k (dream_id, score) pairs most similar to a dream, best first
+        
+        Returns None if the dream has not been analyzed.
+        """
+        with self._lock:
+            vectors = self._vectors(db, user_id)
+            row = vectors.rows.get(dream_id)
+            if row is None:
+                return None
+            scores = vectors.scores(row)
+            dream_ids = vectors.dream_ids
+        
+        scores[row] = -1
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(dream_ids[i]), round(float(scores[i]), 4)) for i in top if scores[i] > 0]
+    
+    def recurring(self, db, user_id, window=500, threshold=0.5, min_size=3):
+        """Find groups of similar dreams among a user's `window` most recently analyzed
+        
+        Dreams are linked when their cosine similarity reaches `threshold`, and
+        every connected group of at least `min_size` dreams is returned as
+        {'dream_ids': [...], 'similarity': average pairwise similarity},
+        largest group first.
+        """
+        with self._lock:
+            vectors = self._vectors(db, user_id)
+            rows = np.flatnonzero(vectors.live)[-window:]
+            if len(rows) < min_size:
+                return []
+            similarity = vectors.similarity_matrix(rows)
+            dream_ids = vectors.dream_ids[rows]
+        
+        # Connected components by propagating the smallest label to neighbors
+        linked = similarity >= threshold
+        labels = np.arange(len(rows))
+        while True:
+            spread = np.where(linked, labels[None, :], len(rows)).min(axis=1)
+            if np.array_equal(spread, labels):
+                break
+            labels = spread
+        
+        clusters = []
+        for label, size in zip(*np.unique(labels, return_counts=True)):
+            if size < min_size:
+                continue
+            members = np.flatnonzero(labels == label)
+            pairs = similarity[np.ix_(members, members)]
+            average = (pairs.sum() - size) / (size * (size - 1))
+            clusters.append({'dream_ids': dream_ids[members].tolist(), 'similarity': round(float(average), 4)})
+        clusters.sort(key=lambda cluster: (-len(cluster['dream_ids']), -cluster['similarity']))
+        return clusters
@@ -0,0 +1,156 @@
+"""
+Streaming export and import of a user's dream journal.
+
+Exports are generated a page of dreams at a time, and imports are parsed
+from the request stream one record at a time, analyzed through a single
+DreamAnalyzer.analyze_many pipeline on the analyzer's shared executor and
+committed in batches, so memory use does not grow with the size of the
+journal. Both NDJSON (one JSON object per
+line) and CSV with a header row are supported.
+"""
+
+import csv
+import io
+import json
+from collections import deque
+from datetime import datetime, timezone
+
+import repository
+from dream_analyzer import AnalysisBusy
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# Dreams saved per transaction during an import
+IMPORT_BATCH_SIZE = 500
+
+class InvalidImport(ValueError):
+    """Raised for a malformed record; `imported` dreams before it were saved"""
+
+    def __init__(self, message, imported=0):
+        super().__init__(message)
+        self.imported = imported
+
+def export_ndjson(db, user_id):
+    """Yield a user's dreams as NDJSON text, a page at a time"""
+    for page in repository.export_dreams_json(db, user_id):
+        yield '\n'.join(page) + '\n'
+
+def export_csv(db, user_id):
+    """Yield a user's dreams as CSV text with a header row, a page at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(repository.EXPORT_CSV_COLUMNS)
+    for page in repository.export_dreams_rows(db, user_id):
+        writer.writerows(page)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def parse_timestamp(value):
+    """Normalize an ISO timestamp to the stored date_recorded format, in UTC
+
+    Raises ValueError for anything else.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError('date_recorded must be an ISO timestamp such as 2024-03-01 07:30:00')
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+def _records(stream, format):
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if format == 'csv':
+        yield from csv.DictReader(text)
+        return
+
+    for line in text:
+        if line.strip():
+            yield json.loads(line)
+
+def read_dreams(stream, format='ndjson', max_length=None):
+    """Parse an uploaded journal incrementally into (title, content, date_recorded) tuples
+
+    Extra fields, such as those of an export, are ignored. Raises
+    InvalidImport for the first record that cannot be read or whose content
+    is longer than `max_length` characters.
+    """
+    if format not in FORMATS:
+        raise InvalidImport(f'Unknown format: {format!r}')
+
+    records = _records(stream, format)
+    number = 0
+    while True:
+        number += 1
+        try:
+            record = next(records, None)
+        except (UnicodeDecodeError, ValueError, csv.Error) as e:
+            raise InvalidImport(f'Record {number}: {e}') from e
+        if record is None:
+            return
+
+        if not isinstance(record, dict) or not record.get('title') or not record.get('content'):
+            raise InvalidImport(f'Record {number}: each dream needs a title and content')
+        if not isinstance(record['title'], str) or not isinstance(record['content'], str):
+            raise InvalidImport(f'Record {number}: dream titles and contents must be strings')
+        if max_length is not None and len(record['content']) > max_length:
+            raise InvalidImport(f'Record {number}: content is longer than {max_length} characters')
+        try:
+            date_recorded = parse_timestamp(record['date_recorded']) if record.get('date_recorded') else None
+        except ValueError as e:
+            raise InvalidImport(f'Record {number}: {e}') from e
+        yield record['title'], record['content'], date_recorded
+
+def import_dreams(db, analyzer, user_id, dreams, batch_size=IMPORT_BATCH_SIZE):
+    """Analyze and save (title, content, date_recorded) tuples, returning how many were saved
+
+    Dreams stream through one analyze_many pipeline, which waits for free
+    slots of the analyzer's executor, and are committed `batch_size` at a
+    time. If `dreams` raises InvalidImport, or the executor stays busy
+    (AnalysisBusy), every dream before that point is still saved and the
+    error is re-raised with its `imported` count.
+    """
+    failures = []
+
+    def valid(dreams):
+        try:
+            yield from dreams
+        except InvalidImport as e:
+            failures.append(e)
+
+    dreams = valid(dreams)
+
+    # analyze_many reads ahead, so the tuples wait here until their analysis
+    # comes back, in the same order
+    pending = deque()
+
+    def contents():
+        for dream in dreams:
+            pending.append(dream)
+            yield dream[1]
+
+    imported = 0
+    batch = []
+    try:
+        for analysis in analyzer.analyze_many(contents()):
+            title, content, date_recorded = pending.popleft()
+            batch.append((title, content, date_recorded, analysis))
+            if len(batch) >= batch_size:
+                repository.add_dreams(db, user_id, batch)
+                imported += len(batch)
+                batch = []
+    except AnalysisBusy as e:
+        failures.insert(0, e)
+    if batch:
+        repository.add_dreams(db, user_id, batch)
+        imported += len(batch)
+
+    if failures:
+        failures[0].imported = imported
+        raise failures[0]
+    return imported
@@ -0,0 +1,279 @@
+"""
+Opt-in Prometheus metrics.
+
+Counters and latency histograms are kept in process memory and rendered in
+the Prometheus text exposition format by `/metrics`. Nothing here is
+installed unless METRICS_ENABLED is set: the analyzer has no stage hook, the
+connection pool opens plain sqlite3 connections and no request hooks are
+registered, so a disabled app pays nothing for it.
+
+Database time is measured by TimedConnection, a sqlite3.Connection whose
+cursors add the time spent executing and fetching to a per-thread total that
+the request hooks attribute to the route.
+"""
+
+import bisect
+import sqlite3
+import threading
+import time
+
+# Upper bounds in seconds, from a cached lookup to a slow analysis
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    """A monotonically increasing count per label combination"""
+    
+    kind = 'counter'
+    
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{_format_labels(self.labels, labels)} {value}'
+
+class Histogram:
+    """Observations counted into cumulative buckets per label combination"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][position] += 1
+            state[1] += value
+    
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labels, labels)} {total}'
+            yield f'{self.name}_count{_format_labels(self.labels, labels)} {cumulative}'
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+    
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+    
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+    
+    def collector(self, func):
+        """Register a function returning (name, kind, documentation, value) tuples read at scrape time"""
+        self._collectors.append(func)
+        return func
+    
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        for collect in self._collectors:
+            for name, kind, documentation, value in collect():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+class _DatabaseTime(threading.local):
+    # Class attributes are the per-thread starting values
+    seconds = 0.0
+    queries = 0
+
+# Database time of the work done on each thread since the last reset
+_db_time = _DatabaseTime()
+
+def reset_db_time():
+    _db_time.seconds = 0.0
+    _db_time.queries = 0
+
+def db_time():
+    """(seconds, queries) spent in the database on this thread since reset_db_time()"""
+    return _db_time.seconds, _db_time.queries
+
+def _record(started, queries=0):
+    _db_time.seconds += time.perf_counter() - started
+    _db_time.queries += queries
+
+class TimedCursor(sqlite3.Cursor):
+    """A cursor that adds its execute and fetch time to the thread's database time"""
+    
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _record(started, 1)
+    
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _record(started, 1)
+    
+    def executescript(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executescript(*args)
+        finally:
+            _record(started, 1)
+    
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record(started)
+    
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            _record(started)
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record(started)
+    
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            _record(started)
+
+class TimedConnection(sqlite3.Connection):
+    """A connection whose statements and commits are timed by TimedCursor"""
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    # The C implementations create plain cursors, bypassing cursor()
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+    
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+    
+    def executescript(self, *args):
+        return self.cursor().executescript(*args)
+    
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            _record(started)
+    
+    # `with db:` commits (or rolls back) in C, without calling commit()
+    def __exit__(self, *exc_info):
+        started = time.perf_counter()
+        try:
+            return super().__exit__(*exc_info)
+        finally:
+            _record(started)
+
+class AppMetrics:
+    """The metrics of one Dream Journal app"""
+    
+    def __init__(self):
+        self.registry = Registry()
+        self.requests = self.registry.counter(
+            'dream_journal_http_requests_total', 'HTTP requests by route, method and status',
+            ('endpoint', 'method', 'status'))
+        self.request_seconds = self.registry.histogram(
+            'dream_journal_http_request_duration_seconds', 'Time to handle a request',
+            ('endpoint', 'method'))
+        self.db_seconds = self.registry.histogram(
+            'dream_journal_db_seconds', 'Database time spent handling a request', ('endpoint',))
+        self.db_queries = self.registry.counter(
+            'dream_journal_db_queries_total', 'SQL statements executed while handling requests', ('endpoint',))
+        self.stage_seconds = self.registry.histogram(
+            'dream_journal_analysis_stage_seconds', 'Time spent in each stage of a dream analysis', ('stage',))
+        self.analyses = self.registry.counter(
+            'dream_journal_analyses_total', 'Dreams analyzed in this process (cache misses)')
+    
+    def observe_stages(self, timings):
+        """Analyzer stage hook: record one analysis' {stage: seconds}"""
+        self.analyses.inc()
+        for stage, seconds in timings.items():
+            self.stage_seconds.observe(seconds, stage)
+    
+    def init_app(self, app, analyzer):
+        """Instrument requests, database connections and the analyzer's stages"""
+        from flask import g, request
+        import repository
+        
+        repository.set_connection_factory(TimedConnection)
+        analyzer.stage_hook = self.observe_stages
+        
+        @app.before_request
+        def start_timer():
+            reset_db_time()
+            g.metrics_started = time.perf_counter()
+        
+        @app.teardown_request
+        def record_request(exc):
+            started = g.pop('metrics_started', None)
+            if started is None:
+                return
+            endpoint = request.endpoint or 'unknown'
+            self.request_seconds.observe(time.perf_counter() - started, endpoint, request.method)
+            seconds, queries = db_time()
+            self.db_seconds.observe(seconds, endpoint)
+            self.db_queries.inc(endpoint, amount=queries)
+        
+        @app.after_request
+        def count_request(response):
+            self.requests.inc(request.endpoint or 'unknown', request.method, str(response.status_code))
+            return response
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Maintenance script to rebuild the precomputed per-user insights.
+
+Insights are normally updated incrementally as dreams are added. Run this
+script after restoring a backup or editing dreams by hand, or with
+--reanalyze after changing the emotion/theme lexicons, so that every stored
+analysis is recomputed before the aggregates are rebuilt.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+
+import repository
+
+def reanalyze(pool, user_id, workers, batch_size=500):
+    """Re-run the analysis of every dream with the current lexicons"""
+    from dream_analyzer import DreamAnalyzer
+    analyzer = DreamAnalyzer()
+    analyzer.configure_executor('thread' if workers == 1 else 'process', workers=workers)
+    
+    with pool.connection() as reader, pool.connection() as writer:
+        # Ids are queued as their contents are handed to the analyzer, which
+        # yields results in the same order
+        ids = deque()
+        
+        def contents():
+            for dream_id, content in repository.iter_dream_contents(reader, user_id):
+                ids.append(dream_id)
+                yield content
+        
+        results = ((ids.popleft(), analysis) for analysis in analyzer.analyze_many(contents()))
+        total = 0
+        while True:
+            batch = list(islice(results, batch_size))
+            if not batch:
+                break
+            repository.update_analyses(writer, batch)
+            total += len(batch)
+            print(f"  reanalyzed {total} dreams", end="\r")
+        print()
+    analyzer.shutdown_executor()
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild Dream Journal AI insight aggregates")
+    parser.add_argument('--db', default=os.environ.get('DREAM_JOURNAL_DB', 'dream_journal.db'),
+                        help="database file (default: $DREAM_JOURNAL_DB or dream_journal.db)")
+    parser.add_argument('--user', type=int, help="only rebuild this user id")
+    parser.add_argument('--reanalyze', action='store_true',
+                        help="re-run dream analysis first (needed after lexicon changes)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="analysis worker processes for --reanalyze")
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        sys.exit(1)
+    
+    pool = repository.get_pool(args.db)
+    with pool.connection() as db:
+        repository.init_db(db)
+    
+    start = time.perf_counter()
+    if args.reanalyze:
+        print("🧠 Reanalyzing dreams with the current lexicons...")
+        reanalyze(pool, args.user, args.workers)
+    
+    print("📊 Rebuilding insight aggregates...")
+    with pool.connection() as db:
+        with db:
+            repository.rebuild_insights(db, args.user)
+    
+    print(f"✅ Done in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1504 @@
+"""
+Data access layer for the Dream Journal application.
+
+This module is the only place SQL lives. Connections come from a small pool
+per database file: a request checks one out on first use through `get_db()`
+and hands it back when the Flask app context ends. Pooled connections run in
+WAL mode so readers never wait on writers, and keep their compiled statements
+cached between requests (the SQL below is kept in constants so every call
+reuses the same prepared statement).
+"""
+
+import base64
+from array import array
+import html
+import json
+import queue
+import re
+import sqlite3
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+from flask import current_app, g
+
+import analysis_codec
+
+# Applied to every new connection
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA temp_store = MEMORY',
+)
+
+# Marks a migration after which the insight aggregates must be rebuilt. The
+# rebuild runs once, after the last migration, against the final schema.
+REBUILD_INSIGHTS = object()
+
+# Marks the migration that packs stored JSON analyses with analysis_codec
+PACK_ANALYSES = object()
+
+# Full-text search indexes. bm25() reads corpus-wide statistics for every
+# query, which gets slow for common words on a large index, so dreams are
+# spread over several indexes by user_id. Each index reads from a view that
+# adds an `owner` token ('u<user_id>'), so searches are restricted to one
+# user inside the index itself. Changing SEARCH_SHARDS needs a migration.
+SEARCH_SHARDS = 16
+
+SEARCH_SHARD_SCHEMA = '''
+    CREATE VIEW IF NOT EXISTS dreams_search_source_{shard} AS
+    SELECT id, 'u' || user_id AS owner, title, content FROM dreams WHERE user_id % {shards} = {shard};
+    CREATE VIRTUAL TABLE IF NOT EXISTS dreams_fts_{shard} USING fts5(
+        owner, title, content,
+        content = 'dreams_search_source_{shard}', content_rowid = 'id',
+        tokenize = 'porter unicode61'
+    );
+    CREATE TRIGGER IF NOT EXISTS dreams_fts_{shard}_insert AFTER INSERT ON dreams
+    WHEN new.user_id % {shards} = {shard} BEGIN
+        INSERT INTO dreams_fts_{shard} (rowid, owner, title, content)
+        VALUES (new.id, 'u' || new.user_id, new.title, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS dreams_fts_{shard}_delete AFTER DELETE ON dreams
+    WHEN old.user_id % {shards} = {shard} BEGIN
+        INSERT INTO dreams_fts_{shard} (dreams_fts_{shard}, rowid, owner, title, content)
+        VALUES ('delete', old.id, 'u' || old.user_id, old.title, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS dreams_fts_{shard}_update AFTER UPDATE OF title, content ON dreams
+    WHEN new.user_id % {shards} = {shard} BEGIN
+        INSERT INTO dreams_fts_{shard} (dreams_fts_{shard}, rowid, owner, title, content)
+        VALUES ('delete', old.id, 'u' || old.user_id, old.title, old.content);
+        INSERT INTO dreams_fts_{shard} (rowid, owner, title, content)
+        VALUES (new.id, 'u' || new.user_id, new.title, new.content);
+    END;
+    INSERT INTO dreams_fts_{shard} (dreams_fts_{shard}, rank) VALUES ('rank', 'bm25(0.0, 2.0, 1.0)');
+    INSERT INTO dreams_fts_{shard} (dreams_fts_{shard}) VALUES ('rebuild');
+'''
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    # 1: initial schema
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS dreams (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        date_recorded TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        emotions TEXT,
+        themes TEXT,
+        analysis TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+    ''',
+    # 2: dream listing index and a summary sentiment column
+    '''
+    CREATE INDEX IF NOT EXISTS idx_dreams_user_date ON dreams (user_id, date_recorded);
+    ALTER TABLE dreams ADD COLUMN sentiment REAL;
+    UPDATE dreams SET sentiment = json_extract(analysis, '$.sentiment.compound')
+    WHERE analysis IS NOT NULL AND json_valid(analysis);
+    ''',
+    # 3: per-user insight aggregates, maintained incrementally on insert
+    '''
+    CREATE TABLE IF NOT EXISTS user_insights (
+        user_id INTEGER PRIMARY KEY,
+        dream_count INTEGER NOT NULL DEFAULT 0,
+        sentiment_sum REAL NOT NULL DEFAULT 0,
+        sentiment_count INTEGER NOT NULL DEFAULT 0,
+        newest_sentiments TEXT NOT NULL DEFAULT '[]',
+        oldest_sentiments TEXT NOT NULL DEFAULT '[]',
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+    CREATE TABLE IF NOT EXISTS user_emotion_counts (
+        user_id INTEGER NOT NULL,
+        emotion TEXT NOT NULL,
+        dreams INTEGER NOT NULL,
+        PRIMARY KEY (user_id, emotion)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS user_theme_counts (
+        user_id INTEGER NOT NULL,
+        theme TEXT NOT NULL,
+        dreams INTEGER NOT NULL,
+        PRIMARY KEY (user_id, theme)
+    ) WITHOUT ROWID;
+    ''',
+    # 4: backfill the aggregates for existing dreams
+    REBUILD_INSIGHTS,
+    # 5: persistent tier of the analysis cache
+    '''
+    CREATE TABLE IF NOT EXISTS analysis_cache (
+        key TEXT PRIMARY KEY,
+        analysis TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ''',
+    # 6: background analysis jobs; dreams are 'pending' until analyzed
+    '''
+    ALTER TABLE dreams ADD COLUMN status TEXT NOT NULL DEFAULT 'done';
+    CREATE TABLE IF NOT EXISTS analysis_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dream_id INTEGER NOT NULL UNIQUE,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (dream_id) REFERENCES dreams (id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status ON analysis_jobs (status, id);
+    ''',
+    # 7: normalized emotion and theme counts, backfilled from the JSON columns
+    '''
+    CREATE TABLE IF NOT EXISTS dream_emotions (
+        dream_id INTEGER NOT NULL,
+        emotion TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (dream_id, emotion),
+        FOREIGN KEY (dream_id) REFERENCES dreams (id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS dream_themes (
+        dream_id INTEGER NOT NULL,
+        theme TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (dream_id, theme),
+        FOREIGN KEY (dream_id) REFERENCES dreams (id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_dream_emotions_emotion ON dream_emotions (emotion, dream_id);
+    CREATE INDEX IF NOT EXISTS idx_dream_themes_theme ON dream_themes (theme, dream_id);
+    INSERT OR IGNORE INTO dream_emotions (dream_id, emotion, count)
+    SELECT d.id, j.key, j.value FROM dreams d, json_each(d.emotions) j
+    WHERE json_valid(d.emotions) AND json_type(d.emotions) = 'object';
+    INSERT OR IGNORE INTO dream_themes (dream_id, theme, count)
+    SELECT d.id, j.key, j.value FROM dreams d, json_each(d.themes) j
+    WHERE json_valid(d.themes) AND json_type(d.themes) = 'object';
+    ''',
+    # 8: full-text search over titles and content, sharded by user
+    ''.join(SEARCH_SHARD_SCHEMA.format(shard=shard, shards=SEARCH_SHARDS) for shard in range(SEARCH_SHARDS)),
+    # 9: hashed lemma counts of analyzed dreams for the similarity index, as
+    # packed int32 arrays. Rows are replaced on re-analysis, so `id` orders
+    # them by when they were written.
+    '''
+    CREATE TABLE IF NOT EXISTS dream_features (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dream_id INTEGER NOT NULL UNIQUE,
+        user_id INTEGER NOT NULL,
+        columns BLOB NOT NULL,
+        counts BLOB NOT NULL,
+        FOREIGN KEY (dream_id) REFERENCES dreams (id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_dream_features_user ON dream_features (user_id, id);
+    ''',
+    # 10: ids of the emotion and theme labels in packed analyses, seeded with
+    # every label already in use
+    '''
+    CREATE TABLE IF NOT EXISTS analysis_labels (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        name TEXT NOT NULL,
+        UNIQUE (kind, name)
+    );
+    INSERT OR IGNORE INTO analysis_labels (kind, name)
+    SELECT DISTINCT 'emotion', emotion FROM dream_emotions;
+    INSERT OR IGNORE INTO analysis_labels (kind, name)
+    SELECT DISTINCT 'theme', theme FROM dream_themes;
+    ''',
+    # 11: analyses are stored packed; the emotions and themes columns are
+    # left empty (run VACUUM afterwards to reclaim the space)
+    PACK_ANALYSES,
+    # 12: per-user revision counter, bumped by every write to the user's
+    # dreams, for HTTP caching
+    '''
+    ALTER TABLE users ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+    ''',
+    # 13: dashboard counters: dreams per day (UTC, in days since 1970-01-01),
+    # the latest run of consecutive days and the latest week's dream count
+    '''
+    CREATE TABLE IF NOT EXISTS user_dream_days (
+        user_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        dreams INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID;
+    ALTER TABLE user_insights ADD COLUMN streak_start INTEGER;
+    ALTER TABLE user_insights ADD COLUMN streak_end INTEGER;
+    ALTER TABLE user_insights ADD COLUMN longest_streak INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE user_insights ADD COLUMN week_start INTEGER;
+    ALTER TABLE user_insights ADD COLUMN week_dreams INTEGER NOT NULL DEFAULT 0;
+    ''',
+    # 14: backfill them
+    REBUILD_INSIGHTS,
+    # 15: cross-user daily rollups for operators, filled in by
+    # rollup_analytics.py up to the dream id in rollup_state
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        last_dream_id INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS daily_dream_rollups (
+        day INTEGER PRIMARY KEY,
+        dreams INTEGER NOT NULL,
+        sentiment_sum REAL NOT NULL,
+        sentiment_count INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS daily_emotion_rollups (
+        day INTEGER NOT NULL,
+        emotion TEXT NOT NULL,
+        dreams INTEGER NOT NULL,
+        mentions INTEGER NOT NULL,
+        PRIMARY KEY (day, emotion)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS daily_theme_rollups (
+        day INTEGER NOT NULL,
+        theme TEXT NOT NULL,
+        dreams INTEGER NOT NULL,
+        mentions INTEGER NOT NULL,
+        PRIMARY KEY (day, theme)
+    ) WITHOUT ROWID;
+    ''',
+    # 16: cached analyses (now compressed) record the analyzer version that
+    # made them, so other versions' rows can be purged; older rows are dropped
+    '''
+    DELETE FROM analysis_cache;
+    ALTER TABLE analysis_cache ADD COLUMN version TEXT NOT NULL DEFAULT '';
+    ''',
+    # 17: the lease token of the worker running a job, so that only that
+    # worker can complete it
+    '''
+    ALTER TABLE analysis_jobs ADD COLUMN claimed_by TEXT;
+    ''',
+]
+
+SELECT_CACHED_ANALYSIS = 'SELECT analysis FROM analysis_cache WHERE key = ?'
+
+INSERT_CACHED_ANALYSIS = 'INSERT OR IGNORE INTO analysis_cache (key, analysis, version) VALUES (?, ?, ?)'
+
+# Rowids grow with every insert, so this drops the oldest rows beyond a cap
+TRIM_CACHED_ANALYSES = 'DELETE FROM analysis_cache WHERE rowid <= (SELECT MAX(rowid) FROM analysis_cache) - ?'
+
+PURGE_CACHED_ANALYSES = 'DELETE FROM analysis_cache WHERE version != ?'
+
+# Number of newest and oldest sentiment scores kept for trend analysis
+TREND_WINDOW = 5
+
+INSERT_USER = 'INSERT INTO users (username, password_hash) VALUES (?, ?)'
+
+SELECT_CREDENTIALS = 'SELECT id, password_hash FROM users WHERE username = ?'
+
+SELECT_REVISION = 'SELECT revision FROM users WHERE id = ?'
+
+BUMP_REVISION = 'UPDATE users SET revision = revision + 1 WHERE id = ?'
+
+BUMP_DREAM_OWNER_REVISION = '''
+    UPDATE users SET revision = revision + 1
+    WHERE id = (SELECT user_id FROM dreams WHERE id = ?)
+'''
+
+INSERT_DREAM = '''
+    INSERT INTO dreams (user_id, title, content, date_recorded, analysis, sentiment)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+INSERT_DREAM_EMOTION = 'INSERT INTO dream_emotions (dream_id, emotion, count) VALUES (?, ?, ?)'
+
+INSERT_DREAM_THEME = 'INSERT INTO dream_themes (dream_id, theme, count) VALUES (?, ?, ?)'
+
+DELETE_DREAM_EMOTIONS = 'DELETE FROM dream_emotions WHERE dream_id = ?'
+
+DELETE_DREAM_THEMES = 'DELETE FROM dream_themes WHERE dream_id = ?'
+
+REPLACE_DREAM_FEATURES = '''
+    INSERT OR REPLACE INTO dream_features (dream_id, user_id, columns, counts)
+    SELECT id, user_id, ?, ? FROM dreams WHERE id = ?
+'''
+
+SELECT_DREAM_FEATURES = '''
+    SELECT id, dream_id, columns, counts FROM dream_features WHERE user_id = ? AND id > ? ORDER BY id
+'''
+
+UPDATE_ANALYSIS = '''
+    UPDATE dreams SET emotions = NULL, themes = NULL, analysis = ?, sentiment = ?, status = 'done'
+    WHERE id = ?
+'''
+
+SELECT_LABELS = 'SELECT id, kind, name FROM analysis_labels'
+
+INSERT_LABEL = 'INSERT OR IGNORE INTO analysis_labels (kind, name) VALUES (?, ?)'
+
+SELECT_JSON_ANALYSES = '''
+    SELECT id, analysis FROM dreams WHERE id > ? AND typeof(analysis) = 'text' ORDER BY id LIMIT ?
+'''
+
+PACK_ANALYSIS = 'UPDATE dreams SET emotions = NULL, themes = NULL, analysis = ? WHERE id = ?'
+
+INSERT_PENDING_DREAM = '''
+    INSERT INTO dreams (user_id, title, content, date_recorded, status)
+    VALUES (?, ?, ?, ?, 'pending')
+'''
+
+INSERT_JOB = 'INSERT INTO analysis_jobs (dream_id) VALUES (?)'
+
+CLAIM_JOB = '''
+    UPDATE analysis_jobs
+    SET status = 'running', attempts = attempts + 1, claimed_by = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = (SELECT id FROM analysis_jobs WHERE status = 'queued' ORDER BY id LIMIT 1)
+    RETURNING id, dream_id, attempts
+'''
+
+SELECT_JOB_DREAM = 'SELECT user_id, content, date_recorded FROM dreams WHERE id = ?'
+
+DELETE_JOB = 'DELETE FROM analysis_jobs WHERE id = ?'
+
+FINISH_JOB = "DELETE FROM analysis_jobs WHERE id = ? AND status = 'running' AND claimed_by = ?"
+
+RETRY_JOB = '''
+    UPDATE analysis_jobs SET status = 'queued', error = ?, claimed_by = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ? AND status = 'running' AND claimed_by = ?
+'''
+
+FAIL_JOB = '''
+    UPDATE analysis_jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ? AND status = 'running' AND claimed_by = ?
+'''
+
+FAIL_DREAM = "UPDATE dreams SET status = 'failed' WHERE id = ?"
+
+# Running jobs whose lease ran out: their worker died or hung
+REQUEUE_STALE_JOBS = '''
+    UPDATE analysis_jobs SET status = 'queued', claimed_by = NULL
+    WHERE status = 'running' AND updated_at < datetime('now', ?)
+'''
+
+COUNT_JOBS = 'SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status'
+
+COUNT_QUEUED_JOBS = "SELECT COUNT(*) FROM analysis_jobs WHERE status = 'queued'"
+
+SELECT_DREAM_STATUS = 'SELECT status FROM dreams WHERE id = ? AND user_id = ?'
+
+# Dream listings only read summary columns, newest first, a page at a time
+SUMMARY_COLUMNS = 'id, title, substr(content, 1, :preview), date_recorded, analysis, sentiment, status'
+
+# Optional dream filters, ANDed onto `user_id = :user_id`. Label filters are
+# answered from the normalized tables' (label, dream_id) indexes.
+DREAM_FILTERS = {
+    'theme': 'dreams.id IN (SELECT dream_id FROM dream_themes WHERE theme = :theme)',
+    'emotion': 'dreams.id IN (SELECT dream_id FROM dream_emotions WHERE emotion = :emotion)',
+    'since': 'dreams.date_recorded >= :since',
+    'until': 'dreams.date_recorded < :until',
+}
+
+# Length of the content preview returned with dream summaries
+PREVIEW_LENGTH = 200
+
+SELECT_INSIGHTS = '''
+    SELECT dream_count, sentiment_sum, sentiment_count, newest_sentiments, oldest_sentiments
+    FROM user_insights WHERE user_id = ?
+'''
+
+SELECT_EMOTION_COUNTS = 'SELECT emotion, dreams FROM user_emotion_counts WHERE user_id = ?'
+
+SELECT_THEME_COUNTS = 'SELECT theme, dreams FROM user_theme_counts WHERE user_id = ?'
+
+EMPTY_INSIGHTS = (0, 0.0, 0, '[]', '[]')
+
+SELECT_ACTIVITY = '''
+    SELECT streak_start, streak_end, longest_streak, week_start, week_dreams
+    FROM user_insights WHERE user_id = ?
+'''
+
+EMPTY_ACTIVITY = (None, None, 0, None, 0)
+
+UPDATE_ACTIVITY = '''
+    UPDATE user_insights SET streak_start = ?, streak_end = ?, longest_streak = ?, week_start = ?, week_dreams = ?
+    WHERE user_id = ?
+'''
+
+INCREMENT_DREAM_DAY = '''
+    INSERT INTO user_dream_days (user_id, day, dreams) VALUES (?, ?, ?)
+    ON CONFLICT (user_id, day) DO UPDATE SET dreams = dreams + excluded.dreams
+'''
+
+SELECT_DREAM_DAYS = 'SELECT day, dreams FROM user_dream_days WHERE user_id = ? ORDER BY day'
+
+# Day 0 of user_dream_days
+EPOCH_DATE = date(1970, 1, 1)
+
+# Everything /api/stats shows, from the user's row of aggregates
+SELECT_STATS = '''
+    SELECT dream_count, sentiment_sum, sentiment_count,
+           streak_start, streak_end, longest_streak, week_start, week_dreams,
+           (SELECT emotion FROM user_emotion_counts e WHERE e.user_id = i.user_id
+            ORDER BY dreams DESC, emotion LIMIT 1),
+           (SELECT theme FROM user_theme_counts t WHERE t.user_id = i.user_id
+            ORDER BY dreams DESC, theme LIMIT 1)
+    FROM user_insights i WHERE user_id = ?
+'''
+
+UPSERT_INSIGHTS = '''
+    INSERT INTO user_insights
+        (user_id, dream_count, sentiment_sum, sentiment_count, newest_sentiments, oldest_sentiments)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        dream_count = excluded.dream_count,
+        sentiment_sum = excluded.sentiment_sum,
+        sentiment_count = excluded.sentiment_count,
+        newest_sentiments = excluded.newest_sentiments,
+        oldest_sentiments = excluded.oldest_sentiments
+'''
+
+INCREMENT_EMOTION_COUNT = '''
+    INSERT INTO user_emotion_counts (user_id, emotion, dreams) VALUES (?, ?, ?)
+    ON CONFLICT (user_id, emotion) DO UPDATE SET dreams = dreams + excluded.dreams
+'''
+
+INCREMENT_THEME_COUNT = '''
+    INSERT INTO user_theme_counts (user_id, theme, dreams) VALUES (?, ?, ?)
+    ON CONFLICT (user_id, theme) DO UPDATE SET dreams = dreams + excluded.dreams
+'''
+
+# Day of a dream's date_recorded, in days since 1970-01-01 (NULL if it is not a date)
+DREAM_DAY = "CAST(strftime('%s', date(date_recorded)) AS INTEGER) / 86400"
+
+# Cross-user rollups. Dreams are folded in by id, stopping before the first
+# one still awaiting analysis, and rollup_state keeps the last id folded in.
+ROLLUP_BATCH_SIZE = 10000
+
+INIT_ROLLUP_MARK = "INSERT OR IGNORE INTO rollup_state (name, last_dream_id) VALUES ('dreams', 0)"
+
+SELECT_ROLLUP_MARK = "SELECT last_dream_id FROM rollup_state WHERE name = 'dreams'"
+
+UPDATE_ROLLUP_MARK = "UPDATE rollup_state SET last_dream_id = ? WHERE name = 'dreams'"
+
+SELECT_ROLLUP_BATCH = '''
+    SELECT MAX(id), COUNT(*) FROM (
+        SELECT id FROM dreams
+        WHERE id > :mark AND id < COALESCE(
+            (SELECT MIN(id) FROM dreams WHERE id > :mark AND status = 'pending'), 9223372036854775807)
+        ORDER BY id LIMIT :limit
+    )
+'''
+
+ROLLUP_DREAMS = f'''
+    INSERT INTO daily_dream_rollups (day, dreams, sentiment_sum, sentiment_count)
+    SELECT day, COUNT(*), COALESCE(SUM(sentiment), 0), COUNT(sentiment) FROM (
+        SELECT {DREAM_DAY} AS day, sentiment FROM dreams WHERE id > ? AND id <= ? AND status = 'done'
+    ) WHERE day IS NOT NULL GROUP BY day
+    ON CONFLICT (day) DO UPDATE SET
+        dreams = dreams + excluded.dreams,
+        sentiment_sum = sentiment_sum + excluded.sentiment_sum,
+        sentiment_count = sentiment_count + excluded.sentiment_count
+'''
+
+ROLLUP_EMOTIONS = f'''
+    INSERT INTO daily_emotion_rollups (day, emotion, dreams, mentions)
+    SELECT day, emotion, COUNT(*), SUM(count) FROM (
+        SELECT {DREAM_DAY} AS day, l.emotion, l.count
+        FROM dreams d JOIN dream_emotions l ON l.dream_id = d.id
+        WHERE d.id > ? AND d.id <= ? AND d.status = 'done'
+    ) WHERE day IS NOT NULL GROUP BY day, emotion
+    ON CONFLICT (day, emotion) DO UPDATE SET
+        dreams = dreams + excluded.dreams,
+        mentions = mentions + excluded.mentions
+'''
+
+ROLLUP_THEMES = f'''
+    INSERT INTO daily_theme_rollups (day, theme, dreams, mentions)
+    SELECT day, theme, COUNT(*), SUM(count) FROM (
+        SELECT {DREAM_DAY} AS day, l.theme, l.count
+        FROM dreams d JOIN dream_themes l ON l.dream_id = d.id
+        WHERE d.id > ? AND d.id <= ? AND d.status = 'done'
+    ) WHERE day IS NOT NULL GROUP BY day, theme
+    ON CONFLICT (day, theme) DO UPDATE SET
+        dreams = dreams + excluded.dreams,
+        mentions = mentions + excluded.mentions
+'''
+
+SELECT_DAILY_ROLLUPS = '''
+    SELECT day, dreams, sentiment_sum, sentiment_count FROM daily_dream_rollups
+    WHERE day >= ? AND day < ? ORDER BY day
+'''
+
+SELECT_EMOTION_ROLLUPS = '''
+    SELECT emotion, SUM(dreams), SUM(mentions) FROM daily_emotion_rollups
+    WHERE day >= ? AND day < ? GROUP BY emotion ORDER BY 2 DESC, emotion
+'''
+
+SELECT_THEME_ROLLUPS = '''
+    SELECT theme, SUM(dreams), SUM(mentions) FROM daily_theme_rollups
+    WHERE day >= ? AND day < ? GROUP BY theme ORDER BY 2 DESC, theme
+'''
+
+# Insights over a subset of dreams, computed with indexed GROUP BY queries
+# instead of the precomputed aggregates
+SELECT_RANGE_TOTALS = '''
+    SELECT COUNT(*), COALESCE(SUM(sentiment), 0), COUNT(sentiment) FROM dreams WHERE {where}
+'''
+
+SELECT_RANGE_EMOTION_COUNTS = '''
+    SELECT l.emotion, COUNT(*) FROM dreams JOIN dream_emotions l ON l.dream_id = dreams.id
+    WHERE {where} GROUP BY l.emotion
+'''
+
+SELECT_RANGE_THEME_COUNTS = '''
+    SELECT l.theme, COUNT(*) FROM dreams JOIN dream_themes l ON l.dream_id = dreams.id
+    WHERE {where} GROUP BY l.theme
+'''
+
+SELECT_RANGE_SENTIMENTS = '''
+    SELECT date_recorded, sentiment FROM dreams WHERE {where} AND sentiment IS NOT NULL
+    ORDER BY date_recorded {order}, id {order} LIMIT :window
+'''
+
+# Dreams whose date_recorded is not a timestamp SQLite can read (left by
+# hand edits or old imports) have no place in the series
+SELECT_SENTIMENT_SERIES = '''
+    SELECT CAST(strftime('%s', date_recorded) AS INTEGER), sentiment FROM dreams
+    WHERE {where} AND sentiment IS NOT NULL AND strftime('%s', date_recorded) IS NOT NULL
+'''
+
+# Full-text search, ranked by BM25 with title matches weighted double.
+# {shard} is filled in with the searching user's index.
+SEARCH_DREAMS = '''
+    SELECT dreams.id, dreams.title, dreams.date_recorded, dreams.sentiment,
+           snippet(dreams_fts_{shard}, 2, char(2), char(3), '…', :snippet_tokens), dreams_fts_{shard}.rank
+    FROM dreams_fts_{shard} JOIN dreams ON dreams.id = dreams_fts_{shard}.rowid
+    WHERE dreams_fts_{shard} MATCH :match AND dreams.user_id = :user_id
+    ORDER BY dreams_fts_{shard}.rank LIMIT :limit OFFSET :offset
+'''
+
+# Words shown around the matches in search snippets
+SNIPPET_TOKENS = 24
+
+SELECT_DREAM = '''
+    SELECT id, title, content, date_recorded, analysis, status
+    FROM dreams WHERE id = ? AND user_id = ?
+'''
+
+# Export pages walk idx_dreams_user_date from the last (date_recorded, id)
+# sent. {columns} follow those two keys.
+EXPORT_DREAMS = '''
+    SELECT date_recorded, id, {columns}
+    FROM dreams WHERE user_id = ? AND (date_recorded, id) > (?, ?)
+    ORDER BY date_recorded, id LIMIT ?
+'''
+
+EXPORT_COLUMNS = 'id, title, content, date_recorded, analysis, sentiment, status'
+
+EXPORT_CSV_COLUMNS = ('id', 'date_recorded', 'title', 'content', 'emotions', 'themes', 'sentiment', 'status')
+
+# Dreams exported per query
+EXPORT_BATCH_SIZE = 1000
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections to one database file"""
+    
+    def __init__(self, path, size=8, factory=sqlite3.Connection):
+        self.path = path
+        self.factory = factory
+        self._idle = queue.LifoQueue(maxsize=size)
+    
+    def _connect(self):
+        # Connections are shared between threads, but only one at a time
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256,
+                               factory=self.factory)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+    
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a connection outside of a request (scripts, background workers)"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pools = {}
+_pools_lock = threading.Lock()
+_connection_factory = sqlite3.Connection
+
+def get_pool(path):
+    """Return the shared connection pool for the database at `path`"""
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path, factory=_connection_factory)
+        return _pools[path]
+
+def set_connection_factory(factory):
+    """Open pooled connections from now on as `factory`, a sqlite3.Connection subclass"""
+    global _connection_factory
+    with _pools_lock:
+        _connection_factory = factory
+        for pool in _pools.values():
+            pool.factory = factory
+
+def get_db():
+    """Return the connection checked out for the current app context"""
+    if 'db' not in g:
+        g.db = get_pool(current_app.config['DATABASE']).acquire()
+    return g.db
+
+def _release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool(current_app.config['DATABASE']).release(conn)
+
+def init_app(app):
+    """Return request connections to the pool when each app context ends"""
+    app.teardown_appcontext(_release_db)
+
+def init_db(db):
+    """Create or upgrade the schema"""
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    rebuild = False
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        if script is PACK_ANALYSES:
+            with db:
+                _pack_stored_analyses(db)
+                db.execute(f'PRAGMA user_version = {number}')
+            continue
+        if script is REBUILD_INSIGHTS:
+            rebuild = True
+            script = ''
+        # executescript commits any pending transaction, so run each
+        # migration inside its own explicit one
+        db.executescript(f'BEGIN; {script}; PRAGMA user_version = {number}; COMMIT;')
+    
+    if rebuild:
+        with db:
+            rebuild_insights(db)
+
+# Users
+
+def create_user(db, username, password_hash):
+    """Create a user, raising sqlite3.IntegrityError if the name is taken"""
+    with db:
+        return db.execute(INSERT_USER, (username, password_hash)).lastrowid
+
+def get_credentials(db, username):
+    """Return (id, password_hash) for a username, or None"""
+    return db.execute(SELECT_CREDENTIALS, (username,)).fetchone()
+
+def get_revision(db, user_id):
+    """Return the user's revision, which changes whenever any of their dreams is written"""
+    row = db.execute(SELECT_REVISION, (user_id,)).fetchone()
+    return row[0] if row else 0
+
+# Stored analyses
+
+class _Labels:
+    """The analysis_labels table of one database, cached"""
+    
+    def __init__(self):
+        self.ids = {}
+        self.names = {}
+    
+    def reload(self, db):
+        rows = db.execute(SELECT_LABELS).fetchall()
+        # Replaced whole, so readers on other threads never see a partial map
+        self.ids = {(kind, name): label_id for label_id, kind, name in rows}
+        self.names = {label_id: name for label_id, kind, name in rows}
+
+_labels_by_database = {}
+_labels_lock = threading.Lock()
+
+def _labels(db):
+    # Labels are only ever added, so one cache per database file serves
+    # every connection to it
+    path = db.execute('PRAGMA database_list').fetchone()[2] or id(db)
+    with _labels_lock:
+        labels = _labels_by_database.get(path)
+        if labels is None:
+            labels = _labels_by_database[path] = _Labels()
+            labels.reload(db)
+    return labels
+
+def _label_ids(db, pairs):
+    """Return the label cache's ids, adding any missing (kind, name) pairs first
+    
+    New labels are committed in their own transaction, so a cached id never
+    refers to a row that was rolled back. Must not be called inside a
+    transaction.
+    """
+    labels = _labels(db)
+    missing = [pair for pair in pairs if pair not in labels.ids]
+    if missing:
+        with db:
+            db.executemany(INSERT_LABEL, missing)
+        labels.reload(db)
+    return labels.ids
+
+def _pack_analyses(db, analyses):
+    """Encode analyses for storage with analysis_codec
+    
+    Analyses that do not fit its layout are stored as JSON instead.
+    """
+    ids = _label_ids(db, {label for analysis in analyses for label in analysis_codec.labels(analysis)})
+    packed = []
+    for analysis in analyses:
+        try:
+            packed.append(analysis_codec.encode(analysis, ids))
+        except (KeyError, TypeError, ValueError, struct.error):
+            packed.append(_analysis_json(analysis))
+    return packed
+
+def _unpack_analysis(db, labels, value):
+    """Decode a stored analysis: packed, legacy JSON text, or None while pending"""
+    if value is None:
+        return {}
+    if isinstance(value, str):
+        return json.loads(value)
+    try:
+        return analysis_codec.decode(value, labels.names)
+    except KeyError:
+        # Labels added by another process since the cache was loaded
+        labels.reload(db)
+        return analysis_codec.decode(value, labels.names)
+
+def _unpack_labels(db, labels, value):
+    """The (emotions, themes) dicts of a stored analysis"""
+    if value is None:
+        return {}, {}
+    if isinstance(value, str):
+        analysis = json.loads(value)
+        return analysis.get('emotions', {}), analysis.get('themes', {})
+    try:
+        return analysis_codec.decode_labels(value, labels.names)
+    except KeyError:
+        labels.reload(db)
+        return analysis_codec.decode_labels(value, labels.names)
+
+def _pack_stored_analyses(db, batch_size=1000):
+    # Migration: re-encode JSON analyses in place. Labels were seeded by the
+    # previous migration, so no new ones are needed; analyses whose labels
+    # are missing or that do not fit the layout stay as JSON.
+    labels = _Labels()
+    labels.reload(db)
+    last_id = 0
+    while True:
+        rows = db.execute(SELECT_JSON_ANALYSES, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        updates = []
+        for dream_id, value in rows:
+            try:
+                updates.append((analysis_codec.encode(json.loads(value), labels.ids), dream_id))
+            except (KeyError, TypeError, ValueError, AttributeError, struct.error):
+                continue
+        db.executemany(PACK_ANALYSIS, updates)
+        last_id = rows[-1][0]
+    
+    with _labels_lock:
+        _labels_by_database.clear()
+
+# Dreams
+
+def _now():
+    # Same format as SQLite's CURRENT_TIMESTAMP
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _analysis_json(analysis):
+    # Features are stored in dream_features rather than with the analysis
+    return json.dumps({key: value for key, value in analysis.items() if key != 'features'})
+
+def _dream_row(user_id, title, content, date_recorded, analysis, packed):
+    return (user_id, title, content, date_recorded or _now(), packed,
+            analysis['sentiment']['compound'])
+
+def _insert_labels(db, analyses):
+    # Write the normalized emotion and theme counts and the hashed features
+    # of (dream_id, analysis) pairs
+    analyses = list(analyses)
+    db.executemany(INSERT_DREAM_EMOTION, ((dream_id, emotion, count) for dream_id, analysis in analyses
+                                          for emotion, count in analysis['emotions'].items()))
+    db.executemany(INSERT_DREAM_THEME, ((dream_id, theme, count) for dream_id, analysis in analyses
+                                        for theme, count in analysis['themes'].items()))
+    db.executemany(REPLACE_DREAM_FEATURES, ((array('i', analysis['features']['columns']).tobytes(),
+                                             array('i', analysis['features']['counts']).tobytes(),
+                                             dream_id)
+                                            for dream_id, analysis in analyses if analysis.get('features')))
+
+def add_dream(db, user_id, title, content, analysis, date_recorded=None):
+    """Save an analyzed dream and update the user's insights, returning its id"""
+    row = _dream_row(user_id, title, content, date_recorded, analysis, _pack_analyses(db, [analysis])[0])
+    with db:
+        dream_id = db.execute(INSERT_DREAM, row).lastrowid
+        _insert_labels(db, [(dream_id, analysis)])
+        _update_insights(db, user_id, [(row[3], analysis)])
+        db.execute(BUMP_REVISION, (user_id,))
+    return dream_id
+
+def add_dreams(db, user_id, dreams):
+    """Save many analyzed dreams and update the user's insights in one transaction
+    
+    `dreams` is an iterable of (title, content, date_recorded, analysis)
+    tuples.
+    """
+    dreams = list(dreams)
+    packed = _pack_analyses(db, [dream[3] for dream in dreams])
+    rows = [_dream_row(user_id, *dream, analysis) for dream, analysis in zip(dreams, packed)]
+    with db:
+        dream_ids = [db.execute(INSERT_DREAM, row).lastrowid for row in rows]
+        _insert_labels(db, zip(dream_ids, (dream[3] for dream in dreams)))
+        _update_insights(db, user_id, [(row[3], dream[3]) for row, dream in zip(rows, dreams)])
+        db.execute(BUMP_REVISION, (user_id,))
+
+def _decode_dream(dream_id, title, content, date_recorded, analysis, status):
+    return {
+        'id': dream_id,
+        'title': title,
+        'content': content,
+        'date_recorded': date_recorded,
+        'emotions': analysis.get('emotions', []),
+        'themes': analysis.get('themes', []),
+        'analysis': analysis,
+        'status': status
+    }
+
+def encode_cursor(date_recorded, dream_id):
+    """Encode a listing position as an opaque cursor string"""
+    raw = json.dumps([date_recorded, dream_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor, raising ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date_recorded, dream_id = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from e
+    if not isinstance(date_recorded, str) or not isinstance(dream_id, int):
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+    return date_recorded, dream_id
+
+def _filter_clause(user_id, filters):
+    # WHERE clause and parameters for a user's dreams matching `filters`
+    unknown = set(filters) - set(DREAM_FILTERS)
+    if unknown:
+        raise ValueError(f'Unknown dream filter: {sorted(unknown)[0]}')
+    
+    clauses = ['dreams.user_id = :user_id']
+    params = {'user_id': user_id}
+    for name, clause in DREAM_FILTERS.items():
+        if filters.get(name) is not None:
+            clauses.append(clause)
+            params[name] = filters[name]
+    return ' AND '.join(clauses), params
+
+def _summary(dream_id, title, preview, date_recorded, emotions, themes, sentiment, status):
+    return {
+        'id': dream_id,
+        'title': title,
+        'preview': preview,
+        'date_recorded': date_recorded,
+        'emotions': emotions,
+        'themes': themes,
+        'sentiment': sentiment,
+        'status': status
+    }
+
+def _summaries(db, rows):
+    # Summaries of SUMMARY_COLUMNS rows
+    labels = _labels(db)
+    return [_summary(dream_id, title, preview, date_recorded, *_unpack_labels(db, labels, analysis), sentiment, status)
+            for dream_id, title, preview, date_recorded, analysis, sentiment, status in rows]
+
+def list_dream_summaries(db, user_id, after=None, limit=20, **filters):
+    """Return a page of a user's dream summaries, newest first
+    
+    Summaries carry a content preview, emotions, themes and the compound
+    sentiment, but not the full analysis. Returns (dreams, next_cursor), where
+    next_cursor is None on the last page.
+    
+    Dreams can be filtered by `theme`, `emotion`, `since` (inclusive) and
+    `until` (exclusive); pass the same filters with the cursor.
+    """
+    where, params = _filter_clause(user_id, filters)
+    if after:
+        params['after_date'], params['after_id'] = decode_cursor(after)
+        where += ' AND (dreams.date_recorded, dreams.id) < (:after_date, :after_id)'
+    params['preview'] = PREVIEW_LENGTH
+    params['limit'] = limit + 1
+    rows = db.execute(f'''
+        SELECT {SUMMARY_COLUMNS}
+        FROM dreams WHERE {where}
+        ORDER BY date_recorded DESC, id DESC LIMIT :limit
+    ''', params).fetchall()
+    
+    dreams = _summaries(db, rows[:limit])
+    
+    next_cursor = None
+    if len(rows) > limit:
+        last = dreams[-1]
+        next_cursor = encode_cursor(last['date_recorded'], last['id'])
+    return dreams, next_cursor
+
+def get_dream(db, dream_id, user_id):
+    """Return one of a user's dreams, or None"""
+    row = db.execute(SELECT_DREAM, (dream_id, user_id)).fetchone()
+    if row is None:
+        return None
+    return _decode_dream(*row[:4], _unpack_analysis(db, _labels(db), row[4]), row[5])
+
+def iter_dream_contents(db, user_id=None, batch_size=500):
+    """Yield (id, content) for every dream, or one user's dreams, in id order
+    
+    Dreams still waiting for the analysis queue are skipped.
+    """
+    where = 'AND user_id = ?' if user_id is not None else ''
+    last_id = 0
+    while True:
+        params = (last_id, user_id) if user_id is not None else (last_id,)
+        rows = db.execute(f'''
+            SELECT id, content FROM dreams WHERE id > ? AND status != 'pending' {where}
+            ORDER BY id LIMIT {int(batch_size)}
+        ''', params).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+def _export_pages(db, user_id, columns, batch_size):
+    sql = EXPORT_DREAMS.format(columns=columns)
+    last_date, last_id = '', 0
+    while True:
+        rows = db.execute(sql, (user_id, last_date, last_id, batch_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_date, last_id = rows[-1][0], rows[-1][1]
+
+def export_dreams_json(db, user_id, batch_size=EXPORT_BATCH_SIZE):
+    """Yield a user's dreams, oldest first, as lists of JSON object strings
+    
+    Each object has the dream's id, title, content, date_recorded, emotions,
+    themes, sentiment, status and full analysis. Every list is one short
+    query, so no read transaction stays open between pages.
+    """
+    labels = _labels(db)
+    for rows in _export_pages(db, user_id, EXPORT_COLUMNS, batch_size):
+        page = []
+        for _, _, dream_id, title, content, date_recorded, analysis, sentiment, status in rows:
+            analysis = _unpack_analysis(db, labels, analysis)
+            page.append(json.dumps({
+                'id': dream_id,
+                'title': title,
+                'content': content,
+                'date_recorded': date_recorded,
+                'emotions': analysis.get('emotions'),
+                'themes': analysis.get('themes'),
+                'sentiment': sentiment,
+                'status': status,
+                'analysis': analysis or None
+            }))
+        yield page
+
+def export_dreams_rows(db, user_id, batch_size=EXPORT_BATCH_SIZE):
+    """Yield a user's dreams, oldest first, as lists of EXPORT_CSV_COLUMNS tuples
+    
+    Emotions and themes are JSON objects, or empty while pending.
+    """
+    labels = _labels(db)
+    for rows in _export_pages(db, user_id, EXPORT_COLUMNS, batch_size):
+        page = []
+        for _, _, dream_id, title, content, date_recorded, analysis, sentiment, status in rows:
+            emotions, themes = _unpack_labels(db, labels, analysis) if analysis is not None else (None, None)
+            page.append((dream_id, date_recorded, title, content,
+                         json.dumps(emotions) if emotions is not None else '',
+                         json.dumps(themes) if themes is not None else '',
+                         sentiment, status))
+        yield page
+
+def update_analyses(db, analyses):
+    """Replace the stored analysis of existing dreams
+    
+    `analyses` is an iterable of (dream_id, analysis) pairs. Insight
+    aggregates are not touched; call rebuild_insights afterwards.
+    """
+    analyses = list(analyses)
+    packed = _pack_analyses(db, [analysis for _, analysis in analyses])
+    with db:
+        db.executemany(UPDATE_ANALYSIS, ((blob, analysis['sentiment']['compound'], dream_id)
+                                         for (dream_id, analysis), blob in zip(analyses, packed)))
+        db.executemany(DELETE_DREAM_EMOTIONS, ((dream_id,) for dream_id, _ in analyses))
+        db.executemany(DELETE_DREAM_THEMES, ((dream_id,) for dream_id, _ in analyses))
+        _insert_labels(db, analyses)
+        db.executemany(BUMP_DREAM_OWNER_REVISION, ((dream_id,) for dream_id, _ in analyses))
+
+# Search
+
+def _match_expression(query):
+    # Turn user input into an FTS5 query: bare words and "quoted phrases" are
+    # all required, and a trailing * makes a word a prefix. Every term is an
+    # FTS5 string, so operators and column filters in the input are inert,
+    # and is split by the index's own tokenizer, the way the dreams were
+    # (dog's is the phrase dog s).
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        text = phrase or word.rstrip('*')
+        if not any(char.isalnum() for char in text):
+            continue
+        term = '"' + text.replace('"', '""') + '"'
+        if word.endswith('*'):
+            term += '*'
+        terms.append(term)
+    if not terms:
+        raise ValueError('Search query has no words')
+    return ' '.join(terms)
+
+def _highlight(snippet):
+    # Escape the snippet text, then turn the match markers into <mark> tags
+    return html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def search_dreams(db, user_id, query, offset=0, limit=20):
+    """Full-text search over a user's dream titles and content, best match first
+    
+    Returns (results, next_offset), where next_offset is None on the last
+    page. Each result's `snippet` is HTML with the matched words wrapped in
+    <mark>. Raises ValueError if the query has no searchable words.
+    """
+    params = {
+        # The owner filter is resolved inside the index; the join condition
+        # on user_id repeats it against the dreams table
+        'match': f'owner:u{int(user_id)} AND ({_match_expression(query)})',
+        'user_id': user_id,
+        'snippet_tokens': SNIPPET_TOKENS,
+        'limit': limit + 1,
+        'offset': offset
+    }
+    rows = db.execute(SEARCH_DREAMS.format(shard=int(user_id) % SEARCH_SHARDS), params).fetchall()
+    
+    results = [{
+        'id': dream_id,
+        'title': title,
+        'date_recorded': date_recorded,
+        'sentiment': sentiment,
+        'snippet': _highlight(snippet),
+        'score': -rank
+    } for dream_id, title, date_recorded, sentiment, snippet, rank in rows[:limit]]
+    
+    next_offset = offset + limit if len(rows) > limit else None
+    return results, next_offset
+
+# Similarity
+
+def iter_dream_features(db, user_id, after=0):
+    """Yield (sequence, dream_id, columns, counts) for a user's features written after `after`
+    
+    `columns` and `counts` are packed native int32 arrays. Re-analyzed dreams
+    appear again with a higher sequence number.
+    """
+    return db.execute(SELECT_DREAM_FEATURES, (user_id, after))
+
+def get_dream_summaries(db, user_id, dream_ids):
+    """Return summaries of some of a user's dreams, keyed by id"""
+    rows = db.execute(f'''
+        SELECT {SUMMARY_COLUMNS} FROM dreams
+        WHERE user_id = :user_id AND id IN (SELECT value FROM json_each(:ids))
+    ''', {'preview': PREVIEW_LENGTH, 'user_id': user_id, 'ids': json.dumps(list(dream_ids))})
+    return {summary['id']: summary for summary in _summaries(db, rows)}
+
+# Analysis jobs
+
+def add_pending_dream(db, user_id, title, content, date_recorded=None, max_queued=None):
+    """Save a dream awaiting analysis and queue its analysis job, returning the dream id
+    
+    Returns None, saving nothing, if `max_queued` jobs are already queued.
+    The count is taken after the insert has locked the database, so
+    concurrent callers cannot overshoot the limit.
+    """
+    date_recorded = date_recorded or _now()
+    with db:
+        dream_id = db.execute(INSERT_PENDING_DREAM, (user_id, title, content, date_recorded)).lastrowid
+        if max_queued is not None and count_queued_jobs(db) >= max_queued:
+            db.rollback()
+            return None
+        db.execute(INSERT_JOB, (dream_id,))
+        _update_insights(db, user_id, [], new_dates=[date_recorded])
+        db.execute(BUMP_REVISION, (user_id,))
+    return dream_id
+
+def claim_job(db, lease):
+    """Claim the oldest queued job under a `lease` token unique to this claim
+    
+    Returns (job_id, dream_id, attempts, user_id, content), or None when the
+    queue is empty. Claiming is atomic, so several workers or processes can
+    share the queue; only the lease holder can complete or fail the job.
+    """
+    with db:
+        job = db.execute(CLAIM_JOB, (lease,)).fetchone()
+        if job is None:
+            return None
+        job_id, dream_id, attempts = job
+        dream = db.execute(SELECT_JOB_DREAM, (dream_id,)).fetchone()
+        if dream is None:
+            db.execute(DELETE_JOB, (job_id,))
+            return None
+    user_id, content, _ = dream
+    return job_id, dream_id, attempts, user_id, content
+
+def complete_job(db, job_id, dream_id, user_id, analysis, lease):
+    """Store a job's analysis, fold it into the user's insights and remove the job
+    
+    Returns False, changing nothing, if the job is no longer held under
+    `lease` (it was requeued as stale and may be running elsewhere).
+    """
+    packed = _pack_analyses(db, [analysis])[0]
+    with db:
+        # Removing the job first also takes the write lock
+        if not db.execute(FINISH_JOB, (job_id, lease)).rowcount:
+            return False
+        date_recorded = db.execute(SELECT_JOB_DREAM, (dream_id,)).fetchone()[2]
+        db.execute(UPDATE_ANALYSIS, (packed, analysis['sentiment']['compound'], dream_id))
+        _insert_labels(db, [(dream_id, analysis)])
+        _update_insights(db, user_id, [(date_recorded, analysis)], new_dates=[])
+        db.execute(BUMP_REVISION, (user_id,))
+    return True
+
+def fail_job(db, job_id, dream_id, error, retry, lease):
+    """Record a failed attempt, either requeueing the job or marking the dream failed
+    
+    Does nothing if the job is no longer held under `lease`.
+    """
+    with db:
+        if retry:
+            db.execute(RETRY_JOB, (error, job_id, lease))
+        elif db.execute(FAIL_JOB, (error, job_id, lease)).rowcount:
+            db.execute(FAIL_DREAM, (dream_id,))
+            db.execute(BUMP_DREAM_OWNER_REVISION, (dream_id,))
+
+def requeue_stale_jobs(db, lease_seconds):
+    """Return jobs claimed more than `lease_seconds` ago to the queue, returning how many"""
+    with db:
+        return db.execute(REQUEUE_STALE_JOBS, (f'-{lease_seconds} seconds',)).rowcount
+
+def count_jobs(db):
+    """Return the number of jobs in each status"""
+    counts = {'queued': 0, 'running': 0, 'failed': 0}
+    counts.update(db.execute(COUNT_JOBS).fetchall())
+    return counts
+
+def count_queued_jobs(db):
+    return db.execute(COUNT_QUEUED_JOBS).fetchone()[0]
+
+def get_dream_status(db, dream_id, user_id):
+    """Return a dream's analysis status ('pending', 'done' or 'failed'), or None"""
+    row = db.execute(SELECT_DREAM_STATUS, (dream_id, user_id)).fetchone()
+    return row[0] if row else None
+
+# Insights
+
+def _merge_window(window, scores, newest):
+    # Windows hold [date_recorded, compound] pairs, newest or oldest first.
+    # Later inserts win ties, matching the order of a fresh scan.
+    merged = sorted(scores[::-1] + window if newest else window + scores,
+                    key=lambda entry: entry[0], reverse=newest)
+    return merged[:TREND_WINDOW]
+
+def _day(date_recorded):
+    # Days since 1970-01-01 of a stored date_recorded, None if it is not a date
+    try:
+        return (date.fromisoformat(date_recorded[:10]) - EPOCH_DATE).days
+    except (TypeError, ValueError):
+        return None
+
+def _week_start(day):
+    # Monday of the day's week; 1970-01-01 was a Thursday
+    return day - (day + 3) % 7
+
+def _advance_activity(activity, day, dreams):
+    """Activity counters after `dreams` dreams on `day`, a day no earlier than any counted before"""
+    streak_start, streak_end, longest_streak, week_start, week_dreams = activity
+    if streak_end is None or day > streak_end + 1:
+        streak_start = day
+    streak_end = day
+    longest_streak = max(longest_streak, streak_end - streak_start + 1)
+    if week_start is None or _week_start(day) > week_start:
+        week_start, week_dreams = _week_start(day), 0
+    return streak_start, streak_end, longest_streak, week_start, week_dreams + dreams
+
+def _recount_activity(db, user_id):
+    # Activity counters from all of the user's dream days
+    activity = EMPTY_ACTIVITY
+    for day, dreams in db.execute(SELECT_DREAM_DAYS, (user_id,)).fetchall():
+        activity = _advance_activity(activity, day, dreams)
+    return activity
+
+def _update_activity(db, user_id, dates):
+    """Count new dreams recorded at `dates` in the user's daily and streak counters"""
+    days = {}
+    for date_recorded in dates:
+        day = _day(date_recorded)
+        if day is not None:
+            days[day] = days.get(day, 0) + 1
+    if not days:
+        return
+    db.executemany(INCREMENT_DREAM_DAY, ((user_id, day, dreams) for day, dreams in days.items()))
+    
+    activity = db.execute(SELECT_ACTIVITY, (user_id,)).fetchone()
+    if activity[1] is None or min(days) >= activity[1]:
+        # Usual case: dreams recorded today, after everything counted so far
+        for day in sorted(days):
+            activity = _advance_activity(activity, day, days[day])
+    else:
+        # Backdated dreams can join or lengthen earlier streaks; recount
+        activity = _recount_activity(db, user_id)
+    db.execute(UPDATE_ACTIVITY, (*activity, user_id))
+
+def _update_insights(db, user_id, entries, new_dates=None):
+    """Fold newly analyzed (date_recorded, analysis) entries into the user's aggregates
+    
+    `new_dates` are the dates of dreams to add to the dream count and
+    activity counters, by default those of the entries; dreams saved before
+    their analysis is ready are counted when they are inserted. Must run
+    inside the transaction that wrote the dreams.
+    """
+    emotions = {}
+    themes = {}
+    scores = []
+    for date_recorded, analysis in entries:
+        for emotion in analysis['emotions']:
+            emotions[emotion] = emotions.get(emotion, 0) + 1
+        for theme in analysis['themes']:
+            themes[theme] = themes.get(theme, 0) + 1
+        scores.append([date_recorded, analysis['sentiment']['compound']])
+    
+    if new_dates is None:
+        new_dates = [date_recorded for date_recorded, _ in entries]
+    
+    row = db.execute(SELECT_INSIGHTS, (user_id,)).fetchone()
+    dream_count, sentiment_sum, sentiment_count, newest, oldest = row or EMPTY_INSIGHTS
+    db.execute(UPSERT_INSIGHTS, (
+        user_id,
+        dream_count + len(new_dates),
+        sentiment_sum + sum(score for _, score in scores),
+        sentiment_count + len(scores),
+        json.dumps(_merge_window(json.loads(newest), scores, newest=True)),
+        json.dumps(_merge_window(json.loads(oldest), scores, newest=False))))
+    db.executemany(INCREMENT_EMOTION_COUNT, ((user_id, emotion, n) for emotion, n in emotions.items()))
+    db.executemany(INCREMENT_THEME_COUNT, ((user_id, theme, n) for theme, n in themes.items()))
+    _update_activity(db, user_id, new_dates)
+
+def get_insights(db, user_id, **filters):
+    """Return a user's insight aggregates
+    
+    The keys match the arguments of DreamAnalyzer.summarize_insights.
+    Sentiment windows are lists of [date_recorded, compound] pairs.
+    
+    With no filters the precomputed aggregates are returned; otherwise they
+    are computed for the matching dreams (see list_dream_summaries).
+    """
+    if any(value is not None for value in filters.values()):
+        return _filtered_insights(db, user_id, filters)
+    
+    row = db.execute(SELECT_INSIGHTS, (user_id,)).fetchone()
+    dream_count, sentiment_sum, sentiment_count, newest, oldest = row or EMPTY_INSIGHTS
+    return {
+        'total_dreams': dream_count,
+        'emotion_counts': dict(db.execute(SELECT_EMOTION_COUNTS, (user_id,)).fetchall()),
+        'theme_counts': dict(db.execute(SELECT_THEME_COUNTS, (user_id,)).fetchall()),
+        'sentiment_sum': sentiment_sum,
+        'sentiment_count': sentiment_count,
+        'newest_sentiments': json.loads(newest),
+        'oldest_sentiments': json.loads(oldest)
+    }
+
+def get_stats(db, user_id, today=None):
+    """Return the dashboard's quick stats from the user's precomputed aggregates
+    
+    Days and weeks (starting on Monday) are UTC, like date_recorded.
+    """
+    row = db.execute(SELECT_STATS, (user_id,)).fetchone()
+    if row is None:
+        row = EMPTY_INSIGHTS[:3] + EMPTY_ACTIVITY + (None, None)
+    (dream_count, sentiment_sum, sentiment_count, streak_start, streak_end, longest_streak,
+     week_start, week_dreams, top_emotion, top_theme) = row
+    
+    today = ((today or datetime.now(timezone.utc).date()) - EPOCH_DATE).days
+    # A streak lasts until a whole day passes without a dream
+    current_streak = streak_end - streak_start + 1 if streak_end is not None and streak_end >= today - 1 else 0
+    return {
+        'total': dream_count,
+        'this_week': week_dreams if week_start == _week_start(today) else 0,
+        'current_streak': current_streak,
+        'longest_streak': longest_streak,
+        'top_emotion': top_emotion,
+        'top_theme': top_theme,
+        'average_sentiment': round(sentiment_sum / sentiment_count, 3) if sentiment_count else None
+    }
+
+def _filtered_insights(db, user_id, filters):
+    where, params = _filter_clause(user_id, filters)
+    params['window'] = TREND_WINDOW
+    dream_count, sentiment_sum, sentiment_count = db.execute(
+        SELECT_RANGE_TOTALS.format(where=where), params).fetchone()
+    return {
+        'total_dreams': dream_count,
+        'emotion_counts': dict(db.execute(SELECT_RANGE_EMOTION_COUNTS.format(where=where), params).fetchall()),
+        'theme_counts': dict(db.execute(SELECT_RANGE_THEME_COUNTS.format(where=where), params).fetchall()),
+        'sentiment_sum': sentiment_sum,
+        'sentiment_count': sentiment_count,
+        'newest_sentiments': [list(row) for row in db.execute(
+            SELECT_RANGE_SENTIMENTS.format(where=where, order='DESC'), params)],
+        'oldest_sentiments': [list(row) for row in db.execute(
+            SELECT_RANGE_SENTIMENTS.format(where=where, order='ASC'), params)]
+    }
+
+def get_sentiment_series(db, user_id, **filters):
+    """Return (unix_timestamp, compound) pairs for a user's analyzed dreams, in no particular order"""
+    where, params = _filter_clause(user_id, filters)
+    return db.execute(SELECT_SENTIMENT_SERIES.format(where=where), params).fetchall()
+
+def rebuild_insights(db, user_id=None):
+    """Recompute insight aggregates from the dreams table
+    
+    Rebuilds one user, or everyone when user_id is None. Must run inside a
+    transaction.
+    """
+    where = 'WHERE user_id = :user_id' if user_id is not None else ''
+    params = {'user_id': user_id, 'window': TREND_WINDOW}
+    
+    db.execute(f"UPDATE users SET revision = revision + 1 {where.replace('user_id', 'id', 1)}", params)
+    
+    for table in ('user_insights', 'user_emotion_counts', 'user_theme_counts', 'user_dream_days'):
+        db.execute(f'DELETE FROM {table} {where}', params)
+    
+    db.execute(f'''
+        INSERT INTO user_insights (user_id, dream_count, sentiment_sum, sentiment_count)
+        SELECT user_id, COUNT(*), COALESCE(SUM(sentiment), 0), COUNT(sentiment)
+        FROM dreams {where} GROUP BY user_id
+    ''', params)
+    
+    for table, label, source in (('user_emotion_counts', 'emotion', 'dream_emotions'),
+                                 ('user_theme_counts', 'theme', 'dream_themes')):
+        db.execute(f'''
+            INSERT INTO {table} (user_id, {label}, dreams)
+            SELECT d.user_id, l.{label}, COUNT(*)
+            FROM dreams d JOIN {source} l ON l.dream_id = d.id
+            {where.replace('user_id', 'd.user_id', 1)}
+            GROUP BY d.user_id, l.{label}
+        ''', params)
+    
+    for order, column in (('DESC', 'newest_sentiments'), ('ASC', 'oldest_sentiments')):
+        db.execute(f'''
+            UPDATE user_insights SET {column} = (
+                SELECT json_group_array(json_array(date_recorded, sentiment)) FROM (
+                    SELECT date_recorded, sentiment FROM dreams
+                    WHERE dreams.user_id = user_insights.user_id AND sentiment IS NOT NULL
+                    ORDER BY date_recorded {order}, id {order} LIMIT :window
+                )
+            ) {where}
+        ''', params)
+    
+    db.execute(f'''
+        INSERT INTO user_dream_days (user_id, day, dreams)
+        SELECT user_id, day, COUNT(*) FROM (
+            SELECT user_id, {DREAM_DAY} AS day FROM dreams {where}
+        ) WHERE day IS NOT NULL GROUP BY user_id, day
+    ''', params)
+    user_ids = [user_id] if user_id is not None else [row[0] for row in db.execute('SELECT user_id FROM user_insights')]
+    db.executemany(UPDATE_ACTIVITY, [(*_recount_activity(db, rebuilt_user_id), rebuilt_user_id)
+                                     for rebuilt_user_id in user_ids])
+
+# Analytics rollups
+
+def rollup_dreams(db, batch_size=ROLLUP_BATCH_SIZE):
+    """Fold the next batch of dreams into the daily rollups, returning how many were read
+    
+    Returns 0 once every dream before the first pending one is rolled up.
+    Failed dreams are passed over. Dreams reanalyzed later are not updated;
+    call reset_rollups and roll up again.
+    """
+    with db:
+        # Write first, so the transaction holds the write lock before it reads
+        db.execute(INIT_ROLLUP_MARK)
+        mark = db.execute(SELECT_ROLLUP_MARK).fetchone()[0]
+        last_id, count = db.execute(SELECT_ROLLUP_BATCH, {'mark': mark, 'limit': batch_size}).fetchone()
+        if not count:
+            return 0
+        for statement in (ROLLUP_DREAMS, ROLLUP_EMOTIONS, ROLLUP_THEMES):
+            db.execute(statement, (mark, last_id))
+        db.execute(UPDATE_ROLLUP_MARK, (last_id,))
+    return count
+
+def reset_rollups(db):
+    """Empty the rollups, so that the next rollup_dreams starts from the first dream"""
+    with db:
+        for table in ('rollup_state', 'daily_dream_rollups', 'daily_emotion_rollups', 'daily_theme_rollups'):
+            db.execute(f'DELETE FROM {table}')
+
+def get_rollups(db, since, until):
+    """Return cross-user totals for the days from `since` up to (not including) `until`
+    
+    Only reads the rollup tables; dreams after `rolled_up_through` (a dream
+    id) are not counted yet.
+    """
+    params = ((since - EPOCH_DATE).days, (until - EPOCH_DATE).days)
+    mark = db.execute(SELECT_ROLLUP_MARK).fetchone()
+    days = db.execute(SELECT_DAILY_ROLLUPS, params).fetchall()
+    dream_count = sum(row[1] for row in days)
+    sentiment_sum = sum(row[2] for row in days)
+    sentiment_count = sum(row[3] for row in days)
+    return {
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'rolled_up_through': mark[0] if mark else 0,
+        'dreams': dream_count,
+        'average_sentiment': round(sentiment_sum / sentiment_count, 3) if sentiment_count else None,
+        'days': [{'date': (EPOCH_DATE + timedelta(days=day)).isoformat(), 'dreams': dreams,
+                  'average_sentiment': round(total / scored, 3) if scored else None}
+                 for day, dreams, total, scored in days],
+        'emotions': [{'emotion': emotion, 'dreams': dreams, 'mentions': mentions}
+                     for emotion, dreams, mentions in db.execute(SELECT_EMOTION_ROLLUPS, params)],
+        'themes': [{'theme': theme, 'dreams': dreams, 'mentions': mentions}
+                   for theme, dreams, mentions in db.execute(SELECT_THEME_ROLLUPS, params)]
+    }
+
+# Analysis cache
+
+def get_cached_analysis(db, key):
+    """Return the JSON-encoded analysis cached under `key`, or None"""
+    row = db.execute(SELECT_CACHED_ANALYSIS, (key,)).fetchone()
+    return row[0] if row else None
+
+def put_cached_analysis(db, key, analysis, version, max_rows=None):
+    """Cache an encoded analysis under `key`, keeping at most `max_rows` rows"""
+    with db:
+        db.execute(INSERT_CACHED_ANALYSIS, (key, analysis, version))
+        if max_rows is not None:
+            db.execute(TRIM_CACHED_ANALYSES, (max_rows,))
+
+def purge_cached_analyses(db, version):
+    """Delete cached analyses made by any other analyzer version, returning how many"""
+    with db:
+        return db.execute(PURGE_CACHED_ANALYSES, (version,)).rowcount
@@ -0,0 +1,86 @@
+"""
+Rendered-response cache and ETags for per-user pages.
+
+Every write to a user's dreams bumps that user's revision counter (see
+repository.get_revision), so a response that only depends on the user's
+dreams and the request URL is fully identified by (user, revision, URL).
+That key gives a strong ETag, answering conditional requests with
+`304 Not Modified` after a single primary-key lookup, and it keys an
+in-memory LRU of rendered bodies, so repeat loads skip both the queries and
+the template rendering. Entries never need invalidating: a write changes the
+revision and the old body is replaced on the next load.
+
+ETags also cover a digest of the app's code and templates, so a deploy never
+revalidates a page rendered by the previous version.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+def source_digest(root, template_folder='templates'):
+    """Digest of the Python modules in `root` and the templates in its template folder"""
+    paths = [os.path.join(root, name) for name in sorted(os.listdir(root)) if name.endswith('.py')]
+    templates = os.path.join(root, template_folder)
+    if os.path.isdir(templates):
+        paths += [os.path.join(templates, name) for name in sorted(os.listdir(templates))]
+    
+    digest = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                digest.update(os.path.basename(path).encode())
+                digest.update(f.read())
+    return digest.hexdigest()
+
+class ResponseCache:
+    def __init__(self, maxsize=512, version=''):
+        """Keep the rendered bodies of up to `maxsize` (user, URL) pairs
+        
+        `version` identifies the code that renders them and is part of every
+        ETag.
+        """
+        self.maxsize = maxsize
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+    
+    def etag(self, user_id, revision, url):
+        """Strong ETag of a user's response for `url` at a revision"""
+        key = f'{self.version}\0{user_id}\0{revision}\0{url}'
+        return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+    
+    def get(self, user_id, revision, url):
+        """Return a cached (body, mimetype) rendered at `revision`, or None"""
+        with self._lock:
+            entry = self._entries.get((user_id, url))
+            if entry is not None and entry[0] == revision:
+                self._entries.move_to_end((user_id, url))
+                self.hits += 1
+                return entry[1:]
+            self.misses += 1
+            return None
+    
+    def put(self, user_id, revision, url, body, mimetype):
+        """Store a body rendered at `revision`, replacing older revisions of the same URL"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[(user_id, url)] = (revision, body, mimetype)
+            self._entries.move_to_end((user_id, url))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+    
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'not_modified': self.not_modified}
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Batch job that rolls dreams up into the cross-user daily analytics tables.
+
+Each run folds in the dreams added since the previous one (tracked by a
+high-water mark on the dream id), a batch per transaction, so operators'
+range queries on /api/admin/analytics never scan or decode the dreams table.
+Run it from cron, or keep it running with --watch. Pass --rebuild after
+`rebuild_insights.py --reanalyze` to recompute the rollups from scratch.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import repository
+
+def roll_up(db, batch_size):
+    """Roll up every dream available, returning how many were read"""
+    total = 0
+    while True:
+        count = repository.rollup_dreams(db, batch_size)
+        if not count:
+            break
+        total += count
+        print(f"  rolled up {total} dreams", end="\r")
+    if total:
+        print()
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll up Dream Journal AI dreams into daily analytics")
+    parser.add_argument('--db', default=os.environ.get('DREAM_JOURNAL_DB', 'dream_journal.db'),
+                        help="database file (default: $DREAM_JOURNAL_DB or dream_journal.db)")
+    parser.add_argument('--batch-size', type=int, default=repository.ROLLUP_BATCH_SIZE,
+                        help="dreams rolled up per transaction")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="empty the rollups first and roll up every dream again")
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help="keep running, rolling up new dreams every SECONDS")
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        sys.exit(1)
+    
+    pool = repository.get_pool(args.db)
+    with pool.connection() as db:
+        repository.init_db(db)
+        
+        if args.rebuild:
+            print("🧹 Emptying the analytics rollups...")
+            repository.reset_rollups(db)
+        
+        while True:
+            start = time.perf_counter()
+            total = roll_up(db, args.batch_size)
+            if total or args.watch is None:
+                print(f"✅ Rolled up {total} new dreams in {time.perf_counter() - start:.1f}s")
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Sentiment time series for the insights charts.
+
+Works on a user's (timestamp, compound) history as NumPy arrays: a trailing
+rolling mean over a time window, an exponentially weighted moving average,
+weekly and monthly buckets and a least-squares trend. Everything is
+vectorized, so a history of 100k dreams takes milliseconds.
+"""
+
+from itertools import chain
+
+import numpy as np
+
+DAY = 86400
+
+# Points in the 'points' series returned by summarize
+RECENT_POINTS = 500
+
+def load(rows):
+    """Turn (unix_timestamp, compound) rows into float arrays sorted by time"""
+    if not isinstance(rows, list):
+        rows = list(rows)
+    # Flattening first is about twice as fast as np.array on a list of tuples
+    data = np.fromiter(chain.from_iterable(rows), dtype=float, count=2 * len(rows)).reshape(-1, 2)
+    order = np.argsort(data[:, 0], kind='stable')
+    return data[order, 0], data[order, 1]
+
+def rolling_mean(timestamps, scores, window_days=7):
+    """Mean of each score and those recorded in the preceding `window_days`"""
+    first = np.searchsorted(timestamps, timestamps - window_days * DAY, side='right')
+    sums = np.concatenate(([0.0], np.cumsum(scores)))
+    last = np.arange(1, len(scores) + 1)
+    return (sums[last] - sums[first]) / (last - first)
+
+def ewma(scores, span=10):
+    """Exponentially weighted moving average, alpha = 2 / (span + 1)
+    
+    The recurrence y[i] = alpha * x[i] + (1 - alpha) * y[i - 1] is solved in
+    closed form with cumulative sums, one block at a time so the weights stay
+    within floating point range.
+    """
+    if span < 1:
+        raise ValueError('span must be at least 1')
+    alpha = 2 / (span + 1)
+    decay = 1 - alpha
+    result = np.empty(len(scores))
+    if len(scores) == 0 or decay == 0:
+        result[:] = scores
+        return result
+    
+    # Weights grow as decay ** -i within a block; keep them below 1e50
+    block = max(1, int(np.log(1e50) / -np.log(decay)))
+    powers = decay ** np.arange(min(block, len(scores)))
+    previous = scores[0]
+    for start in range(0, len(scores), block):
+        chunk = scores[start:start + block]
+        weights = powers[:len(chunk)]
+        result[start:start + len(chunk)] = weights * (decay * previous + alpha * np.cumsum(chunk / weights))
+        previous = result[start + len(chunk) - 1]
+    return result
+
+def _period_starts(timestamps, period):
+    # Bucket key of every timestamp, as a datetime64 day
+    days = (timestamps // DAY).astype(np.int64)
+    if period == 'week':
+        # Day 0 (1970-01-01) was a Thursday; weeks start on Monday
+        return (days - (days + 3) % 7).astype('datetime64[D]')
+    if period == 'month':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError(f'Unknown period: {period!r}')
+
+def buckets(timestamps, scores, period='week'):
+    """Count, mean, min and max of the scores in each week or month"""
+    if len(scores) == 0:
+        return []
+    keys = _period_starts(timestamps, period)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    counts = np.diff(np.append(starts, len(scores)))
+    means = np.add.reduceat(scores, starts) / counts
+    return [{
+        'start': start,
+        'count': count,
+        'mean': round(mean, 4),
+        'min': low,
+        'max': high
+    } for start, count, mean, low, high in zip(np.datetime_as_string(keys[starts]).tolist(),
+                                                counts.tolist(), means.tolist(),
+                                                np.minimum.reduceat(scores, starts).tolist(),
+                                                np.maximum.reduceat(scores, starts).tolist())]
+
+def slope(timestamps, scores):
+    """Least-squares trend of the scores, in compound points per day
+    
+    Histories spanning less than a day have no meaningful daily trend and
+    return 0.
+    """
+    if len(scores) < 2 or timestamps.max() - timestamps.min() < DAY:
+        return 0.0
+    days = (timestamps - timestamps.mean()) / DAY
+    return float(np.dot(days, scores - scores.mean()) / np.dot(days, days))
+
+def summarize(rows, window_days=7, span=10, points=RECENT_POINTS):
+    """Compute every series for the insights charts
+    
+    `rows` are (unix_timestamp, compound) pairs in any order. The `points`
+    most recent dreams are returned individually with their rolling mean
+    and EWMA; the buckets and slope cover the whole history.
+    """
+    timestamps, scores = load(rows)
+    recent = slice(max(len(scores) - points, 0), None)
+    dates = np.datetime_as_string(timestamps[recent].astype('datetime64[s]'), unit='s')
+    
+    return {
+        'count': len(scores),
+        'average': float(scores.mean()) if len(scores) else 0.0,
+        'slope_per_day': slope(timestamps, scores),
+        'points': [{
+            'date': date.replace('T', ' '),
+            'sentiment': score,
+            'rolling_mean': round(mean, 4),
+            'ewma': round(smoothed, 4)
+        } for date, score, mean, smoothed in zip(dates.tolist(),
+                                                 scores[recent].tolist(),
+                                                 rolling_mean(timestamps, scores, window_days)[recent].tolist(),
+                                                 ewma(scores, span)[recent].tolist())],
+        'weekly': buckets(timestamps, scores, 'week'),
+        'monthly': buckets(timestamps, scores, 'month')
+    }
@@ -0,0 +1,53 @@
+import copy
+
+import pytest
+
+import repository
+
+# An analysis as DreamAnalyzer.analyze_dream returns it, for tests that
+# store dreams without running NLTK
+ANALYSIS = {
+    'sentiment': {'neg': 0.0, 'neu': 0.889, 'pos': 0.111, 'compound': 0.3333},
+    'emotions': {'joy': 1},
+    'themes': {'water': 1, 'flying': 1},
+    'interpretation': 'This dream appears to have a positive overall tone.',
+    'structure': {'sentence_count': 1, 'avg_sentence_length': 9.0, 'narrative_flow': 'Brief narrative'},
+    'word_count': 10,
+    'unique_words': 5,
+    'features': {'columns': [31427, 41817, 20510], 'counts': [1, 1, 2]},
+    'analyzed_at': '2026-01-01T00:00:00'
+}
+
+def nltk_installed():
+    """Whether NLTK and the data DreamAnalyzer loads are installed"""
+    try:
+        import nltk
+        for path in ('tokenizers/punkt', 'corpora/stopwords', 'sentiment/vader_lexicon.zip', 'corpora/wordnet'):
+            nltk.data.find(path)
+    except (ImportError, LookupError):
+        return False
+    return True
+
+# Tests that run real analyses; the data comes from setup_nltk.py
+requires_nltk = pytest.mark.skipif(not nltk_installed(), reason='needs NLTK and its data (run setup_nltk.py)')
+
+def make_analysis(**changes):
+    analysis = copy.deepcopy(ANALYSIS)
+    analysis.update(changes)
+    return analysis
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'journal.db')
+    with repository.get_pool(path).connection() as db:
+        repository.init_db(db)
+    return path
+
+@pytest.fixture
+def db(db_path):
+    with repository.get_pool(db_path).connection() as db:
+        yield db
+
+@pytest.fixture
+def user_id(db):
+    return repository.create_user(db, 'dreamer', 'x')
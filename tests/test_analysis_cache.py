@@ -0,0 +1,54 @@
+from analysis_cache import AnalysisCache
+from conftest import ANALYSIS
+
+def test_key_ignores_whitespace_but_not_version():
+    key = AnalysisCache.key(5, 'I flew  over\nthe sea. ')
+    assert key == AnalysisCache.key(5, ' I flew over the sea.')
+    assert key != AnalysisCache.key(4, 'I flew over the sea.')
+    assert key != AnalysisCache.key(5, 'I flew over the lake.')
+
+def test_lru_eviction():
+    cache = AnalysisCache(maxsize=2)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    assert cache.get('a') == {'n': 1}
+    cache.put('c', {'n': 3})
+    
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1} and cache.get('c') == {'n': 3}
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 3, 'persistent_hits': 0,
+                             'misses': 1, 'evictions': 1}
+
+def test_entries_are_copies():
+    cache = AnalysisCache()
+    analysis = {'emotions': {'joy': 1}}
+    cache.put('a', analysis)
+    analysis['emotions']['joy'] = 2
+    cache.get('a')['emotions']['fear'] = 1
+    assert cache.get('a') == {'emotions': {'joy': 1}}
+
+def test_persistent_tier_survives_restarts(db_path):
+    AnalysisCache(path=db_path).put('a', ANALYSIS, version='5')
+    
+    cache = AnalysisCache(path=db_path)
+    assert cache.get('a') == ANALYSIS
+    assert cache.get('a') == ANALYSIS
+    assert (cache.stats()['persistent_hits'], cache.stats()['hits']) == (1, 1)
+
+def test_persistent_tier_is_trimmed(db_path):
+    cache = AnalysisCache(maxsize=1, path=db_path, max_rows=2)
+    for key in 'abc':
+        cache.put(key, {'key': key})
+    cache.clear()
+    assert cache.get('a') is None
+    assert cache.get('b') == {'key': 'b'} and cache.get('c') == {'key': 'c'}
+
+def test_purge_keeps_the_current_version(db_path):
+    cache = AnalysisCache(path=db_path)
+    cache.put('old', {'n': 1}, version='4')
+    cache.put('new', {'n': 2}, version='5')
+    assert cache.purge('5') == 1
+    cache.clear()
+    assert cache.get('old') is None
+    assert cache.get('new') == {'n': 2}
+    assert AnalysisCache().purge('5') == 0
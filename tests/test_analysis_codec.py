@@ -0,0 +1,83 @@
+import json
+import struct
+
+import pytest
+
+import analysis_codec
+import repository
+from conftest import make_analysis
+from dream_analyzer import generate_interpretation
+
+LABEL_IDS = {('emotion', 'joy'): 1, ('emotion', 'fear'): 2, ('theme', 'water'): 3, ('theme', 'flying'): 4}
+LABEL_NAMES = {label_id: name for (kind, name), label_id in LABEL_IDS.items()}
+
+def round_trip(analysis):
+    return analysis_codec.decode(analysis_codec.encode(analysis, LABEL_IDS), LABEL_NAMES)
+
+def test_round_trip():
+    analysis = make_analysis(emotions={'fear': 3, 'joy': 1}, themes={'water': 2},
+                             analyzed_at='2026-01-01T12:34:56.789012')
+    del analysis['features']
+    # The interpretation is regenerated rather than stored
+    analysis['interpretation'] = generate_interpretation(analysis['emotions'], analysis['themes'],
+                                                         analysis['sentiment'])
+    assert round_trip(analysis) == analysis
+
+def test_round_trip_keeps_label_order():
+    decoded = round_trip(make_analysis(emotions={'fear': 3, 'joy': 1}, themes={'flying': 2, 'water': 1}))
+    assert list(decoded['emotions']) == ['fear', 'joy']
+    assert list(decoded['themes']) == ['flying', 'water']
+
+@pytest.mark.parametrize('sentiment', [
+    {'neg': 1.0, 'neu': 0.0, 'pos': 0.0, 'compound': -0.9999},
+    {'neg': 0.0, 'neu': 0.0, 'pos': 1.0, 'compound': 0.9999},
+    {'neg': 0.123, 'neu': 0.456, 'pos': 0.421, 'compound': 0.0},
+])
+def test_sentiment_is_exact(sentiment):
+    assert round_trip(make_analysis(sentiment=sentiment))['sentiment'] == sentiment
+
+def test_empty_labels():
+    decoded = round_trip(make_analysis(emotions={}, themes={}))
+    assert decoded['emotions'] == {} and decoded['themes'] == {}
+
+def test_extra_keys_follow_as_json():
+    decoded = round_trip(make_analysis(chunks=3, model='v5'))
+    assert decoded['chunks'] == 3 and decoded['model'] == 'v5'
+    assert 'features' not in decoded
+
+def test_decode_labels():
+    blob = analysis_codec.encode(make_analysis(emotions={'joy': 2}, themes={'water': 1, 'flying': 4}), LABEL_IDS)
+    assert analysis_codec.decode_labels(blob, LABEL_NAMES) == ({'joy': 2}, {'water': 1, 'flying': 4})
+
+@pytest.mark.parametrize('changes', [
+    {'analyzed_at': '2026-01-01T00:00:00+00:00'},
+    {'analyzed_at': 'yesterday'},
+    {'word_count': -1},
+    {'sentiment': {'neg': 0.0, 'neu': 1.0, 'pos': 0.0}},
+    {'emotions': {'awe': 1}},
+])
+def test_unpackable_analyses_are_rejected(changes):
+    with pytest.raises((KeyError, ValueError, struct.error)):
+        analysis_codec.encode(make_analysis(**changes), LABEL_IDS)
+
+def test_unknown_version_is_rejected():
+    blob = bytearray(analysis_codec.encode(make_analysis(), LABEL_IDS))
+    blob[0] = analysis_codec.FORMAT_VERSION + 1
+    with pytest.raises(ValueError):
+        analysis_codec.decode(bytes(blob), LABEL_NAMES)
+
+def test_repository_stores_packed_analyses(db, user_id):
+    analysis = make_analysis(emotions={'wonder': 2}, themes={'ocean': 1})
+    dream_id = repository.add_dream(db, user_id, 'Sea', 'I swam in the sea.', analysis)
+    stored = db.execute('SELECT analysis FROM dreams WHERE id = ?', (dream_id,)).fetchone()[0]
+    assert isinstance(stored, bytes)
+    decoded = repository.get_dream(db, dream_id, user_id)['analysis']
+    assert decoded['emotions'] == {'wonder': 2} and decoded['themes'] == {'ocean': 1}
+    assert decoded['sentiment'] == analysis['sentiment']
+
+def test_repository_keeps_unpackable_analyses_as_json(db, user_id):
+    analysis = make_analysis(analyzed_at='2026-01-01T00:00:00+00:00')
+    dream_id = repository.add_dream(db, user_id, 'Sea', 'I swam in the sea.', analysis)
+    stored = db.execute('SELECT analysis FROM dreams WHERE id = ?', (dream_id,)).fetchone()[0]
+    assert json.loads(stored)['analyzed_at'] == analysis['analyzed_at']
+    assert repository.get_dream(db, dream_id, user_id)['analysis']['analyzed_at'] == analysis['analyzed_at']
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import repository
+from analysis_queue import AnalysisQueue, QueueFull
+from conftest import make_analysis
+
+class FakeAnalyzer:
+    """Stands in for DreamAnalyzer, failing the first `failures` analyses"""
+    
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+    
+    def analyze_in_executor(self, text, timings=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError('analysis failed')
+        return make_analysis()
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+@pytest.fixture
+def make_queue(db_path):
+    queues = []
+    
+    def make(analyzer, **options):
+        queue = AnalysisQueue(analyzer, db_path, workers=1, poll_interval=0.05, **options)
+        queues.append(queue)
+        return queue
+    
+    yield make
+    for queue in queues:
+        queue.stop(timeout=10)
+
+def test_claim_is_leased(db, user_id):
+    dream_id = repository.add_pending_dream(db, user_id, 'Sea', 'I swam in the sea.')
+    job_id, claimed_dream, attempts, owner, content = repository.claim_job(db, 'lease-a')
+    assert (claimed_dream, attempts, owner, content) == (dream_id, 1, user_id, 'I swam in the sea.')
+    assert repository.claim_job(db, 'lease-b') is None
+    
+    # Only the lease holder completes the job
+    assert not repository.complete_job(db, job_id, dream_id, user_id, make_analysis(), 'lease-b')
+    assert repository.get_dream_status(db, dream_id, user_id) == 'pending'
+    assert repository.complete_job(db, job_id, dream_id, user_id, make_analysis(), 'lease-a')
+    assert repository.get_dream_status(db, dream_id, user_id) == 'done'
+    assert repository.count_jobs(db) == {'queued': 0, 'running': 0, 'failed': 0}
+
+def test_failed_job_is_retried_then_marked_failed(db, user_id):
+    dream_id = repository.add_pending_dream(db, user_id, 'Sea', 'I swam in the sea.')
+    job_id = repository.claim_job(db, 'a')[0]
+    repository.fail_job(db, job_id, dream_id, 'boom', retry=True, lease='a')
+    assert repository.count_jobs(db)['queued'] == 1
+    
+    job_id, _, attempts, _, _ = repository.claim_job(db, 'b')
+    assert attempts == 2
+    repository.fail_job(db, job_id, dream_id, 'boom', retry=False, lease='b')
+    assert repository.count_jobs(db)['failed'] == 1
+    assert repository.get_dream_status(db, dream_id, user_id) == 'failed'
+
+def test_stale_jobs_are_requeued(db, user_id):
+    dream_id = repository.add_pending_dream(db, user_id, 'Sea', 'I swam in the sea.')
+    job_id = repository.claim_job(db, 'dead-worker')[0]
+    assert repository.requeue_stale_jobs(db, 600) == 0
+    
+    with db:
+        db.execute("UPDATE analysis_jobs SET updated_at = datetime('now', '-20 minutes')")
+    assert repository.requeue_stale_jobs(db, 600) == 1
+    
+    # The old lease can no longer complete or fail the job
+    assert repository.claim_job(db, 'new-worker')[0] == job_id
+    assert not repository.complete_job(db, job_id, dream_id, user_id, make_analysis(), 'dead-worker')
+    repository.fail_job(db, job_id, dream_id, 'late', retry=False, lease='dead-worker')
+    assert repository.count_jobs(db)['running'] == 1
+    assert repository.complete_job(db, job_id, dream_id, user_id, make_analysis(), 'new-worker')
+
+def test_enqueue_is_bounded(db, user_id, make_queue):
+    queue = make_queue(FakeAnalyzer(), max_pending=2)
+    queue.enqueue(db, user_id, 'One', 'First dream.')
+    queue.enqueue(db, user_id, 'Two', 'Second dream.')
+    with pytest.raises(QueueFull):
+        queue.enqueue(db, user_id, 'Three', 'Third dream.')
+    assert queue.stats()['rejected'] == 1
+    assert repository.count_jobs(db)['queued'] == 2
+
+def test_worker_retries_failed_analyses(db, user_id, make_queue):
+    analyzer = FakeAnalyzer(failures=1)
+    queue = make_queue(analyzer, max_attempts=3)
+    dream_id = queue.enqueue(db, user_id, 'Sea', 'I swam in the sea.')
+    queue.start()
+    assert wait_until(lambda: repository.get_dream_status(db, dream_id, user_id) == 'done')
+    assert wait_until(lambda: queue.stats()['processed'] == 1)
+    stats = queue.stats()
+    assert (stats['failures'], stats['in_flight']) == (1, 0)
+
+def test_worker_survives_database_errors(db, user_id, make_queue, monkeypatch):
+    claim_job = repository.claim_job
+    errors = []
+    
+    def locked_once(db, lease):
+        if not errors:
+            errors.append(lease)
+            raise sqlite3.OperationalError('database is locked')
+        return claim_job(db, lease)
+    
+    monkeypatch.setattr(repository, 'claim_job', locked_once)
+    queue = make_queue(FakeAnalyzer())
+    dream_id = queue.enqueue(db, user_id, 'Sea', 'I swam in the sea.')
+    queue.start()
+    assert wait_until(lambda: repository.get_dream_status(db, dream_id, user_id) == 'done')
+    assert errors and all(thread.is_alive() for thread in queue._threads)
+
+def test_in_flight_is_released_when_recording_a_failure_fails(db, user_id, make_queue, monkeypatch):
+    def fail_job(*args, **kwargs):
+        raise sqlite3.OperationalError('database is locked')
+    
+    monkeypatch.setattr(repository, 'fail_job', fail_job)
+    queue = make_queue(FakeAnalyzer(failures=1), lease_seconds=600)
+    queue.enqueue(db, user_id, 'Sea', 'I swam in the sea.')
+    queue.start()
+    assert wait_until(lambda: queue.stats()['failures'] == 1)
+    assert queue.stats()['in_flight'] == 0
+    assert all(thread.is_alive() for thread in queue._threads)
+    # Left running under its lease, to be requeued when it runs out
+    assert repository.count_jobs(db)['running'] == 1
@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import pytest
+
+# Read by app.py at import
+os.environ['DREAM_JOURNAL_DB'] = os.path.join(tempfile.mkdtemp(), 'app.db')
+os.environ['ADMIN_USERS'] = 'admin'
+os.environ['ANALYZER_WARMUP'] = 'lazy'
+os.environ['ANALYSIS_EXECUTOR'] = 'thread'
+
+import app as dream_journal
+import repository
+from conftest import make_analysis
+
+dream_journal.init_db()
+
+def login(username):
+    client = dream_journal.app.test_client()
+    client.post('/register', data={'username': username, 'password': 'secret'})
+    assert client.post('/login', data={'username': username, 'password': 'secret'}).status_code == 200
+    return client
+
+def add_dream(username, title):
+    with repository.get_pool(dream_journal.app.config['DATABASE']).connection() as db:
+        user_id = repository.get_credentials(db, username)[0]
+        return repository.add_dream(db, user_id, title, 'I dreamt.', make_analysis())
+
+@pytest.mark.parametrize('path', ['/api/queue/stats', '/api/admin/analytics'])
+def test_cross_user_endpoints_are_for_admins(path):
+    assert dream_journal.app.test_client().get(path).status_code == 401
+    assert login('dreamer').get(path).status_code == 403
+    assert login('admin').get(path).status_code == 200
+
+def test_queue_stats():
+    stats = login('admin').get('/api/queue/stats').json
+    assert {'queued', 'running', 'failed', 'in_flight', 'processed'} <= stats.keys()
+
+def test_dream_etag():
+    client = login('etag')
+    dream_id = add_dream('etag', 'Flight')
+    response = client.get(f'/api/dream/{dream_id}')
+    assert response.status_code == 200 and response.json['title'] == 'Flight'
+    etag = response.headers['ETag']
+
+    response = client.get(f'/api/dream/{dream_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.headers['ETag'] == etag
+
+    # Any write to the user's dreams changes the tag
+    add_dream('etag', 'Fall')
+    response = client.get(f'/api/dream/{dream_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+def test_etags_are_per_user():
+    owner = login('owner')
+    dream_id = add_dream('owner', 'Flight')
+    etag = owner.get(f'/api/dream/{dream_id}').headers['ETag']
+    response = login('stranger').get(f'/api/dream/{dream_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 404 and 'ETag' not in response.headers
@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import requires_nltk
+from dream_analyzer import DreamAnalyzer
+
+pytestmark = requires_nltk
+
+THEMES = {
+    'loss': ['lost mother', 'empty house'],
+    'water': ['ocean', 'water']
+}
+EMOTIONS = {
+    'anger': ['mad'],
+    'fear': ['dark forest', 'scared']
+}
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return DreamAnalyzer(THEMES, EMOTIONS)
+
+def test_multi_word_keywords_match_as_phrases(analyzer):
+    analysis = analyzer.analyze_dream('I lost my mother near the ocean. Then I walked into a dark forest.')
+    assert analysis['themes'] == {'loss': 1, 'water': 1}
+    assert analysis['emotions'] == {'fear': 1}
+
+def test_phrase_words_out_of_order_do_not_match(analyzer):
+    analysis = analyzer.analyze_dream('My mother was never lost. The forest was dark.')
+    assert 'loss' not in analysis['themes']
+    assert 'fear' not in analysis['emotions']
+
+def test_keywords_match_whole_tokens(analyzer):
+    assert 'anger' not in analyzer.analyze_dream('I made a boat.')['emotions']
+    assert analyzer.analyze_dream('I was mad, so mad.')['emotions'] == {'anger': 2}
+
+def test_chunked_analysis_matches_phrases_too():
+    text = ' '.join(['I lost my mother in an empty house.', 'The ocean was calm.'] * 20)
+    whole = DreamAnalyzer(THEMES, EMOTIONS, chunk_chars=len(text) + 1).analyze_dream(text)
+    chunked = DreamAnalyzer(THEMES, EMOTIONS, chunk_chars=200).analyze_dream(text)
+    assert 'sentiment_arc' in chunked
+    assert chunked['themes'] == whole['themes'] == {'loss': 40, 'water': 20}
+
+def test_set_lexicons_rebuilds_the_indexes():
+    analyzer = DreamAnalyzer(THEMES, EMOTIONS)
+    analyzer.analyze_dream('Warm up.')
+    version = analyzer.version
+    analyzer.set_lexicons(dream_themes={'flight': ['paper plane']})
+    assert analyzer.version != version
+    assert analyzer.analyze_dream('I folded a paper plane.')['themes'] == {'flight': 1}
+    analyzer.shutdown_executor()
@@ -0,0 +1,80 @@
+import base64
+import json
+
+import pytest
+
+import repository
+from conftest import make_analysis
+
+def add(db, user_id, title, date_recorded, **changes):
+    return repository.add_dream(db, user_id, title, f'{title} dream.', make_analysis(**changes),
+                                date_recorded=date_recorded)
+
+def all_pages(db, user_id, limit, **filters):
+    titles = []
+    cursor = None
+    while True:
+        dreams, cursor = repository.list_dream_summaries(db, user_id, after=cursor, limit=limit, **filters)
+        titles.append([dream['title'] for dream in dreams])
+        if cursor is None:
+            return titles
+
+def test_pages_are_newest_first(db, user_id):
+    for day in range(1, 6):
+        add(db, user_id, f'Day {day}', f'2024-03-0{day} 07:00:00')
+    assert all_pages(db, user_id, 2) == [['Day 5', 'Day 4'], ['Day 3', 'Day 2'], ['Day 1']]
+
+def test_last_page_has_no_cursor(db, user_id):
+    add(db, user_id, 'One', '2024-03-01 07:00:00')
+    add(db, user_id, 'Two', '2024-03-02 07:00:00')
+    assert all_pages(db, user_id, 2) == [['Two', 'One']]
+    other = repository.create_user(db, 'someone', 'x')
+    assert repository.list_dream_summaries(db, other) == ([], None)
+
+def test_equal_dates_are_ordered_by_id(db, user_id):
+    for title in ('A', 'B', 'C', 'D', 'E'):
+        add(db, user_id, title, '2024-03-01 07:00:00')
+    assert all_pages(db, user_id, 2) == [['E', 'D'], ['C', 'B'], ['A']]
+
+def test_new_dreams_do_not_shift_later_pages(db, user_id):
+    for day in range(1, 5):
+        add(db, user_id, f'Day {day}', f'2024-03-0{day} 07:00:00')
+    first, cursor = repository.list_dream_summaries(db, user_id, limit=2)
+    add(db, user_id, 'Day 9', '2024-03-09 07:00:00')
+    second, _ = repository.list_dream_summaries(db, user_id, after=cursor, limit=2)
+    assert [dream['title'] for dream in first + second] == ['Day 4', 'Day 3', 'Day 2', 'Day 1']
+
+def test_filters_apply_to_every_page(db, user_id):
+    for day in range(1, 8):
+        themes = {'water': 1} if day % 2 else {'flying': 1}
+        add(db, user_id, f'Day {day}', f'2024-03-0{day} 07:00:00', themes=themes)
+    other = repository.create_user(db, 'someone', 'x')
+    add(db, other, 'Other', '2024-03-05 07:00:00', themes={'water': 1})
+    
+    assert all_pages(db, user_id, 2, theme='water') == [['Day 7', 'Day 5'], ['Day 3', 'Day 1']]
+    assert all_pages(db, user_id, 2, since='2024-03-03', until='2024-03-06') == [['Day 5', 'Day 4'], ['Day 3']]
+
+def test_summaries_carry_a_preview(db, user_id):
+    repository.add_dream(db, user_id, 'Long', 'x' * 1000, make_analysis(), date_recorded='2024-03-01 07:00:00')
+    [summary], _ = repository.list_dream_summaries(db, user_id)
+    assert summary['preview'] == 'x' * repository.PREVIEW_LENGTH
+    assert summary['themes'] == make_analysis()['themes']
+    assert 'analysis' not in summary
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+def test_cursor_round_trip():
+    cursor = repository.encode_cursor('2024-03-01 07:00:00', 42)
+    assert repository.decode_cursor(cursor) == ('2024-03-01 07:00:00', 42)
+
+@pytest.mark.parametrize('cursor', ['not a cursor', repository.encode_cursor('2024-03-01', 42)[:-3],
+                                    raw_cursor(['2024-03-01', '42']), raw_cursor([20240301, 42]),
+                                    raw_cursor({'date': '2024-03-01'})])
+def test_malformed_cursors_are_rejected(db, user_id, cursor):
+    with pytest.raises(ValueError):
+        repository.list_dream_summaries(db, user_id, after=cursor)
+
+def test_unknown_filters_are_rejected(db, user_id):
+    with pytest.raises(ValueError):
+        repository.list_dream_summaries(db, user_id, colour='blue')
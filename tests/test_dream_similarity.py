@@ -0,0 +1,64 @@
+import pytest
+
+import repository
+from conftest import make_analysis
+from dream_similarity import SimilarityIndex
+
+def add(db, user_id, *terms):
+    # Hashed features with one count per term id
+    features = {'columns': list(terms), 'counts': [1] * len(terms)}
+    return repository.add_dream(db, user_id, 'Dream', 'I dreamt.', make_analysis(features=features))
+
+@pytest.fixture
+def index():
+    return SimilarityIndex()
+
+def test_similar_dreams_best_first(db, user_id, index):
+    dream = add(db, user_id, 1, 2, 3, 4)
+    close = add(db, user_id, 1, 2, 3, 5)
+    far = add(db, user_id, 1, 6, 7, 8)
+    add(db, user_id, 9, 10)
+    
+    matches = index.similar(db, user_id, dream)
+    assert [dream_id for dream_id, _ in matches] == [close, far]
+    assert 1 > matches[0][1] > matches[1][1] > 0
+
+def test_k_limits_matches(db, user_id, index):
+    dream = add(db, user_id, 1, 2)
+    for _ in range(4):
+        add(db, user_id, 1, 3)
+    assert len(index.similar(db, user_id, dream, k=2)) == 2
+    
+    # A user's only dream has nothing to match
+    alone = repository.create_user(db, 'alone', 'x')
+    assert index.similar(db, alone, add(db, alone, 1, 2)) == []
+
+def test_other_users_dreams_are_not_matched(db, user_id, index):
+    dream = add(db, user_id, 1, 2, 3)
+    add(db, repository.create_user(db, 'someone', 'x'), 1, 2, 3)
+    assert index.similar(db, user_id, dream) == []
+
+def test_unanalyzed_dreams(db, user_id, index):
+    pending = repository.add_pending_dream(db, user_id, 'Pending', 'I dreamt.')
+    assert index.similar(db, user_id, pending) is None
+
+def test_index_catches_up_with_new_and_reanalyzed_dreams(db, user_id, index):
+    dream = add(db, user_id, 1, 2, 3)
+    other = add(db, user_id, 7, 8, 9)
+    assert index.similar(db, user_id, dream) == []
+    
+    new = add(db, user_id, 1, 2, 3)
+    assert [dream_id for dream_id, _ in index.similar(db, user_id, dream)] == [new]
+    
+    repository.update_analyses(db, [(other, make_analysis(features={'columns': [1, 2, 3], 'counts': [1, 1, 1]}))])
+    assert sorted(dream_id for dream_id, _ in index.similar(db, user_id, dream)) == [other, new]
+
+def test_recurring_groups(db, user_id, index):
+    group = [add(db, user_id, 1, 2, 3, 4) for _ in range(3)]
+    pair = [add(db, user_id, 5, 6, 7) for _ in range(2)]
+    add(db, user_id, 8, 9)
+    
+    clusters = index.recurring(db, user_id)
+    assert [cluster['dream_ids'] for cluster in clusters] == [group]
+    assert clusters[0]['similarity'] == pytest.approx(1)
+    assert [cluster['dream_ids'] for cluster in index.recurring(db, user_id, min_size=2)] == [group, pair]
@@ -0,0 +1,112 @@
+import os
+import signal
+import time
+from types import SimpleNamespace
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import journal_io
+from conftest import make_analysis, requires_nltk
+from dream_analyzer import AnalysisBusy, DreamAnalyzer
+
+@pytest.fixture
+def analyzer():
+    analyzer = DreamAnalyzer()
+    analyzer.configure_executor('process', workers=2)
+    yield analyzer
+    analyzer.shutdown_executor()
+
+def wait_for_state(analyzer, state, timeout=10):
+    deadline = time.monotonic() + timeout
+    while analyzer.executor_status()['state'] != state and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return analyzer.executor_status()['state']
+
+@requires_nltk
+def test_warm_up_loads_every_worker_but_not_this_process(analyzer):
+    assert analyzer.executor_status()['state'] == 'cold'
+    analyzer.warm_up_executor(background=False)
+    assert analyzer.executor_status()['state'] == 'ready'
+    assert len(analyzer._executor._processes) == 2
+    assert analyzer.status()['state'] == 'cold'
+
+@requires_nltk
+def test_background_warm_up(analyzer):
+    analyzer.warm_up_executor().join(timeout=60)
+    assert analyzer.executor_status()['state'] == 'ready'
+
+@requires_nltk
+def test_lazy_executor_is_ready_after_first_analysis(analyzer):
+    analysis = analyzer.analyze_in_executor('I was flying over the ocean and felt free.')
+    assert analysis['themes']['flying'] == 1
+    assert wait_for_state(analyzer, 'ready') == 'ready'
+
+@requires_nltk
+def test_thread_executor_reports_this_process():
+    analyzer = DreamAnalyzer()
+    analyzer.configure_executor('thread', workers=1)
+    analyzer.warm_up_executor(background=False)
+    assert analyzer.executor_status() == dict(analyzer.status(), executor='thread')
+    assert analyzer.executor_status()['state'] == 'ready'
+    analyzer.shutdown_executor()
+
+@requires_nltk
+def test_recovers_after_a_worker_dies(analyzer):
+    analyzer.warm_up_executor(background=False)
+    executor = analyzer._executor
+    os.kill(next(iter(executor._processes)), signal.SIGKILL)
+    
+    with pytest.raises(BrokenProcessPool):
+        for _ in range(100):
+            analyzer.analyze_in_executor(f'I was falling into dark water {time.monotonic()}.')
+    assert wait_for_state(analyzer, 'failed') == 'failed'
+    assert analyzer.executor_status()['error']
+    
+    # The next analysis starts a new pool
+    analysis = analyzer.analyze_in_executor('I was flying over the ocean and felt free.')
+    assert analysis['themes']['flying'] == 1
+    assert analyzer._executor is not executor
+    assert wait_for_state(analyzer, 'ready') == 'ready'
+
+@requires_nltk
+def test_warm_up_after_a_worker_died(analyzer):
+    analyzer.warm_up_executor(background=False)
+    os.kill(next(iter(analyzer._executor._processes)), signal.SIGKILL)
+    with pytest.raises(BrokenProcessPool):
+        for _ in range(100):
+            analyzer.analyze_in_executor(f'I was lost in a maze {time.monotonic()}.')
+    analyzer.warm_up_executor(background=False)
+    assert analyzer.executor_status()['state'] == 'ready'
+
+@pytest.fixture
+def busy_analyzer():
+    # Every slot is taken, so nothing reaches the executor
+    analyzer = DreamAnalyzer()
+    analyzer.configure_executor('thread', workers=1, max_concurrent=1)
+    analyzer._slots.acquire()
+    yield analyzer
+    analyzer._slots.release()
+    analyzer.shutdown_executor()
+
+def test_analyze_in_executor_gives_up_waiting_for_a_slot(busy_analyzer):
+    with pytest.raises(AnalysisBusy):
+        busy_analyzer.analyze_in_executor('I was flying.', timeout=0.05)
+
+def test_analyze_many_gives_up_waiting_for_a_slot(busy_analyzer):
+    with pytest.raises(AnalysisBusy):
+        list(busy_analyzer.analyze_many(['I was flying.', 'I was falling.'], timeout=0.05))
+
+def test_import_keeps_dreams_analyzed_before_the_executor_was_busy(db, user_id):
+    def analyze_many(texts):
+        texts = iter(texts)
+        next(texts)
+        yield make_analysis()
+        next(texts)
+        raise AnalysisBusy('busy')
+    
+    dreams = iter([('Sea', 'I swam.', None), ('Sky', 'I flew.', None)])
+    with pytest.raises(AnalysisBusy) as raised:
+        journal_io.import_dreams(db, SimpleNamespace(analyze_many=analyze_many), user_id, dreams)
+    assert raised.value.imported == 1
+    assert db.execute('SELECT title FROM dreams').fetchall() == [('Sea',)]
@@ -0,0 +1,40 @@
+import io
+import json
+
+import pytest
+
+import journal_io
+
+def ndjson(*records):
+    return io.BytesIO(''.join(json.dumps(record) + '\n' for record in records).encode())
+
+def test_reads_ndjson_and_normalizes_dates():
+    stream = ndjson({'title': 'Sea', 'content': 'I swam.', 'date_recorded': '2024-03-01T07:30:00+01:00'},
+                    {'title': 'Sky', 'content': 'I flew.', 'analysis': {'ignored': True}})
+    assert list(journal_io.read_dreams(stream)) == [('Sea', 'I swam.', '2024-03-01 06:30:00'),
+                                                    ('Sky', 'I flew.', None)]
+
+def test_reads_csv():
+    stream = io.BytesIO(b'title,content,date_recorded\r\nSea,"I swam, far.",2024-03-01\r\n')
+    assert list(journal_io.read_dreams(stream, 'csv')) == [('Sea', 'I swam, far.', '2024-03-01 00:00:00')]
+
+@pytest.mark.parametrize('record', [
+    {'title': 'Sea', 'content': {'a': 1}},
+    {'title': 'Sea', 'content': ['I', 'swam']},
+    {'title': 7, 'content': 'I swam.'},
+])
+def test_rejects_non_string_fields(record):
+    dreams = journal_io.read_dreams(ndjson({'title': 'Sky', 'content': 'I flew.'}, record))
+    assert next(dreams) == ('Sky', 'I flew.', None)
+    with pytest.raises(journal_io.InvalidImport, match='Record 2: dream titles and contents must be strings'):
+        next(dreams)
+
+@pytest.mark.parametrize('line, error', [
+    (b'{"title": "Sea"}\n', 'needs a title and content'),
+    (b'{"title": "Sea", "content": "I swam.", "date_recorded": "yesterday"}\n', 'ISO timestamp'),
+    (b'{"title": "Sea", \n', 'Record 1'),
+    (b'{"title": "Sea", "content": "' + b'x' * 11 + b'"}\n', 'longer than 10 characters'),
+])
+def test_rejects_invalid_records(line, error):
+    with pytest.raises(journal_io.InvalidImport, match=error):
+        list(journal_io.read_dreams(io.BytesIO(line), max_length=10))
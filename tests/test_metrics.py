@@ -0,0 +1,49 @@
+import sqlite3
+
+import metrics
+
+def test_counter():
+    registry = metrics.Registry()
+    requests = registry.counter('requests_total', 'Requests served', labels=('route', 'status'))
+    requests.inc('/api/dreams', 200)
+    requests.inc('/api/dreams', 200, amount=2)
+    requests.inc('/say "hi"', 404)
+    assert registry.render().splitlines() == [
+        '# HELP requests_total Requests served',
+        '# TYPE requests_total counter',
+        'requests_total{route="/api/dreams",status="200"} 3',
+        'requests_total{route="/say \\"hi\\"",status="404"} 1',
+    ]
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 3.65',
+        'latency_seconds_count 4',
+    ]
+
+def test_collectors_are_read_at_scrape_time():
+    registry = metrics.Registry()
+    depth = [0]
+    registry.collector(lambda: [('queue_depth', 'gauge', 'Queued jobs', depth[0])])
+    depth[0] = 7
+    assert registry.render().splitlines()[-1] == 'queue_depth 7'
+
+def test_timed_connection_counts_queries(tmp_path):
+    db = sqlite3.connect(str(tmp_path / 'metrics.db'), factory=metrics.TimedConnection)
+    metrics.reset_db_time()
+    db.execute('CREATE TABLE t (x)')
+    db.executemany('INSERT INTO t VALUES (?)', [(1,), (2,)])
+    assert db.execute('SELECT COUNT(*) FROM t').fetchone() == (2,)
+    seconds, queries = metrics.db_time()
+    assert queries == 3 and seconds > 0
+    
+    metrics.reset_db_time()
+    assert metrics.db_time() == (0.0, 0)
+    db.close()
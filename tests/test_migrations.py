@@ -0,0 +1,91 @@
+import json
+import sqlite3
+from datetime import date
+
+import repository
+from conftest import make_analysis
+
+# The schema app.py created before the repository module and its migrations
+V0_SCHEMA = '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE dreams (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        date_recorded TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        emotions TEXT,
+        themes TEXT,
+        analysis TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+'''
+
+def make_v0_database(path, dreams):
+    conn = sqlite3.connect(path)
+    conn.executescript(V0_SCHEMA)
+    conn.execute("INSERT INTO users (username, password_hash) VALUES ('dreamer', 'x')")
+    for title, content, date_recorded, analysis in dreams:
+        conn.execute('''
+            INSERT INTO dreams (user_id, title, content, date_recorded, emotions, themes, analysis)
+            VALUES (1, ?, ?, ?, ?, ?, ?)
+        ''', (title, content, date_recorded, json.dumps(analysis['emotions']),
+              json.dumps(analysis['themes']), json.dumps(analysis)))
+    conn.commit()
+    conn.close()
+
+def user_version(db):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def test_new_database_gets_every_migration(db):
+    assert user_version(db) == len(repository.MIGRATIONS)
+
+def test_init_db_is_idempotent(db, user_id):
+    dream_id = repository.add_dream(db, user_id, 'Flight', 'I flew.', make_analysis())
+    repository.init_db(db)
+    assert user_version(db) == len(repository.MIGRATIONS)
+    assert repository.get_dream(db, dream_id, user_id)['title'] == 'Flight'
+
+def test_upgrade_from_v0(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    sad = make_analysis(sentiment={'neg': 0.5, 'neu': 0.5, 'pos': 0.0, 'compound': -0.5},
+                        emotions={'fear': 2}, themes={'falling': 1})
+    make_v0_database(path, [
+        ('Flight', 'I flew over the water.', '2024-03-01 07:30:00', make_analysis()),
+        ('Fall', 'I fell and was afraid.', '2024-03-02 07:30:00', sad),
+    ])
+    
+    with repository.get_pool(path).connection() as db:
+        repository.init_db(db)
+        assert user_version(db) == len(repository.MIGRATIONS)
+        
+        # Analyses are packed and still read back whole
+        stored = [row[0] for row in db.execute('SELECT analysis FROM dreams ORDER BY id')]
+        assert all(isinstance(value, bytes) for value in stored)
+        dream = repository.get_dream(db, 2, 1)
+        assert dream['analysis']['emotions'] == {'fear': 2}
+        assert dream['analysis']['sentiment']['compound'] == -0.5
+        assert dream['status'] == 'done'
+        
+        # Backfilled listing, insights, search and dashboard counters
+        dreams, _ = repository.list_dream_summaries(db, 1)
+        assert [summary['title'] for summary in dreams] == ['Fall', 'Flight']
+        assert dreams[1]['themes'] == {'water': 1, 'flying': 1}
+        
+        insights = repository.get_insights(db, 1)
+        assert insights['total_dreams'] == 2
+        assert insights['emotion_counts'] == {'joy': 1, 'fear': 1}
+        assert insights['theme_counts'] == {'water': 1, 'flying': 1, 'falling': 1}
+        assert insights['sentiment_count'] == 2
+        
+        results, _ = repository.search_dreams(db, 1, 'afraid')
+        assert [result['title'] for result in results] == ['Fall']
+        
+        assert repository.list_dream_summaries(db, 1, theme='falling')[0][0]['title'] == 'Fall'
+        stats = repository.get_stats(db, 1, today=date(2024, 3, 2))
+        assert (stats['total'], stats['current_streak'], stats['longest_streak']) == (2, 2, 2)
@@ -0,0 +1,100 @@
+from datetime import date
+
+import repository
+from conftest import make_analysis
+
+SINCE = date(2024, 3, 1)
+UNTIL = date(2024, 3, 8)
+
+def add(db, user_id, day, compound=0.5, **changes):
+    sentiment = dict(make_analysis()['sentiment'], compound=compound)
+    return repository.add_dream(db, user_id, 'Dream', 'I dreamt.', make_analysis(sentiment=sentiment, **changes),
+                                date_recorded=f'2024-03-0{day} 07:30:00')
+
+def roll_up(db, batch_size=repository.ROLLUP_BATCH_SIZE):
+    counts = []
+    while True:
+        count = repository.rollup_dreams(db, batch_size)
+        if not count:
+            return counts
+        counts.append(count)
+
+def days(rollups):
+    return {day['date']: day['dreams'] for day in rollups['days']}
+
+def test_rollups_total_every_user(db, user_id):
+    other = repository.create_user(db, 'someone', 'x')
+    add(db, user_id, 1, 0.5, emotions={'joy': 2}, themes={'water': 1})
+    add(db, user_id, 1, -0.25, emotions={'fear': 1}, themes={})
+    add(db, other, 3, 0.25, emotions={'joy': 1}, themes={'water': 3})
+    
+    assert roll_up(db) == [3]
+    rollups = repository.get_rollups(db, SINCE, UNTIL)
+    assert rollups['dreams'] == 3
+    assert rollups['average_sentiment'] == round(0.5 / 3, 3)
+    assert days(rollups) == {'2024-03-01': 2, '2024-03-03': 1}
+    assert rollups['days'][0]['average_sentiment'] == 0.125
+    assert rollups['emotions'] == [{'emotion': 'joy', 'dreams': 2, 'mentions': 3},
+                                   {'emotion': 'fear', 'dreams': 1, 'mentions': 1}]
+    assert rollups['themes'] == [{'theme': 'water', 'dreams': 2, 'mentions': 4}]
+
+def test_high_water_mark_only_reads_new_dreams(db, user_id):
+    add(db, user_id, 1)
+    add(db, user_id, 2)
+    assert roll_up(db) == [2]
+    assert roll_up(db) == []
+    
+    last_id = add(db, user_id, 2)
+    assert roll_up(db) == [1]
+    rollups = repository.get_rollups(db, SINCE, UNTIL)
+    assert rollups['rolled_up_through'] == last_id
+    assert days(rollups) == {'2024-03-01': 1, '2024-03-02': 2}
+
+def test_batches_advance_the_mark(db, user_id):
+    for day in range(1, 6):
+        add(db, user_id, day)
+    assert roll_up(db, batch_size=2) == [2, 2, 1]
+    assert repository.get_rollups(db, SINCE, UNTIL)['dreams'] == 5
+
+def test_pending_dreams_hold_back_the_mark(db, user_id):
+    first = add(db, user_id, 1)
+    pending = repository.add_pending_dream(db, user_id, 'Pending', 'I dreamt.', date_recorded='2024-03-02 07:30:00')
+    add(db, user_id, 3)
+    
+    assert roll_up(db) == [1]
+    assert repository.get_rollups(db, SINCE, UNTIL)['rolled_up_through'] == first
+    
+    # Once analyzed, the pending dream and the ones after it are rolled up
+    job_id, dream_id, *_ = repository.claim_job(db, 'lease')
+    assert dream_id == pending
+    assert repository.complete_job(db, job_id, dream_id, user_id, make_analysis(), 'lease')
+    assert roll_up(db) == [2]
+    assert days(repository.get_rollups(db, SINCE, UNTIL)) == {'2024-03-01': 1, '2024-03-02': 1, '2024-03-03': 1}
+
+def test_failed_dreams_are_passed_over(db, user_id):
+    add(db, user_id, 1)
+    pending = repository.add_pending_dream(db, user_id, 'Pending', 'I dreamt.', date_recorded='2024-03-02 07:30:00')
+    job_id, dream_id, *_ = repository.claim_job(db, 'lease')
+    repository.fail_job(db, job_id, dream_id, 'boom', retry=False, lease='lease')
+    
+    assert roll_up(db) == [2]
+    rollups = repository.get_rollups(db, SINCE, UNTIL)
+    assert rollups['rolled_up_through'] == pending
+    assert days(rollups) == {'2024-03-01': 1}
+
+def test_range_excludes_until(db, user_id):
+    add(db, user_id, 1)
+    add(db, user_id, 7)
+    roll_up(db)
+    assert days(repository.get_rollups(db, SINCE, date(2024, 3, 7))) == {'2024-03-01': 1}
+
+def test_reset_rolls_up_from_the_start(db, user_id):
+    add(db, user_id, 1)
+    add(db, user_id, 2)
+    roll_up(db)
+    repository.reset_rollups(db)
+    
+    rollups = repository.get_rollups(db, SINCE, UNTIL)
+    assert (rollups['rolled_up_through'], rollups['dreams'], rollups['days']) == (0, 0, [])
+    assert roll_up(db) == [2]
+    assert repository.get_rollups(db, SINCE, UNTIL)['dreams'] == 2
@@ -0,0 +1,63 @@
+import pytest
+
+import repository
+from conftest import make_analysis
+
+@pytest.fixture
+def dreams(db, user_id):
+    contents = {
+        'Bone': "My dog's bone was buried under the old oak.",
+        'Bark': 'The dogs barked at a silent moon.',
+        'Code': 'I was writing snake_case names in a notebook.',
+        'Quote': 'She said "come home" and vanished.',
+        'Swim': "I can't swim, yet I floated over the lake.",
+        'Either': 'A cat or a mouse, I could not tell.'
+    }
+    ids = {title: repository.add_dream(db, user_id, title, content, make_analysis())
+           for title, content in contents.items()}
+    other = repository.create_user(db, 'someone', 'x')
+    repository.add_dream(db, other, 'Bone', "Another dog's bone.", make_analysis())
+    return ids
+
+def search(db, user_id, query):
+    results, _ = repository.search_dreams(db, user_id, query)
+    return sorted(result['title'] for result in results)
+
+@pytest.mark.parametrize('query, titles', [
+    ("dog's", ['Bone']),
+    ('dog’s bone', ['Bone']),
+    ('"dog\'s bone"', ['Bone']),
+    ("can't", ['Swim']),
+    ('dog*', ['Bark', 'Bone']),
+    ('snake_case', ['Code']),
+    ('"come home"', ['Quote']),
+    ('said "come', ['Quote']),
+    ('home" vanished', ['Quote']),
+    ('bone, oak!', ['Bone']),
+    ('bone !!!', ['Bone']),
+])
+def test_punctuation_in_queries(db, user_id, dreams, query, titles):
+    assert search(db, user_id, query) == titles
+
+@pytest.mark.parametrize('query, titles', [
+    ('cat OR dog', []),
+    ('cat OR mouse', ['Either']),
+    ('NOT dog', []),
+    ('title:bone', []),
+    ('owner:u1', []),
+    ('^bone', ['Bone']),
+    ('NEAR(dog bone)', []),
+    ('dog AND', []),
+])
+def test_operators_are_plain_words(db, user_id, dreams, query, titles):
+    assert search(db, user_id, query) == titles
+
+@pytest.mark.parametrize('query', ['', '   ', '!!!', '"" *', '*'])
+def test_queries_without_words_are_rejected(db, user_id, query):
+    with pytest.raises(ValueError):
+        repository.search_dreams(db, user_id, query)
+
+def test_snippets_are_escaped_and_highlighted(db, user_id):
+    repository.add_dream(db, user_id, 'Tags', 'A <script> tag floated by.', make_analysis())
+    [result], _ = repository.search_dreams(db, user_id, 'script')
+    assert result['snippet'] == 'A &lt;<mark>script</mark>&gt; tag floated by.'
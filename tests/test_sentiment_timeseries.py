@@ -0,0 +1,38 @@
+import numpy as np
+
+import repository
+import sentiment_timeseries
+from conftest import make_analysis
+
+DAY = sentiment_timeseries.DAY
+
+def add(db, user_id, date_recorded, compound):
+    sentiment = dict(make_analysis()['sentiment'], compound=compound)
+    return repository.add_dream(db, user_id, 'Dream', 'I dreamt.', make_analysis(sentiment=sentiment),
+                                date_recorded=date_recorded)
+
+def test_series_skips_unreadable_dates(db, user_id):
+    add(db, user_id, '2024-03-01 07:30:00', 0.5)
+    add(db, user_id, '2024-03-02 07:30:00', -0.5)
+    dream_id = add(db, user_id, '2024-03-03 07:30:00', 0.25)
+    with db:
+        db.execute("UPDATE dreams SET date_recorded = 'last tuesday' WHERE id = ?", (dream_id,))
+    
+    rows = repository.get_sentiment_series(db, user_id)
+    assert sorted(score for _, score in rows) == [-0.5, 0.5]
+    summary = sentiment_timeseries.summarize(rows)
+    assert len(summary['points']) == 2
+
+def test_load_sorts_by_time():
+    timestamps, scores = sentiment_timeseries.load([(3 * DAY, 0.3), (DAY, 0.1), (2 * DAY, 0.2)])
+    assert timestamps.tolist() == [DAY, 2 * DAY, 3 * DAY]
+    assert scores.tolist() == [0.1, 0.2, 0.3]
+
+def test_rolling_mean_covers_the_preceding_window():
+    timestamps = np.array([0, DAY, 2 * DAY, 10 * DAY], dtype=float)
+    scores = np.array([1.0, 0.0, 0.5, -1.0])
+    assert sentiment_timeseries.rolling_mean(timestamps, scores, window_days=7).tolist() == [1.0, 0.5, 0.5, -1.0]
+
+def test_slope_is_per_day():
+    timestamps = np.arange(5, dtype=float) * DAY
+    assert abs(sentiment_timeseries.slope(timestamps, timestamps / DAY * 0.1) - 0.1) < 1e-9
@@ -0,0 +1,56 @@
+from datetime import date
+
+import repository
+from conftest import make_analysis
+
+def add(db, user_id, day, compound=0.5, **changes):
+    sentiment = dict(make_analysis()['sentiment'], compound=compound)
+    return repository.add_dream(db, user_id, 'Dream', 'I dreamt.', make_analysis(sentiment=sentiment, **changes),
+                                date_recorded=f'2024-03-{day:02} 07:30:00')
+
+def test_empty_stats(db, user_id):
+    assert repository.get_stats(db, user_id) == {
+        'total': 0, 'this_week': 0, 'current_streak': 0, 'longest_streak': 0,
+        'top_emotion': None, 'top_theme': None, 'average_sentiment': None
+    }
+
+def test_stats(db, user_id):
+    # Friday 1st, Saturday 2nd, then Monday 4th to Wednesday 6th
+    add(db, user_id, 1, 0.5, emotions={'fear': 1}, themes={'falling': 1})
+    add(db, user_id, 2, -0.5, emotions={'fear': 2}, themes={'water': 1})
+    for day in (4, 5, 5, 6):
+        add(db, user_id, day, 0.25, emotions={'joy': 1}, themes={'water': 1})
+    
+    stats = repository.get_stats(db, user_id, today=date(2024, 3, 6))
+    assert stats == {
+        'total': 6, 'this_week': 4, 'current_streak': 3, 'longest_streak': 3,
+        'top_emotion': 'joy', 'top_theme': 'water', 'average_sentiment': round(1.0 / 6, 3)
+    }
+
+def test_streak_lasts_until_a_day_is_missed(db, user_id):
+    add(db, user_id, 1)
+    add(db, user_id, 2)
+    assert repository.get_stats(db, user_id, today=date(2024, 3, 3))['current_streak'] == 2
+    assert repository.get_stats(db, user_id, today=date(2024, 3, 4))['current_streak'] == 0
+    assert repository.get_stats(db, user_id, today=date(2024, 3, 4))['longest_streak'] == 2
+
+def test_week_count_resets_on_monday(db, user_id):
+    add(db, user_id, 2)
+    add(db, user_id, 3)
+    assert repository.get_stats(db, user_id, today=date(2024, 3, 3))['this_week'] == 2
+    assert repository.get_stats(db, user_id, today=date(2024, 3, 4))['this_week'] == 0
+
+def test_dreams_added_out_of_order(db, user_id):
+    for day in (5, 1, 3, 2, 4):
+        add(db, user_id, day)
+    stats = repository.get_stats(db, user_id, today=date(2024, 3, 5))
+    assert (stats['current_streak'], stats['longest_streak'], stats['this_week']) == (5, 5, 2)
+
+def test_stats_match_a_rebuild(db, user_id):
+    for day in (1, 2, 4, 5, 5, 9):
+        add(db, user_id, day)
+    today = date(2024, 3, 9)
+    before = repository.get_stats(db, user_id, today=today)
+    with db:
+        repository.rebuild_insights(db, user_id)
+    assert repository.get_stats(db, user_id, today=today) == before